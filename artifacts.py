@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from collections import OrderedDict
+
+ARTIFACT_DIR = ".cache/artifacts"
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+class ArtifactEvictedError(LookupError):
+    """The artifact was pushed out of the disk ring buffer by newer ones."""
+
+
+class ArtifactStore:
+    """Per-task store for screenshots and other binary artifacts, bounded in memory and on disk.
+
+    ``put()`` keeps the raw bytes once (identical content shares one entry)
+    and returns a key; callers hold the key and read the bytes back with
+    ``get()`` when they need them. Once the bytes in memory exceed
+    ``memory_cap``, the least recently used entries are written to a ring
+    buffer of ``ring_size`` files under ``directory``, where the oldest are
+    overwritten. The newest entry always stays in memory, so the bytes held
+    stay within ``memory_cap`` unless a single entry is larger.
+    """
+
+    def __init__(self, task_id="task", directory=ARTIFACT_DIR, memory_cap=8 * 1024 * 1024, ring_size=64):
+        # 同じ task_id のタスクが並行しても衝突しないよう、ディレクトリ名に乱数を付ける
+        name = re.sub(r"[^\w.-]", "_", str(task_id))
+        self.path = os.path.join(directory, f"{name}-{uuid.uuid4().hex[:8]}")
+        self.memory_cap = memory_cap
+        self.ring_size = ring_size
+        self._memory = OrderedDict()  # key -> bytes (古い順)
+        self._disk = {}  # key -> リングバッファのスロット番号
+        self._slots = [None] * ring_size
+        self._next_slot = 0
+        self._digests = {}  # 内容のハッシュ -> key
+        self._meta = {}  # key -> (digest, mime_type, size)
+        self._seq = 0
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.stats = {"puts": 0, "dedup_hits": 0, "spills": 0, "disk_reads": 0, "evictions": 0}
+
+    def put(self, data, mime_type="application/octet-stream"):
+        """Store ``data`` and return its key; identical content returns the existing key."""
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.stats["puts"] += 1
+        key = self._digests.get(digest)
+        if key is not None:
+            self.stats["dedup_hits"] += 1
+            if key in self._memory:
+                self._memory.move_to_end(key)
+            return key
+
+        self._seq += 1
+        key = f"{self._seq:06d}"
+        self._digests[digest] = key
+        self._meta[key] = (digest, mime_type, len(data))
+        self._memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.memory_cap and len(self._memory) > 1:
+            old_key, old_data = self._memory.popitem(last=False)
+            self.memory_bytes -= len(old_data)
+            self._spill(old_key, old_data)
+        # 退避後に測るので、1 件で上限を超える場合を除き memory_cap 以下になる
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+        return key
+
+    def _slot_path(self, key, slot):
+        return os.path.join(self.path, f"{slot:04d}{EXTENSIONS.get(self._meta[key][1], '.bin')}")
+
+    def _spill(self, key, data):
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self.ring_size
+        if self._slots[slot] is not None:
+            self._forget(self._slots[slot])
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._slot_path(key, slot), "wb") as f:
+            f.write(data)
+        self._slots[slot] = key
+        self._disk[key] = slot
+        self.stats["spills"] += 1
+
+    def _forget(self, key):
+        slot = self._disk.pop(key)
+        self._slots[slot] = None
+        try:
+            os.remove(self._slot_path(key, slot))
+        except OSError:
+            pass
+        digest = self._meta.pop(key)[0]
+        self._digests.pop(digest, None)
+        self.stats["evictions"] += 1
+
+    def get(self, key):
+        """The bytes stored under ``key``; raises ArtifactEvictedError once they left the ring buffer."""
+        data = self._memory.get(key)
+        if data is not None:
+            return data
+        if key not in self._disk:
+            raise ArtifactEvictedError(f"Artifact {key} is no longer stored")
+        self.stats["disk_reads"] += 1
+        with open(self._slot_path(key, self._disk[key]), "rb") as f:
+            return f.read()
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._disk
+
+    def size(self, key):
+        return self._meta[key][2]
+
+    def close(self):
+        """Drop every artifact and remove the task's ring buffer directory."""
+        self._memory.clear()
+        self._disk.clear()
+        self._slots = [None] * self.ring_size
+        self._digests.clear()
+        self._meta.clear()
+        self.memory_bytes = 0
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def get_summary(self):
+        return {
+            **self.stats,
+            "memory_cap": self.memory_cap,
+            "memory_bytes": self.memory_bytes,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "in_memory": len(self._memory),
+            "on_disk": len(self._disk),
+        }
+
+
+def print_artifact_summary(summary):
+    print(f"アーティファクト: 保存 {summary['puts']}件 (重複 {summary['dedup_hits']}件), "
+          f"メモリ最大 {summary['peak_memory_bytes'] / 1024 / 1024:.1f}MB / 上限 {summary['memory_cap'] / 1024 / 1024:.1f}MB, "
+          f"ディスクへ退避 {summary['spills']}件 (読み戻し {summary['disk_reads']}件, 破棄 {summary['evictions']}件)")
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import time
+import traceback
+
+from playwright.async_api import async_playwright
+
+from browser_pool import BrowserPool
+from cassette import MODES as CASSETTE_MODES, Cassette, print_cassette_summary
+from exe_computer_use import execute_browser_task
+from ratelimit import get_rate_limiter, print_rate_limit_summary
+from trace_cache import TraceCache
+
+
+def load_tasks(path):
+    """Read tasks from a JSONL file. Each line needs "task" and may set "id", "initial_url" and "typed_text"
+    (the text for the recorded type steps when a cached trace is replayed)."""
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            task.setdefault("id", str(line_number))
+            tasks.append(task)
+    return tasks
+
+
+class ResultWriter:
+    """Append one JSON line per finished task, flushing immediately."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+async def run_task(task, pool, writer, retries, trace_cache=None, trace_file=None, cassette=None):
+    """Run a single task in its own context, retrying on browser or context crashes."""
+    for attempt in range(retries + 1):
+        start_time = time.time()
+        disconnects = pool.disconnects
+        try:
+            result = await execute_browser_task(
+                task["task"], initial_url=task.get("initial_url") or pool.initial_url, pool=pool, trace_cache=trace_cache,
+                trace_file=trace_file, task_id=task["id"], cassette=cassette, typed_text=task.get("typed_text")
+            )
+            record = {
+                "id": task["id"],
+                "task": task["task"],
+                "status": "error" if result["error"] else "ok",
+                "attempts": attempt + 1,
+                **result,
+            }
+            # この試行の間にブラウザが落ちた場合のみ再実行する (再起動済みでも切断回数で判定できる)
+            if not result["error"] or pool.disconnects == disconnects:
+                break
+        except Exception as e:
+            traceback.print_exc()
+            record = {
+                "id": task["id"],
+                "task": task["task"],
+                "status": "error",
+                "attempts": attempt + 1,
+                "error": f"{type(e).__name__}: {e}",
+                "execution_time": time.time() - start_time,
+            }
+    writer.write(record)
+    return record
+
+
+async def run_batch(tasks, output_path, concurrency=4, retries=1, warm_contexts=None, trace_cache=None, trace_file=None,
+                    cassette=None):
+    """Run tasks concurrently on one shared browser and write results as JSONL.
+
+    Contexts come from a BrowserPool holding ``warm_contexts`` (default:
+    ``concurrency``) pre-navigated contexts that are recycled between tasks.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = ResultWriter(output_path)
+    start_time = time.time()
+
+    async with async_playwright() as playwright:
+        pool = BrowserPool(playwright, size=concurrency if warm_contexts is None else warm_contexts)
+
+        async def bounded(task):
+            async with semaphore:
+                return await run_task(task, pool, writer, retries, trace_cache, trace_file, cassette)
+
+        try:
+            await pool.start()
+            records = await asyncio.gather(*(bounded(task) for task in tasks))
+        finally:
+            await pool.close()
+            writer.close()
+
+    elapsed_time = time.time() - start_time
+    succeeded = sum(1 for record in records if record["status"] == "ok")
+    print("\n" + "=" * 50)
+    print("=== バッチ実行結果 ===")
+    print(f"タスク数: {len(records)} (成功 {succeeded}, 失敗 {len(records) - succeeded})")
+    print(f"並列数: {concurrency}, ブラウザ再起動: {pool.relaunches}回")
+    print(f"処理時間: {elapsed_time:.2f}秒")
+    pool_summary = pool.get_summary()
+    print(f"コンテキストプール: ヒット率 {pool_summary['hit_rate']:.0%} ({pool_summary['hits']}/{pool_summary['leases']}), "
+          f"平均待ち {pool_summary['avg_lease_wait_ms']:.0f}ms, 平均リサイクル {pool_summary['avg_recycle_ms']:.0f}ms, "
+          f"退避 {pool_summary['evictions']}回")
+    if trace_cache:
+        trace_summary = trace_cache.get_summary()
+        print(f"操作トレース: ヒット率 {trace_summary['hit_rate']:.0%}, 再生ステップ {trace_summary['replayed_steps']}, "
+              f"分岐 {trace_summary['divergences']}回")
+    if cassette:
+        print_cassette_summary(cassette.get_summary())
+    print_rate_limit_summary(get_rate_limiter().get_summary())
+    print("=" * 50)
+    return records
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run computer-use tasks from a JSONL file.")
+    parser.add_argument("tasks", help="JSONL file with one task per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=1, help="Retries per task after a crash")
+    parser.add_argument("--warm", type=int, default=None, help="Warm contexts kept in the pool (default: concurrency)")
+    parser.add_argument("--trace-cache", default=None, help="Directory of recorded action traces to replay")
+    parser.add_argument("--trace-file", default=None, help="JSONL file to append per-step timing spans to")
+    parser.add_argument("--cassette", default=None, help="JSONL file to record model responses to or replay them from")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="auto")
+    args = parser.parse_args(argv)
+
+    trace_cache = TraceCache(args.trace_cache) if args.trace_cache else None
+    cassette = Cassette(args.cassette, args.cassette_mode) if args.cassette else None
+    await run_batch(load_tasks(args.tasks), args.output, args.concurrency, args.retries, args.warm, trace_cache, args.trace_file,
+                    cassette)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
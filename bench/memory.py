@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tracemalloc
+
+from bench.run import run_task
+from bench.stub_server import StubModelServer
+
+STEPS = 100  # exe_computer_use.ITERATIONS と同じ (最後の 1 回は回答)
+MB = 1024 * 1024
+
+
+def scripted_task(steps=STEPS):
+    """A long computer-use task that scrolls the infinite-scroll fixture up and down ``steps - 1`` times."""
+    actions = []
+    for step in range(steps - 1):
+        # 10 ステップごとに向きを変えて、変化のある画面が続くようにする
+        scroll_y = 400 if (step // 10) % 2 == 0 else -400
+        actions.append({"action": {"type": "scroll", "x": 720, "y": 540, "scroll_x": 0, "scroll_y": scroll_y}})
+    return {
+        "id": "memory",
+        "fixture": "infinite_scroll.html",
+        "task": "[bench:memory] {base}/infinite_scroll.html を上下にスクロールして、最後に見つけた項目を報告してください。",
+        "computer_use": actions + [{"message": "スクロールを終えました。"}],
+    }
+
+
+async def measure(stub, task, memory_cap):
+    """Peak Python memory of one scripted run with the given per-task artifact memory cap."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        row = await run_task(stub, "computer_use", f"computer_use[cap={memory_cap}]", task,
+                             engine_kwargs={"artifact_memory_cap": memory_cap})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {**row, "memory_cap": memory_cap, "peak_bytes": peak}
+
+
+async def run_memory_benchmark(memory_caps, steps=STEPS):
+    task = scripted_task(steps)
+    stub = StubModelServer([task]).start()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = stub.base_url
+    os.environ["AZURE_OPENAI_API_KEY"] = "bench"
+    import exe_computer_use  # 読み込み時の確保をピークに含めない
+    exe_computer_use.HEADLESS = True
+    try:
+        return [await measure(stub, task, memory_cap) for memory_cap in memory_caps]
+    finally:
+        stub.stop()
+
+
+def print_table(rows):
+    print("\n" + "=" * 84)
+    print(f"{'memory_cap':<14}{'ok':<5}{'calls':>7}{'peak[MB]':>11}{'store[MB]':>11}{'spills':>8}{'dedup':>7}{'wall[s]':>9}")
+    print("-" * 84)
+    for row in rows:
+        artifacts = row.get("artifacts") or {}
+        cap = "inline" if row["memory_cap"] is None else f"{row['memory_cap'] / MB:.0f}MB"
+        store = f"{artifacts['peak_memory_bytes'] / MB:.1f}" if artifacts else "-"
+        print(f"{cap:<14}{'o' if row['ok'] else 'x':<5}{row['model_calls']:>7}{row['peak_bytes'] / MB:>11.1f}{store:>11}"
+              f"{artifacts.get('spills', '-'):>8}{artifacts.get('dedup_hits', '-'):>7}{row['wall_s']:>9.1f}")
+    print("=" * 84)
+    print("peak[MB] は実行中の Python のメモリ確保量の最大値 (tracemalloc) です。")
+    print("store[MB] はアーティファクトストアがメモリに持ったフレームの最大量、inline はストアを使わない場合です。")
+
+
+def over_cap(rows):
+    """Rows whose artifact store held more frame bytes in memory than its cap."""
+    return [row for row in rows
+            if row.get("artifacts") and row["artifacts"]["peak_memory_bytes"] > row["memory_cap"]]
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory of a long scripted computer-use run per artifact memory cap.")
+    parser.add_argument("--memory-caps", nargs="+", default=["inline", "1", "8"],
+                        help="Per-task memory caps in MB ('inline' runs without an artifact store)")
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("-o", "--output", default=None, help="Write one JSON line per memory cap")
+    args = parser.parse_args(argv)
+
+    memory_caps = [None if cap == "inline" else int(float(cap) * MB) for cap in args.memory_caps]
+    rows = await run_memory_benchmark(memory_caps, args.steps)
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    failed = over_cap(rows)
+    for row in failed:
+        print(f"メモリ上限を超えました: 上限 {row['memory_cap'] / MB:.1f}MB, "
+              f"最大 {row['artifacts']['peak_memory_bytes'] / MB:.1f}MB", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+from bench.stub_server import StubModelServer
+from frames import FRAME_SOURCES
+from ratelimit import get_rate_limiter, print_rate_limit_summary
+
+TASKS_PATH = Path(__file__).parent / "tasks.json"
+ENGINES = ("computer_use", "browser_use", "playwright_mcp")
+
+
+def load_tasks(path=TASKS_PATH, task_ids=None):
+    with open(path, encoding="utf-8") as f:
+        tasks = json.load(f)
+    if task_ids:
+        tasks = [task for task in tasks if task["id"] in task_ids]
+    return tasks
+
+
+async def run_engine(engine, task_description, initial_url, **kwargs):
+    """Run one task on one engine. Engines are imported here, after the stub endpoint is configured."""
+    if engine == "computer_use":
+        import exe_computer_use
+        exe_computer_use.HEADLESS = True
+        return await exe_computer_use.execute_browser_task(task_description, initial_url=initial_url, **kwargs)
+    if engine == "browser_use":
+        import exe_browser_use
+        return await exe_browser_use.execute_browser_task(task_description, **kwargs)
+    if engine == "playwright_mcp":
+        import exe_playwright_mcp
+        return await exe_playwright_mcp.execute_browser_task(task_description, **kwargs)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def engine_variants(engine, frame_sources, roi=False, mcp_pool=None, fast_model=None):
+    """(label, kwargs) pairs to run for an engine.
+
+    computer_use runs once per frame source, and with ``roi`` also once more
+    per source in region-of-interest mode, so the modes can be compared.
+    playwright_mcp also runs with sessions leased from ``mcp_pool`` if given.
+    With ``fast_model`` every engine also runs once with model tiering.
+    """
+    tiered = [(f"{engine}[tiered]", {"fast_model": fast_model})] if fast_model else []
+    if engine == "playwright_mcp" and mcp_pool is not None:
+        return [(engine, {}), (f"{engine}[pool]", {"pool": mcp_pool})] + tiered
+    if engine != "computer_use":
+        return [(engine, {})] + tiered
+    variants = []
+    for source in frame_sources:
+        for roi_mode in ((False, True) if roi else (False,)):
+            tags = ([source] if len(frame_sources) > 1 else []) + (["roi"] if roi_mode else [])
+            label = f"{engine}[{','.join(tags)}]" if tags else engine
+            variants.append((label, {"frame_source": source, "roi": roi_mode}))
+    return variants + tiered
+
+
+async def run_task(stub, engine, label, task, trace_file=None, engine_kwargs=None):
+    """Run one task on one engine and return its benchmark row."""
+    stub.reset(task["id"])
+    task_description = task["task"].replace("{base}", stub.fixtures_url)
+    initial_url = f"{stub.fixtures_url}/{task['fixture']}"
+
+    start = time.perf_counter()
+    try:
+        result = await run_engine(
+            engine, task_description, initial_url, trace_file=trace_file, task_id=task["id"], **(engine_kwargs or {})
+        )
+        error = result.get("error")
+    except Exception as e:
+        traceback.print_exc()
+        result, error = {}, f"{type(e).__name__}: {e}"
+    wall_s = time.perf_counter() - start
+
+    stats = stub.get_stats(task["id"])
+    model_s = stats["model_ms"] / 1000
+    screenshot_stats = result.get("screenshot_stats") or {}
+    return {
+        "engine": label,
+        "task": task["id"],
+        "ok": error is None and (not task.get("expect_submission") or stub.submitted(task["id"])),
+        "wall_s": wall_s,
+        "model_calls": stats["model_calls"],
+        "bytes_uploaded": stats["bytes_uploaded"],
+        "model_s": model_s,
+        "browser_s": wall_s - model_s,
+        "capture_ms": screenshot_stats.get("avg_encode_ms"),
+        "capture_sources": screenshot_stats.get("sources"),
+        "model_p50_ms": (result.get("spans") or {}).get("model_request", {}).get("p50_ms"),
+        "token_usage": result.get("token_usage"),
+        "tiering": result.get("tiering"),
+        "artifacts": result.get("artifacts"),
+        "roi": screenshot_stats.get("roi"),
+        "error": error,
+    }
+
+
+async def run_benchmark(engines, tasks, latency_ms=0, trace_file=None, frame_sources=("screenshot",), roi=False,
+                        mcp_pool=False, fast_model=None, fast_latency_ms=None, throttle_rpm=None):
+    """Run every task on every engine against the stand-in model server and fixture sites."""
+    model_latency_ms = {fast_model: fast_latency_ms} if fast_model and fast_latency_ms is not None else None
+    stub = StubModelServer(tasks, latency_ms=latency_ms, model_latency_ms=model_latency_ms,
+                           throttle_rpm=throttle_rpm).start()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = stub.base_url
+    os.environ["AZURE_OPENAI_API_KEY"] = "bench"
+    rows = []
+    session_pool = None
+    try:
+        if mcp_pool and "playwright_mcp" in engines:
+            from mcp_pool import McpSessionPool
+            session_pool = McpSessionPool()
+            await session_pool.start()
+        for engine in engines:
+            for label, engine_kwargs in engine_variants(engine, frame_sources, roi, session_pool, fast_model):
+                for task in tasks:
+                    if engine not in task:
+                        continue
+                    rows.append(await run_task(stub, engine, label, task, trace_file, engine_kwargs))
+    finally:
+        if session_pool is not None:
+            await session_pool.close()
+            summary = session_pool.get_summary()
+            print(f"MCPセッションプール: 起動 {summary['sessions_started']}回 (平均 {summary['avg_startup_ms']:.0f}ms), "
+                  f"ヒット {summary['hits']}/{summary['leases']}, 削減した起動時間 {summary['startup_saved_ms'] / 1000:.1f}秒, "
+                  f"平均リセット {summary['avg_reset_ms']:.0f}ms")
+        stub.stop()
+        if throttle_rpm:
+            print(f"スタブサーバー: 429 を返した回数 {stub.throttled}回")
+            print_rate_limit_summary(get_rate_limiter().get_summary())
+    return rows
+
+
+def print_table(rows):
+    print("\n" + "=" * 164)
+    print(f"{'engine':<30}{'task':<18}{'ok':<5}{'wall[s]':>9}{'calls':>7}{'upload[KB]':>12}{'model[s]':>10}{'browser[s]':>12}"
+          f"{'p50[ms]':>12}{'capture[ms]':>13}{'img_tokens':>12}{'vs_full':>10}")
+    print("-" * 164)
+    for row in rows:
+        capture = f"{row['capture_ms']:.1f}" if row["capture_ms"] is not None else "-"
+        model_p50 = f"{row['model_p50_ms']:.0f}" if row["model_p50_ms"] is not None else "-"
+        image_tokens = (row["token_usage"] or {}).get("image_input_tokens", "-")
+        vs_full = f"{row['roi']['token_ratio']:.2f}" if row.get("roi") else "-"
+        print(f"{row['engine']:<30}{row['task']:<18}{'o' if row['ok'] else 'x':<5}{row['wall_s']:>9.2f}"
+              f"{row['model_calls']:>7}{row['bytes_uploaded'] / 1024:>12.1f}{row['model_s']:>10.2f}{row['browser_s']:>12.2f}"
+              f"{model_p50:>12}{capture:>13}{image_tokens:>12}{vs_full:>10}")
+    print("=" * 164)
+    print("browser[s] はモデル応答以外の時間 (ブラウザ操作・待機・エンジン処理) です。")
+    print("p50[ms] はモデル呼び出し1回あたりの応答時間の中央値です。")
+    print("capture[ms] は computer_use の1ステップあたりの平均フレーム取得時間です。")
+    print("img_tokens は送信した画像のトークン数の見積もり (タイル計算) です。")
+    print("vs_full は ROI モードの全体画像と切り出しの画像トークンを、原寸の全体画像を送った場合と比べた比です (1 未満なら削減)。")
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the three browsing engines.")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--tasks", nargs="+", default=None, help="Task ids from bench/tasks.json (default: all)")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Simulated model latency per call")
+    parser.add_argument("-o", "--output", default=None, help="Write one JSON line per engine/task")
+    parser.add_argument("--trace-file", default=None, help="JSONL file to append per-step timing spans to")
+    parser.add_argument("--frame-sources", nargs="+", choices=FRAME_SOURCES, default=["screenshot"],
+                        help="Frame sources to compare for computer_use (e.g. screenshot screencast)")
+    parser.add_argument("--roi", action="store_true",
+                        help="Also run computer_use in region-of-interest mode to compare image tokens")
+    parser.add_argument("--mcp-pool", action="store_true",
+                        help="Also run playwright_mcp with pooled, pre-initialized MCP sessions")
+    parser.add_argument("--fast-model", default=None,
+                        help="Also run every engine with model tiering, using this deployment for routine steps")
+    parser.add_argument("--fast-latency-ms", type=int, default=None,
+                        help="Simulated latency per call of the fast model (default: --latency-ms)")
+    parser.add_argument("--throttle-rpm", type=int, default=None,
+                        help="Make the stand-in server return 429s beyond this many model calls per minute")
+    args = parser.parse_args(argv)
+
+    rows = await run_benchmark(args.engines, load_tasks(task_ids=args.tasks), args.latency_ms, args.trace_file,
+                               args.frame_sources, args.roi, args.mcp_pool, args.fast_model, args.fast_latency_ms,
+                               args.throttle_rpm)
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
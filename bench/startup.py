@@ -0,0 +1,82 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from main import COMMAND_MODULES
+
+ROOT = Path(__file__).parent.parent
+# 1 プロセスで CLI を組み立て、サブコマンドのモジュールを読み込んで終わる (タスクは実行しない)
+PROBE = """
+import json, time
+start = time.perf_counter()
+import main
+main.build_parser()
+cli_ms = (time.perf_counter() - start) * 1000
+try:
+    _, import_ms = main.load_command({command!r})
+    error = None
+except Exception as e:
+    import_ms, error = None, f"{{type(e).__name__}}: {{e}}"
+print(json.dumps({{"cli_ms": cli_ms, "import_ms": import_ms, "error": error}}))
+"""
+
+
+def measure(command, runs=5):
+    """Median wall, CLI and import time of fresh processes that load ``command``."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", PROBE.format(command=command)], cwd=ROOT,
+                                   capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - start) * 1000
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append({**probe, "wall_ms": wall_ms})
+        if probe["error"]:
+            break
+    error = samples[-1]["error"]
+    return {
+        "command": command,
+        "module": COMMAND_MODULES[command],
+        "runs": len(samples),
+        "wall_ms": statistics.median(sample["wall_ms"] for sample in samples),
+        "cli_ms": statistics.median(sample["cli_ms"] for sample in samples),
+        "import_ms": None if error else statistics.median(sample["import_ms"] for sample in samples),
+        "error": error,
+    }
+
+
+def print_table(rows):
+    print("\n" + "=" * 78)
+    print(f"{'command':<16}{'module':<22}{'wall[ms]':>10}{'cli[ms]':>10}{'import[ms]':>12}")
+    print("-" * 78)
+    for row in rows:
+        import_ms = f"{row['import_ms']:.0f}" if row["import_ms"] is not None else "-"
+        print(f"{row['command']:<16}{row['module']:<22}{row['wall_ms']:>10.0f}{row['cli_ms']:>10.1f}{import_ms:>12}")
+        if row["error"]:
+            print(f"  ({row['error']})")
+    print("=" * 78)
+    print("wall[ms] はインタプリタの起動を含むプロセス全体の時間です。")
+    print("cli[ms] は main の読み込みと引数パーサーの構築、import[ms] はサブコマンドのモジュールの読み込み時間です。")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure startup time of each browsing-agents subcommand.")
+    parser.add_argument("--commands", nargs="+", choices=list(COMMAND_MODULES), default=list(COMMAND_MODULES))
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per subcommand (the median is reported)")
+    parser.add_argument("-o", "--output", default=None, help="Write one JSON line per subcommand")
+    args = parser.parse_args(argv)
+
+    rows = [measure(command, args.runs) for command in args.commands]
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import json
+import math
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+TASK_MARKER = re.compile(r"\[bench:(\w+)\]")
+# browser-use の DOM 表現 ([12]<button ...>) と Playwright MCP のスナップショット ([ref=e12])
+INDEX_PATTERN = re.compile(r"\[(\d+)\]<")
+REF_PATTERN = re.compile(r"\[ref=(\w+)\]")
+THROTTLE_WINDOW_S = 60.0
+CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".css": "text/css", ".js": "application/javascript"}
+
+
+@dataclass
+class TaskStats:
+    """What the stand-in model saw for one task run."""
+    model_calls: int = 0
+    bytes_uploaded: int = 0
+    model_ms: float = 0.0
+
+
+def _strings(value):
+    """Yield every string inside a decoded JSON request, in document order."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def _find_in_page_state(body, text, pattern):
+    """Find the element id for ``text`` in the most recent page state sent to the model."""
+    for value in reversed(list(_strings(body))):
+        for line in reversed(value.splitlines()):
+            if text in line:
+                match = pattern.search(line)
+                if match:
+                    return match.group(1)
+    raise LookupError(f"Element not found in page state: {text}")
+
+
+class StubModelServer:
+    """Local stand-in for the Azure OpenAI endpoints that replays scripted responses.
+
+    It also serves the fixture sites under ``/fixtures/`` so a whole benchmark
+    runs offline. Requests are matched to a task by the ``[bench:<id>]``
+    marker in the task text (or the previous response id), and each call
+    advances that task's script by one step. With ``throttle_rpm`` model
+    calls beyond that many per minute get a 429 with Retry-After, like an
+    Azure deployment over its quota.
+    """
+
+    def __init__(self, tasks, host="127.0.0.1", port=0, latency_ms=0, model_latency_ms=None, throttle_rpm=None):
+        self.tasks = {task["id"]: task for task in tasks}
+        self.latency_ms = latency_ms
+        self.model_latency_ms = model_latency_ms or {}  # デプロイ名ごとの遅延 (小さいモデルの速さを模擬する)
+        self.throttle_rpm = throttle_rpm
+        self.throttled = 0
+        self._accepted = deque()  # 受け付けたモデル呼び出しの時刻
+        self.stats = {}
+        self.submissions = []
+        self._steps = {}
+        self._response_tasks = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def fixtures_url(self):
+        return f"{self.base_url}/fixtures"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self, task_id):
+        """Rewind a task's script and clear its statistics before a run."""
+        with self._lock:
+            self._steps[task_id] = 0
+            self.stats[task_id] = TaskStats()
+            self.submissions = [s for s in self.submissions if s["task"] != task_id]
+
+    def get_stats(self, task_id):
+        return asdict(self.stats.get(task_id, TaskStats()))
+
+    def submitted(self, task_id):
+        return any(s["task"] == task_id for s in self.submissions)
+
+    def _next_step(self, task_id):
+        with self._lock:
+            step = self._steps.get(task_id, 0)
+            self._steps[task_id] = step + 1
+            return step
+
+    def _throttle_wait(self):
+        """Seconds until the next model call is accepted under ``throttle_rpm``, or None to accept it now."""
+        if not self.throttle_rpm:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= THROTTLE_WINDOW_S:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.throttle_rpm:
+                self.throttled += 1
+                return self._accepted[0] + THROTTLE_WINDOW_S - now
+            self._accepted.append(now)
+            return None
+
+    def _record(self, task_id, body_size, elapsed_ms):
+        with self._lock:
+            stats = self.stats.setdefault(task_id, TaskStats())
+            stats.model_calls += 1
+            stats.bytes_uploaded += body_size
+            stats.model_ms += elapsed_ms
+
+    def _task_id(self, body):
+        previous = body.get("previous_response_id")
+        if previous in self._response_tasks:
+            return self._response_tasks[previous]
+        for value in _strings(body):
+            match = TASK_MARKER.search(value)
+            if match and match.group(1) in self.tasks:
+                return match.group(1)
+        raise LookupError("No [bench:<id>] marker in request")
+
+    def _resolve(self, value, body):
+        """Substitute {base} and element lookups ({"index_of"/"ref_of": text}) in a script step."""
+        if isinstance(value, str):
+            return value.replace("{base}", self.fixtures_url)
+        if isinstance(value, list):
+            return [self._resolve(item, body) for item in value]
+        if isinstance(value, dict):
+            if "index_of" in value:
+                return int(_find_in_page_state(body, value["index_of"], INDEX_PATTERN))
+            if "ref_of" in value:
+                return _find_in_page_state(body, value["ref_of"], REF_PATTERN)
+            return {key: self._resolve(item, body) for key, item in value.items()}
+        return value
+
+    def _script_step(self, task_id, engine, default):
+        script = self.tasks[task_id].get(engine, [])
+        step = self._next_step(task_id)
+        return step, script[step] if step < len(script) else default
+
+    def _usage(self, body_size, responses_api):
+        prompt_tokens = body_size // 4
+        if responses_api:
+            return {
+                "input_tokens": prompt_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": 20,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": prompt_tokens + 20,
+            }
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20}
+
+    def respond_computer_use(self, body, body_size):
+        task_id = self._task_id(body)
+        step, entry = self._script_step(task_id, "computer_use", {"message": "完了しました。"})
+        response_id = f"resp_{task_id}_{step}_{time.time_ns()}"
+        if "action" in entry or "actions" in entry:
+            # 1 ステップで複数の computer_call を返すこともできる ({"actions": [...]})
+            tool = next((t for t in body.get("tools", []) if t.get("type") == "computer_use_preview"), {})
+            scale = tool.get("display_width", 1440) / 1440
+            output = []
+            for index, scripted in enumerate(entry.get("actions") or [entry["action"]]):
+                # スクリプトの座標はビューポート基準なので、縮小フレームの座標系に合わせる
+                action = dict(scripted)
+                for key in ("x", "y"):
+                    if key in action:
+                        action[key] = round(action[key] * scale)
+                output.append({
+                    "type": "computer_call",
+                    "id": f"cu_{step}_{index}",
+                    "call_id": f"call_{task_id}_{step}_{index}",
+                    "action": action,
+                    "pending_safety_checks": [],
+                    "status": "completed",
+                })
+        else:
+            output = [{
+                "type": "message",
+                "id": f"msg_{step}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": entry["message"], "annotations": []}],
+            }]
+        self._response_tasks[response_id] = task_id
+        return task_id, {
+            "id": response_id,
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "computer-use-preview"),
+            "status": "completed",
+            "output": output,
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": body.get("tools", []),
+            "usage": self._usage(body_size, responses_api=True),
+        }
+
+    def respond_chat(self, body, body_size):
+        task_id = self._task_id(body)
+        tool_names = [t.get("function", {}).get("name", "") for t in body.get("tools", [])]
+        engine = "playwright_mcp" if any(name.startswith("browser_") for name in tool_names) else "browser_use"
+        default = {"message": "完了しました。 TERMINATE"} if engine == "playwright_mcp" else {
+            "action": [{"done": {"text": "完了しました。", "success": True}}]
+        }
+        step, entry = self._script_step(task_id, engine, default)
+
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        if engine == "browser_use":
+            message["content"] = json.dumps({
+                "thinking": "",
+                "evaluation_previous_goal": "",
+                "memory": "",
+                "next_goal": "",
+                "action": self._resolve(entry["action"], body),
+            }, ensure_ascii=False)
+        elif "tool" in entry:
+            message["tool_calls"] = [{
+                "id": f"call_{task_id}_{step}",
+                "type": "function",
+                "function": {
+                    "name": entry["tool"],
+                    "arguments": json.dumps(self._resolve(entry["arguments"], body), ensure_ascii=False),
+                },
+            }]
+            finish_reason = "tool_calls"
+        else:
+            message["content"] = entry["message"]
+
+        return task_id, {
+            "id": f"chatcmpl-{task_id}-{step}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4.1"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": self._usage(body_size, responses_api=False),
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if not path.startswith("/fixtures/"):
+            self._send(404, {"error": "not found"})
+            return
+        file_path = (FIXTURES_DIR / path[len("/fixtures/"):]).resolve()
+        if FIXTURES_DIR.resolve() not in file_path.parents or not file_path.is_file():
+            self._send(404, b"not found", "text/plain")
+            return
+        self._send(200, file_path.read_bytes(), CONTENT_TYPES.get(file_path.suffix, "application/octet-stream"))
+
+    def do_POST(self):
+        stub = self.server.stub
+        url = urlsplit(self.path)
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if url.path == "/fixtures/submit":
+            task_id = parse_qs(url.query).get("task", [""])[0]
+            with stub._lock:
+                stub.submissions.append({"task": task_id, "form": parse_qs(raw.decode("utf-8"))})
+            self._send(200, "<h1>送信が完了しました</h1>".encode("utf-8"), CONTENT_TYPES[".html"])
+            return
+
+        wait_s = stub._throttle_wait()
+        if wait_s is not None:
+            # Azure と同じく秒 (切り上げ) とミリ秒の両方で待ち時間を返す
+            self._send(429, {"error": {"code": "429", "message": "Rate limit exceeded. Try again later."}},
+                       headers={"Retry-After": str(math.ceil(wait_s)), "retry-after-ms": str(int(wait_s * 1000))})
+            return
+
+        start = time.perf_counter()
+        try:
+            body = json.loads(raw or b"{}")
+            if url.path.endswith("/responses"):
+                task_id, response = stub.respond_computer_use(body, len(raw))
+            elif url.path.endswith("/chat/completions"):
+                task_id, response = stub.respond_chat(body, len(raw))
+            else:
+                self._send(404, {"error": {"message": f"Unknown endpoint {url.path}"}})
+                return
+        except (LookupError, ValueError) as e:
+            self._send(400, {"error": {"message": str(e)}})
+            return
+        # Azure のデプロイ URL (/openai/deployments/<name>/...) ではモデル名がパスに入る
+        parts = url.path.split("/")
+        model = parts[parts.index("deployments") + 1] if "deployments" in parts else body.get("model")
+        latency_ms = stub.model_latency_ms.get(model, stub.latency_ms)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        stub._record(task_id, len(raw), (time.perf_counter() - start) * 1000)
+        self._send(200, response)
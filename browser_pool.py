@@ -0,0 +1,206 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from exe_computer_use import launch_browser, new_task_context
+
+
+@dataclass
+class PooledContext:
+    """A warm browser context with one page, optionally already at ``initial_url``."""
+    context: object
+    page: object
+    initial_url: str = None
+    created_at: float = field(default_factory=time.time)
+    uses: int = 0
+    origins: set = field(default_factory=set)
+
+
+class BrowserPool:
+    """Keep a browser and pre-created, pre-navigated contexts warm for fast task startup.
+
+    Contexts are leased to a task and recycled afterwards: extra tabs are
+    closed, cookies, permissions and storage of visited origins are cleared
+    and the page is navigated back to ``initial_url``. Contexts are evicted
+    after ``max_uses`` leases or ``max_age`` seconds. If the browser crashes
+    it is relaunched on the next lease; ``disconnects`` counts the crashes so
+    callers can tell whether one happened while their task ran.
+    """
+
+    def __init__(self, playwright, size=2, initial_url="https://www.bing.com", max_uses=20, max_age=600):
+        self.playwright = playwright
+        self.size = size
+        self.initial_url = initial_url
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.browser = None
+        self._idle = []
+        self._lock = asyncio.Lock()
+        self._background = set()
+        self.relaunches = 0
+        self.disconnects = 0
+        self._closing = False
+        self.leases = 0
+        self.hits = 0
+        self.evictions = 0
+        self.total_wait_ms = 0.0
+        self.recycles = 0
+        self.total_recycle_ms = 0.0
+
+    async def _get_browser(self):
+        async with self._lock:
+            if self.browser is None or not self.browser.is_connected():
+                if self.browser is not None:
+                    print("ブラウザが切断されたため再起動します。")
+                    self.relaunches += 1
+                    self._idle.clear()
+                self.browser = await launch_browser(self.playwright)
+                self.browser.on("disconnected", self._on_disconnected)
+            return self.browser
+
+    def _on_disconnected(self, browser):
+        if not self._closing:
+            self.disconnects += 1
+
+    async def _create(self, initial_url):
+        browser = await self._get_browser()
+        context = await new_task_context(browser)
+        entry = PooledContext(context=context, page=await context.new_page())
+        context.on("request", lambda request: self._record_origin(entry, request))
+        if initial_url:
+            await self._navigate(entry, initial_url)
+        return entry
+
+    def _record_origin(self, entry, request):
+        if request.resource_type == "document":
+            parts = urlsplit(request.url)
+            if parts.scheme in ("http", "https"):
+                entry.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    async def _navigate(self, entry, url):
+        try:
+            await entry.page.goto(url, wait_until="domcontentloaded")
+            entry.initial_url = url
+        except Exception as e:
+            print(f"Pre-navigation to {url} failed: {e}")
+            entry.initial_url = None
+
+    async def start(self):
+        """Launch the browser and warm up ``size`` contexts."""
+        entries = await asyncio.gather(*(self._create(self.initial_url) for _ in range(self.size)))
+        self._idle.extend(entries)
+
+    def _take_idle(self, initial_url):
+        for index, entry in enumerate(self._idle):
+            if entry.initial_url == initial_url:
+                return self._idle.pop(index)
+        return self._idle.pop() if self._idle else None
+
+    @asynccontextmanager
+    async def lease(self, initial_url=None):
+        """Lease a warm context; the caller navigates if ``entry.initial_url`` differs from its target."""
+        start = time.perf_counter()
+        initial_url = initial_url or self.initial_url
+        await self._get_browser()
+        entry = self._take_idle(initial_url)
+        if entry is None:
+            entry = await self._create(initial_url)
+        else:
+            self.hits += 1
+        self.leases += 1
+        self.total_wait_ms += (time.perf_counter() - start) * 1000
+        try:
+            yield entry
+        finally:
+            entry.uses += 1
+            await self._recycle(entry)
+
+    def _expired(self, entry):
+        return entry.uses >= self.max_uses or time.time() - entry.created_at >= self.max_age
+
+    async def _recycle(self, entry):
+        start = time.perf_counter()
+        if not entry.context.browser or not entry.context.browser.is_connected():
+            return
+        if self._expired(entry) or len(self._idle) >= self.size:
+            if self._expired(entry):
+                self.evictions += 1
+            await self._discard(entry)
+            if len(self._idle) < self.size:
+                self._spawn_replacement()
+            return
+        try:
+            await self._reset(entry)
+        except Exception as e:
+            print(f"Context reset failed, discarding: {e}")
+            await self._discard(entry)
+            self._spawn_replacement()
+            return
+        self._idle.append(entry)
+        self.recycles += 1
+        self.total_recycle_ms += (time.perf_counter() - start) * 1000
+
+    async def _reset(self, entry):
+        context = entry.context
+        pages = context.pages
+        page = entry.page if entry.page in pages else (pages[0] if pages else await context.new_page())
+        await asyncio.gather(*(other.close() for other in pages if other is not page))
+        entry.page = page
+
+        await context.clear_cookies()
+        await context.clear_permissions()
+        if entry.origins:
+            session = await context.new_cdp_session(page)
+            try:
+                for origin in entry.origins:
+                    await session.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            finally:
+                await session.detach()
+            entry.origins.clear()
+        await self._navigate(entry, self.initial_url)
+
+    async def _discard(self, entry):
+        try:
+            await entry.context.close()
+        except Exception:
+            pass
+
+    def _spawn_replacement(self):
+        async def replenish():
+            try:
+                entry = await self._create(self.initial_url)
+                if len(self._idle) < self.size:
+                    self._idle.append(entry)
+                else:
+                    await self._discard(entry)
+            except Exception as e:
+                print(f"Failed to warm a replacement context: {e}")
+
+        task = asyncio.create_task(replenish())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        for task in list(self._background):
+            task.cancel()
+        for entry in self._idle:
+            await self._discard(entry)
+        self._idle.clear()
+        if self.browser is not None and self.browser.is_connected():
+            self._closing = True  # 自分で閉じたときは切断として数えない
+            await self.browser.close()
+
+    def get_summary(self):
+        return {
+            "leases": self.leases,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.leases if self.leases else 0.0,
+            "avg_lease_wait_ms": self.total_wait_ms / self.leases if self.leases else 0.0,
+            "recycles": self.recycles,
+            "avg_recycle_ms": self.total_recycle_ms / self.recycles if self.recycles else 0.0,
+            "evictions": self.evictions,
+            "relaunches": self.relaunches,
+            "disconnects": self.disconnects,
+        }
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+import httpx
+
+IMAGE_DATA_URL = re.compile(r"data:image/[\w.+-]+;base64,[A-Za-z0-9+/=]+")
+MODES = ("record", "replay", "auto")
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def _fingerprint_images(text, loose):
+    """Replace inline base64 images by a short hash (or a fixed token for ``loose`` keys)."""
+    if loose:
+        return IMAGE_DATA_URL.sub("image", text)
+    return IMAGE_DATA_URL.sub(lambda m: "image:" + hashlib.sha256(m.group(0).encode("ascii")).hexdigest()[:16], text)
+
+
+def request_keys(method, path, body):
+    """Strict and loose cache keys for a model request.
+
+    Both hash the method, path and the JSON body with sorted keys; the
+    strict key fingerprints each inline image, the loose key ignores image
+    content so a rerun whose screenshots differ slightly still matches.
+    """
+    try:
+        normalized = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        normalized = body.decode("utf-8", "replace") if isinstance(body, bytes) else body
+    keys = []
+    for loose in (False, True):
+        payload = f"{method} {path}\n{_fingerprint_images(normalized, loose)}"
+        keys.append(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+    return tuple(keys)
+
+
+class Cassette:
+    """Record model HTTP exchanges to a JSONL file and replay them offline.
+
+    Pass ``http_client()`` to an OpenAI-SDK based client. In ``record`` mode
+    every request goes to the network and is appended to ``path``; in
+    ``replay`` mode responses come from the file and a request without a
+    recording raises CassetteMissError; ``auto`` replays what it has and
+    records the rest. Replayed requests match by strict key, then by loose
+    key, so reruns whose screenshots differ slightly still replay. A request
+    matching neither is a miss: ``auto`` sends it to the network and records
+    it. With ``sequential=True`` (``replay`` mode only) a miss instead takes
+    the next unused recording for the same endpoint, whatever its body.
+    """
+
+    def __init__(self, path, mode="auto", replay_latency=False, sequential=False):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        if sequential and mode != "replay":
+            # auto で本文を無視して返すと、別タスクの応答を黙って再生してしまう
+            raise ValueError("Sequential matching is only allowed in replay mode")
+        self.sequential = sequential
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.entries = []
+        self._used = set()
+        self._lock = asyncio.Lock()
+        self.stats = {"recorded": 0, "strict": 0, "loose": 0, "sequential": 0, "misses": 0, "model_ms_skipped": 0.0}
+        if mode != "record" and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = [json.loads(line) for line in f if line.strip()]
+        elif mode == "record" and os.path.exists(path):
+            os.remove(path)
+
+    def _find(self, method, path, strict_key, loose_key):
+        matchers = [
+            ("strict", lambda e: e["key"] == strict_key),
+            ("loose", lambda e: e["loose_key"] == loose_key),
+        ]
+        if self.sequential:
+            matchers.append(("sequential", lambda e: e["method"] == method and e["path"] == path))
+        for kind, matches in matchers:
+            for index, entry in enumerate(self.entries):
+                if index not in self._used and matches(entry):
+                    self._used.add(index)
+                    return kind, entry
+        return None, None
+
+    async def handle(self, request, transport):
+        body = await request.aread()
+        path = request.url.path
+        strict_key, loose_key = request_keys(request.method, path, body)
+
+        if self.mode != "record":
+            async with self._lock:
+                kind, entry = self._find(request.method, path, strict_key, loose_key)
+            if entry is not None:
+                self.stats[kind] += 1
+                self.stats["model_ms_skipped"] += entry["elapsed_ms"]
+                if self.replay_latency:
+                    await asyncio.sleep(entry["elapsed_ms"] / 1000)
+                return httpx.Response(
+                    entry["status"], headers={"content-type": entry["content_type"]},
+                    content=entry["body"].encode("utf-8"), request=request,
+                )
+            self.stats["misses"] += 1
+            if self.mode == "replay":
+                raise CassetteMissError(f"No recorded response for {request.method} {path}")
+
+        start = time.perf_counter()
+        response = await transport.handle_async_request(request)
+        content = await response.aread()
+        entry = {
+            "key": strict_key,
+            "loose_key": loose_key,
+            "method": request.method,
+            "path": path,
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "application/json"),
+            "body": content.decode("utf-8", "replace"),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+        async with self._lock:
+            self.entries.append(entry)
+            self._used.add(len(self.entries) - 1)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.stats["recorded"] += 1
+        # 本文は展開済みなので、圧縮・長さのヘッダーは付け直させる
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    def http_client(self, transport=None, **kwargs):
+        """An httpx.AsyncClient whose requests go through this cassette, then ``transport``."""
+        return httpx.AsyncClient(transport=CassetteTransport(self, transport), **kwargs)
+
+    def get_summary(self):
+        return {"path": self.path, "mode": self.mode, **self.stats}
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """httpx transport that routes requests through a Cassette before the network."""
+
+    def __init__(self, cassette, transport=None):
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        return await self.cassette.handle(request, self.transport)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def print_cassette_summary(summary):
+    replayed = summary["strict"] + summary["loose"] + summary["sequential"]
+    print(f"カセット ({summary['mode']}): 再生 {replayed}件 (完全一致 {summary['strict']}, 画像無視 {summary['loose']}, "
+          f"順序 {summary['sequential']}), 記録 {summary['recorded']}件, 未記録 {summary['misses']}件, "
+          f"省略したモデル待ち時間 {summary['model_ms_skipped'] / 1000:.1f}秒")
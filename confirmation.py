@@ -0,0 +1,106 @@
+import re
+
+# 保留中の操作 (確認を求める対象)。「他に何か調べますか」のような締めの質問と区別するため、動詞を限定する
+ACTION_VERBS = (r"(proceed|continue|go ahead|start|log ?in|sign ?in|submit|send|purchase|buy|book|order|pay|"
+                r"delete|remove|confirm|complete|finali[sz]e|place|save)")
+# 確認を求める表現。単なる疑問符 (URL のクエリや引用した質問文) では反応しない
+CONFIRMATION_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    rf"\b(may|can|could|shall|should) (i|we) (please )?(now )?{ACTION_VERBS}\b",
+    rf"\b(do|would) you (want|like) me to (now )?{ACTION_VERBS}\b",
+    rf"\bis (it|that|this) (ok|okay|alright|fine) (to|if (i|we)) {ACTION_VERBS}\b",
+    r"\b(ready|okay|ok) to (proceed|continue|submit)\s*\?",
+    r"\bwould you like to (proceed|continue)\b",
+    rf"\b(let me know|please confirm|confirm) (if|whether) (you want me to|(i|we) (should|can|may)) {ACTION_VERBS}\b",
+    r"\b(proceed|continue|go ahead|log ?in|sign ?in)\s*\?",
+    r"(続行|続け|進め|実行|送信|ログイン|購入|予約|削除)(しても|して)?(よろしい|いい|良い|よい)(です|でしょう)?か",
+    r"(続行|実行|送信|ログイン|購入|予約|削除)しますか",
+    r"(続け|進め)ますか",
+)]
+# タスクを終えた後の締めの質問。これを含む文は確認要求として扱わない
+SIGN_OFF_PATTERN = re.compile(
+    r"anything else|need anything|further (help|assistance)|any other (questions|tasks)|他に(何か|ご)",
+    re.IGNORECASE,
+)
+SENTENCE_END = re.compile(r"(?<=[.?!。？！])\s*")
+# タスクを終えられなかったという報告
+FAILURE_PATTERN = re.compile(
+    r"\b(i|we) (could not|couldn't|can't|cannot|was unable to|were unable to|am unable to|failed to)\b|"
+    r"\bunable to (complete|finish|find|access)\b|できませんでした|見つかりませんでした|失敗しました",
+    re.IGNORECASE,
+)
+
+
+def is_confirmation_request(text):
+    """Return whether a model message is asking the user for permission to carry out a pending action.
+
+    >>> is_confirmation_request("I have filled in the form. Should I continue and submit it?")
+    True
+    >>> is_confirmation_request("ログイン情報を入力しました。続行してもよろしいですか？")
+    True
+    >>> is_confirmation_request("明日の新宿区は晴れ、最高気温 24℃、最低気温 15℃ です。")
+    False
+    >>> is_confirmation_request("Here is the forecast. Let me know if you need anything else.")
+    False
+    """
+    for sentence in SENTENCE_END.split(text):
+        if SIGN_OFF_PATTERN.search(sentence):
+            continue
+        if any(pattern.search(sentence) for pattern in CONFIRMATION_PATTERNS):
+            return True
+    return False
+
+
+def is_final_answer(text):
+    """Return whether a model message reads as a finished answer rather than a question or a failure report.
+
+    >>> is_final_answer("明日の新宿区は晴れ、最高気温 24℃ です。他に何かありますか？")
+    True
+    >>> is_final_answer("Which city do you mean?")
+    False
+    >>> is_final_answer("I couldn't complete the booking because the site was down.")
+    False
+    """
+    if not text or not text.strip() or is_confirmation_request(text) or FAILURE_PATTERN.search(text):
+        return False
+    sentences = [sentence for sentence in SENTENCE_END.split(text.strip())
+                 if sentence and not SIGN_OFF_PATTERN.search(sentence)]
+    return bool(sentences) and not sentences[-1].rstrip().endswith(("?", "？"))
+
+
+class ConfirmationClassifier:
+    """Detect confirmation requests and keep metrics on auto-continuations."""
+
+    def __init__(self):
+        self.checks = 0
+        self.fired = 0
+        self.chained = 0
+        self.restarted = 0
+        self.steps_preserved = []
+
+    def check(self, texts):
+        """Classify the message texts of one response."""
+        self.checks += 1
+        fired = any(is_confirmation_request(text) for text in texts)
+        if fired:
+            self.fired += 1
+        return fired
+
+    def record_continuation(self, completed_steps, chained):
+        """Record a continuation; ``completed_steps`` is how many steps did not have to be replayed."""
+        self.steps_preserved.append(completed_steps)
+        if chained:
+            self.chained += 1
+        else:
+            self.restarted += 1
+
+    def get_summary(self):
+        continuations = len(self.steps_preserved)
+        return {
+            "checks": self.checks,
+            "fired": self.fired,
+            "continuations": continuations,
+            "chained": self.chained,
+            "summary_restarts": self.restarted,
+            "steps_preserved": sum(self.steps_preserved),
+            "avg_steps_preserved": sum(self.steps_preserved) / continuations if continuations else 0.0,
+        }
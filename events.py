@@ -0,0 +1,140 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+# 実行中タスクのイベントストリーム。span レコーダーと同じく asyncio タスクごとに分かれる
+_current_stream = ContextVar("event_stream", default=None)
+
+
+@dataclass
+class TaskEvent:
+    """Base of the events yielded by ``stream_browser_task``.
+
+    ``task_id``, ``engine``, ``step``, ``timestamp`` (epoch seconds) and
+    ``elapsed_ms`` (since the stream started) are filled in on emit.
+    """
+    task_id: str = field(default=None, kw_only=True)
+    engine: str = field(default=None, kw_only=True)
+    step: int = field(default=None, kw_only=True)
+    timestamp: float = field(default=None, kw_only=True)
+    elapsed_ms: float = field(default=None, kw_only=True)
+
+    @property
+    def kind(self):
+        return type(self).__name__
+
+    def to_dict(self):
+        return {"kind": self.kind, **asdict(self)}
+
+
+@dataclass
+class StepStarted(TaskEvent):
+    """The agent starts a new model turn."""
+
+
+@dataclass
+class ActionExecuted(TaskEvent):
+    action_type: str
+    description: str = None
+    duration_ms: float = None
+    output: str = None  # アクションが返した内容 (browser-use の抽出結果など)
+    error: str = None
+    url: str = None  # アクション後のページ URL
+
+
+@dataclass
+class ModelMessage(TaskEvent):
+    text: str
+    reasoning: bool = False  # True なら推論の要約や次の目標で、回答ではない
+
+
+@dataclass
+class ScreenshotCaptured(TaskEvent):
+    width: int = None
+    height: int = None
+    byte_size: int = None
+    mime_type: str = None
+    changed: bool = True
+    encode_ms: float = None
+    url: str = None
+
+
+@dataclass
+class TaskFinished(TaskEvent):
+    result: dict
+    error: str = None
+    first_result_ms: float = None  # 最初の回答 (推論以外の ModelMessage) までの時間
+
+
+class EventStream:
+    """Queue of TaskEvents for one task, stamped with time and the current step."""
+
+    def __init__(self, task_id="task", engine=None):
+        self.task_id = task_id
+        self.engine = engine
+        self.step = None
+        self.queue = asyncio.Queue()
+        self._origin = time.perf_counter()
+        self.first_result_ms = None
+
+    def emit(self, event):
+        if isinstance(event, StepStarted):
+            self.step = event.step
+        event.task_id = self.task_id
+        event.engine = self.engine
+        if event.step is None:
+            event.step = self.step
+        event.timestamp = time.time()
+        event.elapsed_ms = (time.perf_counter() - self._origin) * 1000
+        if isinstance(event, ModelMessage) and not event.reasoning and self.first_result_ms is None:
+            self.first_result_ms = event.elapsed_ms
+        self.queue.put_nowait(event)
+
+
+def set_stream(stream):
+    """Make ``stream`` receive the events emitted in the current context; returns a reset token."""
+    return _current_stream.set(stream)
+
+
+def reset_stream(token):
+    _current_stream.reset(token)
+
+
+def emit(event):
+    """Send an event to the current task's stream, or do nothing when no one is streaming."""
+    stream = _current_stream.get()
+    if stream is not None:
+        stream.emit(event)
+
+
+async def stream_events(run, task_id="task", engine=None):
+    """Run the coroutine returned by ``run()`` and yield its events as they are emitted.
+
+    The last event is a TaskFinished carrying the result dict. Closing the
+    generator early (``break`` or ``aclose()``) cancels the task, which lets
+    callers stop a runaway task once they have what they need.
+    """
+    stream = EventStream(task_id, engine)
+    token = set_stream(stream)
+    try:
+        # create_task はコンテキストをコピーするので、タスク内の emit はこのストリームに届く
+        task = asyncio.create_task(run())
+    finally:
+        reset_stream(token)
+    task.add_done_callback(lambda _: stream.queue.put_nowait(None))
+    try:
+        while (event := await stream.queue.get()) is not None:
+            yield event
+        result = task.result()
+        finished = TaskFinished(result=result, error=result.get("error") if isinstance(result, dict) else None,
+                                first_result_ms=stream.first_result_ms)
+        stream.emit(finished)
+        yield stream.queue.get_nowait()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
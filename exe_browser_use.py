@@ -1,14 +1,126 @@
 import asyncio
+import base64
 import time
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
 load_dotenv()
-from browser_use import Agent
+from browser_use import Agent, BrowserSession
 from browser_use.llm import ChatAzureOpenAI
+from cassette import print_cassette_summary
+from events import ActionExecuted, ModelMessage, ScreenshotCaptured, StepStarted, emit, stream_events
+from network import NetworkConfig, NetworkRouter, print_network_summary
+from ratelimit import get_rate_limiter
+from tiering import ModelTiering, is_error_page, print_tiering_summary
+from tracing import SpanRecorder, print_span_summary
+from usage import UsageTracker, image_size, print_usage_summary
 
-async def execute_browser_task(task_description, model="gpt-4.1", temperature=0.1):
-    """Execute a browser task using browser-use library."""
+def observe_step(tiering, history):
+    """Feed the failure signals of the last browser-use step to a ModelTiering."""
+    if not history:
+        return
+    last = history[-1]
+    previous = history[-2] if len(history) > 1 else None
+    screenshot = getattr(last.state, "screenshot", None)
+    changed = (previous is None or screenshot is None or last.state.url != previous.state.url
+               or screenshot != getattr(previous.state, "screenshot", None))
+    action = None
+    if last.model_output:
+        action = tuple(str(item.model_dump(exclude_unset=True)) for item in last.model_output.action)
+    tiering.observe(
+        changed=changed,
+        action=action,
+        error_page=is_error_page(last.state.url, last.state.title),
+        action_error=any(result.error for result in last.result),
+    )
+
+def screenshot_size(agent):
+    """(width, height) of the screenshots the agent sent to the model, from the first one in its history."""
+    if not agent.settings.use_vision:
+        return None
+    for item in agent.state.history.history:
+        screenshot = getattr(item.state, "screenshot", None)
+        if screenshot:
+            return image_size(base64.b64decode(screenshot))
+    return None
+
+def instrument_agent(agent, llm, span_recorder, tiering=None, fast_llm=None):
+    """Record model requests, action execution and whole steps of a browser-use Agent as spans.
+
+    With ``tiering`` each step runs on ``fast_llm`` or ``llm`` as the
+    ModelTiering selects, based on the signals of the previous step.
+    """
+    multi_act = agent.multi_act
+
+    def trace_llm(target):
+        ainvoke = target.ainvoke
+
+        async def traced_ainvoke(*args, **kwargs):
+            start = time.perf_counter()
+            with span_recorder.span("model_request", model=target.model):
+                result = await ainvoke(*args, **kwargs)
+            if tiering:
+                usage = getattr(result, "usage", None)
+                tiering.record(target.model, (time.perf_counter() - start) * 1000,
+                               getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+            return result
+
+        setattr(target, "ainvoke", traced_ainvoke)
+
+    async def traced_multi_act(actions, *args, **kwargs):
+        start = time.perf_counter()
+        with span_recorder.span("actions", count=len(actions)):
+            results = await multi_act(actions, *args, **kwargs)
+        # 個々のアクションの時間は取れないので、バッチ全体の時間を均等に割り当てる
+        duration_ms = (time.perf_counter() - start) * 1000 / max(len(results), 1)
+        for action, action_result in zip(actions, results):
+            params = action.model_dump(exclude_unset=True)
+            action_type = next(iter(params), "unknown")
+            emit(ActionExecuted(action_type=action_type, description=f"{action_type} {params.get(action_type)}",
+                                duration_ms=duration_ms, output=action_result.extracted_content,
+                                error=action_result.error))
+            if action_result.is_done and action_result.extracted_content:
+                emit(ModelMessage(text=action_result.extracted_content))
+        return results
+
+    for target in (llm, fast_llm):
+        if target is not None:
+            trace_llm(target)
+    agent.multi_act = traced_multi_act
+
+    step_start = None
+
+    async def on_step_start(agent):
+        nonlocal step_start
+        step_start = time.perf_counter()
+        if tiering:
+            observe_step(tiering, agent.state.history.history)
+            agent.llm = fast_llm if tiering.tier == "fast" else llm
+        emit(StepStarted(step=agent.state.n_steps))
+
+    async def on_step_end(agent):
+        span_recorder.add("step", step_start, time.perf_counter())
+        model_output = agent.state.last_model_output
+        if model_output and model_output.current_state.next_goal:
+            emit(ModelMessage(text=model_output.current_state.next_goal, reasoning=True))
+        state = agent.state.history.history[-1].state if agent.state.history.history else None
+        screenshot = getattr(state, "screenshot", None)
+        if screenshot:
+            emit(ScreenshotCaptured(byte_size=len(screenshot) * 3 // 4, mime_type="image/png", url=state.url))
+
+    return on_step_start, on_step_end
+
+async def execute_browser_task(task_description, model="gpt-4.1", temperature=0.1, trace_file=None, task_id="task", cassette=None, network=False, fast_model=None):
+    """Execute a browser task using browser-use library.
+
+    With a ``cassette`` model requests are recorded to or replayed from it.
+    ``network`` (True or a NetworkConfig) routes the browser's requests
+    through a NetworkRouter. With ``fast_model`` routine steps go to that
+    deployment and ``model`` is used after failure signals (see ModelTiering).
+    """
     # 処理時間とトークン数の計測開始
     start_time = time.time()
+    usage_tracker = UsageTracker("browser_use", model)
+    span_recorder = SpanRecorder(task_id, "browser_use")
  
     print("=== Browser-Use タスク実行開始 ===")
     print(f"タスク: {task_description}")
@@ -16,17 +128,45 @@ async def execute_browser_task(task_description, model="gpt-4.1", temperature=0.
     
     # タスクの定義
     task_input = task_description
+    network_router = None
+    model_tiering = ModelTiering(fast_model, model) if fast_model else None
 
     try:
-        # エージェントの作成と実行
-        agent = Agent(
-            task=task_input,
-            llm=ChatAzureOpenAI(model=model, temperature=temperature),
-        )
+        # ストリームが途中で閉じられた (キャンセルされた) 場合や、エージェントの作成に失敗した場合もブラウザを閉じる
+        async with AsyncExitStack() as stack:
+            # エージェントの作成と実行
+            # モデルへのリクエストはプロセス共有のレート制限 (とカセット) を通す。再試行はレート制限側で行う
+            llm_kwargs = {"http_client": get_rate_limiter().http_client(cassette), "max_retries": 0}
+            llm = ChatAzureOpenAI(model=model, temperature=temperature, **llm_kwargs)
+            browser_session = None
+            if network:
+                # ルートを張るため、Agent に任せずブラウザを先に起動する
+                network_router = NetworkRouter(network if isinstance(network, NetworkConfig) else None)
+                browser_session = BrowserSession()
+                stack.push_async_callback(browser_session.stop)
+                await browser_session.start()
+                stack.push_async_callback(network_router.detach, browser_session.browser_context)
+                await network_router.attach(browser_session.browser_context)
+            agent = Agent(
+                task=task_input,
+                llm=llm,
+                browser_session=browser_session,
+            )
+            stack.push_async_callback(agent.close)
+            fast_llm = None
+            if model_tiering:
+                fast_llm = ChatAzureOpenAI(model=fast_model, temperature=temperature, **llm_kwargs)
+                # 切り替え先のモデルの usage も集計されるよう登録しておく
+                agent.token_cost_service.register_llm(fast_llm)
+            on_step_start, on_step_end = instrument_agent(agent, llm, span_recorder, model_tiering, fast_llm)
+
+            print("エージェントがタスクの実行を開始します...")
+            result = await agent.run(on_step_start=on_step_start, on_step_end=on_step_end)
         
-        print("エージェントがタスクの実行を開始します...")
-        result = await agent.run()
-        await agent.close()
+        # LLM 呼び出しごとの usage を記録。画像の分が報告されない場合は、1 回に 1 枚のスクリーンショットとして見積もる
+        size = screenshot_size(agent)
+        for entry in agent.token_cost_service.usage_history:
+            usage_tracker.add_chat_usage(entry.usage, model=entry.model, images=[size] if size else ())
         
         print("\n" + "=" * 60)
         print("=== タスク実行結果 ===")
@@ -45,27 +185,47 @@ async def execute_browser_task(task_description, model="gpt-4.1", temperature=0.
     print("=== 実行ログ ===")
     print(f"処理時間: {elapsed_time:.2f}秒")
     
-    if result and hasattr(result, 'usage'):
-        usage = result.usage
-        if hasattr(usage, 'total_tokens'):
-            print(f"実際の消費トークン数: {usage.total_tokens}")
-        if hasattr(usage, 'total_prompt_tokens'):
-            print(f"  - プロンプトトークン: {usage.total_prompt_tokens}")
-        if hasattr(usage, 'total_completion_tokens'):
-            print(f"  - 補完トークン: {usage.total_completion_tokens}")
-        if hasattr(usage, 'total_cost'):
-            print(f"  - 総コスト: ${usage.total_cost}")
-        if hasattr(usage, 'entry_count'):
-            print(f"  - API呼び出し回数: {usage.entry_count}")
+    token_summary = usage_tracker.get_summary()
+    print_usage_summary(token_summary)
+    if trace_file:
+        span_recorder.export(trace_file)
+    span_summary = span_recorder.get_summary()
+    print_span_summary(span_summary)
+    cassette_summary = cassette.get_summary() if cassette else None
+    if cassette_summary:
+        print_cassette_summary(cassette_summary)
+    network_summary = network_router.get_summary() if network_router else None
+    if network_summary:
+        print_network_summary(network_summary)
+    tiering_summary = model_tiering.get_summary() if model_tiering else None
+    if tiering_summary:
+        print_tiering_summary(tiering_summary)
+    if result and getattr(result, 'usage', None) and hasattr(result.usage, 'total_cost'):
+        print(f"総コスト: ${result.usage.total_cost}")
     
     print("=" * 60)
     
     return {
         "result": result.final_result() if result else None,
+        # done アクションでエージェント自身が成功と報告したときだけ完了とする
+        "completed": bool(result and result.is_done() and result.is_successful()),
         "execution_time": elapsed_time,
-        "usage": result.usage if result and hasattr(result, 'usage') else None
+        "usage": result.usage if result and hasattr(result, 'usage') else None,
+        "token_usage": token_summary,
+        "cassette": cassette_summary,
+        "network": network_summary,
+        "tiering": tiering_summary,
+        "spans": span_summary
     }
 
+def stream_browser_task(task_description, **kwargs):
+    """Run execute_browser_task as an async generator of TaskEvents, ending with TaskFinished.
+
+    Closing the generator early cancels the task and closes its browser.
+    """
+    return stream_events(lambda: execute_browser_task(task_description, **kwargs),
+                         kwargs.get("task_id", "task"), "browser_use")
+
 async def main():
     """メイン関数 - デモ用のタスクを実行"""
     # 天気情報取得タスクの例
@@ -1,87 +1,275 @@
 import os, asyncio, time
+from contextlib import AsyncExitStack
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.messages import TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent
 from autogen_agentchat.conditions import TextMentionTermination
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.ui import Console
+from autogen_core.models import AssistantMessage, ChatCompletionClient, FunctionExecutionResultMessage, RequestUsage
 from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
-from autogen_ext.tools.mcp import StdioServerParams, create_mcp_server_session, mcp_server_tools
+from autogen_ext.tools.mcp import create_mcp_server_session, mcp_server_tools
 from dotenv import load_dotenv
+from cassette import print_cassette_summary
+from confirmation import is_confirmation_request
+from events import ActionExecuted, ModelMessage, StepStarted, emit, stream_events
+from mcp_pool import playwright_server_params
+from ratelimit import get_rate_limiter
+from snapshot_middleware import TITLE_PATTERN, UNCHANGED_DIFF, URL_PATTERN, SnapshotMiddleware
+from tiering import ModelTiering, is_error_page, print_tiering_summary
+from tracing import SpanRecorder, print_span_summary
+from usage import UsageTracker, print_usage_summary
 
 
 load_dotenv()
 
-model_client = AzureOpenAIChatCompletionClient(
-    azure_deployment="gpt-4.1",
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version="2025-04-01-preview",
-    model="gpt-4.1",
-)
+SNAPSHOT_TOKEN_BUDGET = 6000 # Full page snapshots above this are trimmed before reaching the agent (None to pass them through)
 
-async def main() -> None:
-    start_time = time.time()
-    
-    server_params = StdioServerParams(
-        command="npx",
-        args=[
-            "@playwright/mcp@latest",
-            "--browser",
-            "chromium"
-        ],
-        read_timeout_seconds=60,
+FAST_MODEL = None # Faster deployment (e.g. "gpt-4.1-mini") for routine steps; gpt-4.1 takes over on failure signals
+
+def create_model_client(http_client=None, model="gpt-4.1"):
+    # 既定ではプロセス共有のレート制限を通す。再試行はレート制限側で行うので SDK では再試行しない
+    return AzureOpenAIChatCompletionClient(
+        azure_deployment=model,
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version="2025-04-01-preview",
+        model=model,
+        http_client=http_client or get_rate_limiter().http_client(),
+        max_retries=0,
     )
 
-    async with create_mcp_server_session(server_params) as session:
-        await session.initialize()
-        tools = await mcp_server_tools(server_params=server_params, session=session)
+def observe_messages(tiering, messages):
+    """Feed the failure signals found at the end of the agent's history to a ModelTiering."""
+    if not messages:
+        return
+    last = messages[-1]
+    if isinstance(last, AssistantMessage) and isinstance(last.content, str):
+        tiering.observe(confirmation=is_confirmation_request(last.content))
+        return
+    if not isinstance(last, FunctionExecutionResultMessage):
+        return
+    calls = next((message.content for message in reversed(messages[:-1])
+                  if isinstance(message, AssistantMessage) and isinstance(message.content, list)), [])
+    error_page = False
+    for result in last.content:
+        url_match, title_match = URL_PATTERN.search(result.content), TITLE_PATTERN.search(result.content)
+        error_page = error_page or is_error_page(url_match and url_match.group(1), title_match and title_match.group(1))
+    tiering.observe(
+        changed=not any(UNCHANGED_DIFF in result.content for result in last.content),
+        action=tuple(f"{call.name} {call.arguments}" for call in calls),
+        error_page=error_page,
+        action_error=any(result.is_error for result in last.content),
+    )
+
+class TieredModelClient(ChatCompletionClient):
+    """Chat completion client that sends each call to the fast or strong client chosen by a ModelTiering."""
+
+    def __init__(self, clients, tiering):
+        self.clients = clients  # {"fast": ..., "strong": ...}
+        self.tiering = tiering
+
+    def _select(self, messages):
+        observe_messages(self.tiering, messages)
+        return self.tiering.select(), self.clients[self.tiering.tier]
+
+    async def create(self, messages, **kwargs):
+        model, client = self._select(messages)
+        start = time.perf_counter()
+        result = await client.create(messages, **kwargs)
+        self.tiering.record(model, (time.perf_counter() - start) * 1000,
+                            result.usage.prompt_tokens, result.usage.completion_tokens)
+        return result
+
+    def create_stream(self, messages, **kwargs):
+        # ストリーミングでは遅延を記録せず、振り分けだけ行う
+        return self._select(messages)[1].create_stream(messages, **kwargs)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
+
+    def actual_usage(self):
+        usages = [client.actual_usage() for client in self.clients.values()]
+        return RequestUsage(prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+                            completion_tokens=sum(usage.completion_tokens for usage in usages))
+
+    def total_usage(self):
+        usages = [client.total_usage() for client in self.clients.values()]
+        return RequestUsage(prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+                            completion_tokens=sum(usage.completion_tokens for usage in usages))
+
+    def count_tokens(self, messages, **kwargs):
+        return self.clients["strong"].count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs):
+        return self.clients["fast"].remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self.clients["strong"].capabilities
+
+    @property
+    def model_info(self):
+        return self.clients["strong"].model_info
+
+async def traced_stream(stream, span_recorder):
+    """Pass a run_stream through while recording model and tool time between events as spans."""
+    last = time.perf_counter()
+    step = 0
+    arguments = {}
+    async for message in stream:
+        now = time.perf_counter()
+        if isinstance(message, ToolCallRequestEvent) or (isinstance(message, TextMessage) and message.source != "user"):
+            span_recorder.add("model_request", last, now)
+            last = now
+            if isinstance(message, TextMessage):
+                emit(ModelMessage(text=message.content))
+            else:
+                step += 1
+                emit(StepStarted(step=step))
+                arguments.update((call.id, call.arguments) for call in message.content)
+        elif isinstance(message, ToolCallExecutionEvent):
+            tools = ",".join(result.name for result in message.content)
+            span_recorder.add(f"tool.{tools}", last, now)
+            for result in message.content:
+                url_match = URL_PATTERN.search(result.content)
+                # 結果本文はページスナップショットで大きいので、イベントには載せない
+                emit(ActionExecuted(action_type=result.name, description=f"{result.name} {arguments.pop(result.call_id, '')}",
+                                    duration_ms=(now - last) * 1000 / len(message.content),
+                                    error=result.content if result.is_error else None,
+                                    url=url_match.group(1) if url_match else None))
+            last = now
+        yield message
+
+async def execute_browser_task(task_description, trace_file=None, task_id="task", pool=None, snapshot_budget=SNAPSHOT_TOKEN_BUDGET, cassette=None, fast_model=FAST_MODEL):
+    """Execute a browser task using Playwright MCP tools.
+
+    With ``pool`` (an McpSessionPool) an initialized server session is leased
+    instead of starting a new MCP server for this task. Unless
+    ``snapshot_budget`` is None, page snapshots go through SnapshotMiddleware.
+    With a ``cassette`` model requests are recorded to or replayed from it.
+    With ``fast_model`` routine steps go to that deployment through a
+    TieredModelClient and gpt-4.1 is used after failure signals.
+    """
+    start_time = time.time()
+    usage_tracker = UsageTracker("playwright_mcp", "gpt-4.1")
+    span_recorder = SpanRecorder(task_id, "playwright_mcp")
+    model_tiering = ModelTiering(fast_model, "gpt-4.1") if fast_model else None
+
+    session_start = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        if pool is not None:
+            tools = (await stack.enter_async_context(pool.lease())).tools
+        else:
+            server_params = playwright_server_params()
+            session = await stack.enter_async_context(create_mcp_server_session(server_params))
+            await session.initialize()
+            tools = await mcp_server_tools(server_params=server_params, session=session)
+        span_recorder.add("mcp_startup", session_start, time.perf_counter())
         print(f"Tools: {[tool.name for tool in tools]}")
 
+        snapshot_middleware = None
+        model_context = None
+        if snapshot_budget is not None:
+            snapshot_middleware = SnapshotMiddleware(token_budget=snapshot_budget)
+            tools = snapshot_middleware.wrap(tools)
+            model_context = snapshot_middleware.model_context()
+
+        http_client = get_rate_limiter().http_client(cassette)
+        # クライアントはタスクごとに作る (import 時には環境変数を読まない)
+        task_model_client = create_model_client(http_client)
+        if model_tiering:
+            task_model_client = TieredModelClient(
+                {"fast": create_model_client(http_client, fast_model), "strong": task_model_client}, model_tiering
+            )
+
         agent = AssistantAgent(
             name="Assistant",
-            model_client=model_client,
+            model_client=task_model_client,
             description="あなたはMCPを使用して、ウェブサイトの情報を取得したり操作を行うエージェントです。",
             tools=tools,
+            model_context=model_context,
         )
 
         # シングルエージェントでタスクを実行
         user_message = TextMessage(
-            content="""
-            以下のタスクを正確に実行してください:
-            1. Qiitaにアクセス
-            2. メールアドレス=<your email>、パスワード=<your password>でログイン
-            3. 画面右上の「投稿する」をクリックして、「記事を新規作成」をクリック
-            4. タイトルに「あああああ」を入力
-            5. 本文に「いいいいい」を入力
-            6. 「下書き保存」をクリック
-            7. 保存が完了したら、トップ画面に戻って、「トレンド」タブをクリック
-            8. トレンドのトップの記事を開いて、いいねを押してください。
-            9. 最後にユーザーアイコンをクリックして、ログアウトしてください。
-            """,
+            content=task_description,
             source="user"
         )
 
         termination = TextMentionTermination("TERMINATE")
         team = RoundRobinGroupChat([agent], termination_condition=termination)
-        await Console(
-            team.run_stream(
-                task=user_message.content,
+        try:
+            task_result = await Console(
+                traced_stream(team.run_stream(
+                    task=user_message.content,
+                ), span_recorder)
             )
-        )
+        finally:
+            await task_model_client.close()
         
-        # 処理時間を計算
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        
-        # 最終的なトークン使用量を取得
-        final_usage = model_client.total_usage()
-        
-        print(f"\n=== 実行ログ ===")
-        print(f"処理時間: {elapsed_time:.2f}秒")
-        print(f"合計消費トークン数: {final_usage.prompt_tokens + final_usage.completion_tokens}")
-        print(f"  - プロンプトトークン: {final_usage.prompt_tokens}")
-        print(f"  - 補完トークン: {final_usage.completion_tokens}")
+    # 処理時間を計算
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    
+    # メッセージごとの usage からトークン使用量を集計
+    final_result = None
+    for message in task_result.messages:
+        if message.models_usage:
+            usage_tracker.add_chat_usage(message.models_usage)
+        if isinstance(message, TextMessage) and message.source != "user":
+            final_result = message.content
+    token_summary = usage_tracker.get_summary()
+    
+    print(f"\n=== 実行ログ ===")
+    print(f"処理時間: {elapsed_time:.2f}秒")
+    print_usage_summary(token_summary)
+    if trace_file:
+        span_recorder.export(trace_file)
+    span_summary = span_recorder.get_summary()
+    print_span_summary(span_summary)
+    cassette_summary = cassette.get_summary() if cassette else None
+    if cassette_summary:
+        print_cassette_summary(cassette_summary)
+    tiering_summary = model_tiering.get_summary() if model_tiering else None
+    if tiering_summary:
+        print_tiering_summary(tiering_summary)
+    snapshot_summary = snapshot_middleware.get_summary() if snapshot_middleware else None
+    if snapshot_summary:
+        print(f"スナップショット: {snapshot_summary['snapshots']}件 (差分 {snapshot_summary['diffs']}件, "
+              f"縮小 {snapshot_summary['trims']}件), 削減トークン (推定) {snapshot_summary['tokens_saved']} "
+              f"(ツール結果 {snapshot_summary['result_tokens_saved']}, 履歴 {snapshot_summary['history_tokens_saved']})")
+    
+    return {
+        "result": final_result,
+        "execution_time": elapsed_time,
+        "token_usage": token_summary,
+        "snapshot_stats": snapshot_summary,
+        "cassette": cassette_summary,
+        "tiering": tiering_summary,
+        "spans": span_summary
+    }
+
+def stream_browser_task(task_description, **kwargs):
+    """Run execute_browser_task as an async generator of TaskEvents, ending with TaskFinished."""
+    return stream_events(lambda: execute_browser_task(task_description, **kwargs),
+                         kwargs.get("task_id", "task"), "playwright_mcp")
+
+async def main() -> None:
+    task_description = """
+    以下のタスクを正確に実行してください:
+    1. Qiitaにアクセス
+    2. メールアドレス=<your email>、パスワード=<your password>でログイン
+    3. 画面右上の「投稿する」をクリックして、「記事を新規作成」をクリック
+    4. タイトルに「あああああ」を入力
+    5. 本文に「いいいいい」を入力
+    6. 「下書き保存」をクリック
+    7. 保存が完了したら、トップ画面に戻って、「トレンド」タブをクリック
+    8. トレンドのトップの記事を開いて、いいねを押してください。
+    9. 最後にユーザーアイコンをクリックして、ログアウトしてください。
+    """
+    await execute_browser_task(task_description)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,462 @@
+import asyncio
+import base64
+import io
+import time
+from dataclasses import dataclass, field
+
+from tracing import span
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow がない場合はサムネイルの完全一致で判定する
+    Image = None
+
+# CDP Page.captureScreenshot が扱えるフォーマット
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+# Page.startScreencast は WebP に非対応
+SCREENCAST_FORMATS = ("jpeg", "png")
+FRAME_SOURCES = ("screenshot", "screencast")
+
+
+@dataclass
+class FrameEncoderConfig:
+    """Output format, quality and downscale factor for screenshots sent to the model."""
+    format: str = "jpeg"
+    quality: int = 80
+    scale: float = 1.0
+
+    def __post_init__(self):
+        if self.format not in MIME_TYPES:
+            raise ValueError(f"Unsupported frame format: {self.format}")
+        if not 0 < self.scale <= 1.0:
+            raise ValueError(f"Frame scale must be in (0, 1]: {self.scale}")
+        self.quality = max(1, min(int(self.quality), 100))
+
+
+@dataclass
+class Frame:
+    """A single encoded screenshot.
+
+    The image is kept once as raw bytes: under ``key`` in ``store`` when the
+    encoder has an ArtifactStore, otherwise in ``content``. The base64 form
+    sent to the model is built on demand and not kept.
+    """
+    mime_type: str
+    width: int
+    height: int
+    scale: float
+    encode_ms: float
+    byte_size: int
+    content: bytes = field(default=None, repr=False)
+    store: object = field(default=None, repr=False)
+    key: str = None
+    captured_at: float = field(default_factory=time.time)
+    changed: bool = True
+
+    @property
+    def image(self):
+        return self.store.get(self.key) if self.store is not None else self.content
+
+    @property
+    def data(self):
+        return base64.b64encode(self.image).decode("ascii")
+
+    @property
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+class ScreencastSource:
+    """Buffer the latest frame of a CDP screencast (``Page.startScreencast``) for one page.
+
+    Chromium pushes a frame whenever the page repaints, already encoded and
+    downscaled, so a capture only has to pick up the buffered frame. No new
+    frame after an action means nothing was repainted, and the latest
+    buffered frame is still current.
+    """
+
+    def __init__(self, session, config, max_width, max_height):
+        self.session = session
+        self.config = config
+        self.max_width = max_width
+        self.max_height = max_height
+        self.latest = None
+        self.latest_timestamp = 0.0
+        self.frames_received = 0
+        self._new_frame = asyncio.Event()
+
+    async def start(self):
+        self.session.on("Page.screencastFrame", self._on_frame)
+        params = {"format": self.config.format, "maxWidth": self.max_width, "maxHeight": self.max_height, "everyNthFrame": 1}
+        if self.config.format != "png":
+            params["quality"] = self.config.quality
+        await self.session.send("Page.startScreencast", params)
+
+    async def stop(self):
+        self.session.remove_listener("Page.screencastFrame", self._on_frame)
+        await self.session.send("Page.stopScreencast")
+
+    def _on_frame(self, params):
+        self.latest = params["data"]
+        self.latest_timestamp = params.get("metadata", {}).get("timestamp") or time.time()
+        self.frames_received += 1
+        self._new_frame.set()
+        # ack しないと Chromium は次のフレームを送らない
+        asyncio.ensure_future(self.session.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]}))
+
+    async def wait_for_frame(self, after=0.0, timeout_ms=250):
+        """Return the latest frame painted after ``after`` (epoch seconds), waiting up to ``timeout_ms``.
+
+        Falls back to the latest buffered frame on timeout; returns None only
+        if no frame has arrived at all.
+        """
+        deadline = time.perf_counter() + timeout_ms / 1000
+        while self.latest is None or self.latest_timestamp < after:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._new_frame.clear()
+            try:
+                await asyncio.wait_for(self._new_frame.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self.latest
+
+
+class FrameEncoder:
+    """Capture the viewport as JPEG/WebP/PNG, optionally downscaled, in one CDP round-trip.
+
+    With ``source="screencast"`` frames in the default config are taken from a
+    background CDP screencast instead; other configs and failures still use
+    ``Page.captureScreenshot``. With an ArtifactStore as ``store`` frames
+    keep only a key into it.
+    """
+
+    def __init__(self, display_width, display_height, config=None, source="screenshot", screencast_wait_ms=250, store=None):
+        if source not in FRAME_SOURCES:
+            raise ValueError(f"Unsupported frame source: {source}")
+        self.display_width = display_width
+        self.display_height = display_height
+        self.config = config or FrameEncoderConfig()
+        self.source = source
+        self.screencast_wait_ms = screencast_wait_ms
+        self.store = store
+        self._sessions = {}
+        self._session_lock = asyncio.Lock()  # 並行したキャプチャが同じページに CDP セッションを 2 つ作らないように
+        self._screencast = None
+        self._screencast_page = None
+        self.action_at = 0.0
+        self.last_frame = None
+        self.frames = 0
+        self.total_bytes = 0
+        self.total_encode_ms = 0.0
+        self.source_stats = {}
+
+    @property
+    def scale(self):
+        return self.config.scale
+
+    @property
+    def coordinate_scale(self):
+        """Scale of the last frame the model saw, which its coordinates refer to."""
+        return self.last_frame.scale if self.last_frame else self.scale
+
+    @property
+    def model_width(self):
+        """Width of the frames as seen by the model."""
+        return round(self.display_width * self.scale)
+
+    @property
+    def model_height(self):
+        """Height of the frames as seen by the model."""
+        return round(self.display_height * self.scale)
+
+    async def _cdp_session(self, page):
+        async with self._session_lock:
+            session = self._sessions.get(page)
+            if session is None:
+                session = await page.context.new_cdp_session(page)
+                self._sessions[page] = session
+            return session
+
+    async def _capture_cdp(self, page, config, region=None):
+        """Capture the viewport, or ``region`` (x, y, width, height in viewport pixels) of it."""
+        session = await self._cdp_session(page)
+        params = {"format": config.format, "captureBeyondViewport": False}
+        if config.format != "png":
+            params["quality"] = config.quality
+        if config.scale != 1.0 or region:
+            x, y, width, height = region or (0, 0, self.display_width, self.display_height)
+            # clip はドキュメント座標なので現在のスクロール位置を加える
+            metrics = await session.send("Page.getLayoutMetrics")
+            viewport = metrics["cssVisualViewport"]
+            params["clip"] = {
+                "x": viewport["pageX"] + x,
+                "y": viewport["pageY"] + y,
+                "width": width,
+                "height": height,
+                "scale": config.scale,
+            }
+        result = await session.send("Page.captureScreenshot", params)
+        return result["data"]
+
+    async def _capture_playwright(self, page, config):
+        """Screenshot through Playwright when CDP is unavailable; returns the base64 data and its scale.
+
+        WebP is not supported here. The image is downscaled with Pillow so it
+        matches the size declared to the model; without Pillow it stays at
+        full resolution and the frame's scale says so.
+        """
+        image_format = "jpeg" if config.format == "jpeg" else "png"
+        options = {"quality": config.quality} if image_format == "jpeg" else {}
+        screenshot_bytes = await page.screenshot(full_page=False, type=image_format, **options)
+        scale = 1.0
+        if config.scale != 1.0 and Image is not None:
+            size = (round(self.display_width * config.scale), round(self.display_height * config.scale))
+            with Image.open(io.BytesIO(screenshot_bytes)) as image:
+                resized = image.convert("RGB").resize(size, Image.LANCZOS)
+            output = io.BytesIO()
+            resized.save(output, format=image_format.upper(), **options)
+            screenshot_bytes, scale = output.getvalue(), config.scale
+        return base64.b64encode(screenshot_bytes).decode("ascii"), scale
+
+    def mark_action(self):
+        """Note that an action was just performed; screencast frames painted before it are stale."""
+        self.action_at = time.time()
+
+    async def _screencast_for(self, page):
+        if self._screencast_page is not page:
+            await self._stop_screencast()
+            screencast = ScreencastSource(await self._cdp_session(page), self.config, self.model_width, self.model_height)
+            await screencast.start()
+            self._screencast, self._screencast_page = screencast, page
+        return self._screencast
+
+    async def _capture_screencast(self, page):
+        screencast = await self._screencast_for(page)
+        data = await screencast.wait_for_frame(self.action_at, self.screencast_wait_ms)
+        if data is None:
+            raise RuntimeError("no screencast frame received")
+        return data
+
+    async def _stop_screencast(self):
+        screencast, self._screencast, self._screencast_page = self._screencast, None, None
+        if screencast:
+            try:
+                await screencast.stop()
+            except Exception:
+                pass  # ページが既に閉じている
+
+    async def close(self):
+        """Stop the screencast and detach the CDP sessions, e.g. before pooled pages are reused."""
+        await self._stop_screencast()
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            try:
+                await session.detach()
+            except Exception:
+                pass  # ページが既に閉じている
+
+    def _frame(self, data, mime_type, width, height, scale, encode_ms):
+        # base64 は展開して捨て、画像はストア (なければ Frame) に 1 つだけ持つ
+        content = base64.b64decode(data)
+        frame = Frame(mime_type=mime_type, width=width, height=height, scale=scale, encode_ms=encode_ms,
+                      byte_size=len(content))
+        if self.store is not None:
+            frame.store, frame.key = self.store, self.store.put(content, mime_type)
+        else:
+            frame.content = content
+        return frame
+
+    async def capture(self, page, config=None):
+        """Capture and encode the current viewport, returning a Frame."""
+        config = config or self.config
+        start = time.perf_counter()
+        source = "screenshot"
+        try:
+            data = None
+            if self.source == "screencast" and config is self.config and config.format in SCREENCAST_FORMATS:
+                try:
+                    data = await self._capture_screencast(page)
+                    source = "screencast"
+                except Exception as e:
+                    print(f"Screencast frame unavailable, capturing a screenshot: {e}")
+            if data is None:
+                data = await self._capture_cdp(page, config)
+            mime_type = MIME_TYPES[config.format]
+            scale = config.scale
+        except Exception as e:
+            self._sessions.pop(page, None)
+            print(f"CDP screenshot failed, falling back to page.screenshot: {e}")
+            data, scale = await self._capture_playwright(page, config)
+            mime_type = "image/jpeg" if config.format == "jpeg" else "image/png"
+        encode_ms = (time.perf_counter() - start) * 1000
+        count, total_ms = self.source_stats.get(source, (0, 0.0))
+        self.source_stats[source] = (count + 1, total_ms + encode_ms)
+
+        frame = self._frame(data, mime_type, round(self.display_width * scale), round(self.display_height * scale),
+                            scale, encode_ms)
+        self.last_frame = frame
+        self.frames += 1
+        self.total_bytes += frame.byte_size
+        self.total_encode_ms += encode_ms
+        return frame
+
+    async def capture_region(self, page, region, config=None):
+        """Capture ``region`` (x, y, width, height in viewport pixels) at full resolution."""
+        base = config or self.config
+        config = FrameEncoderConfig(format=base.format, quality=base.quality)
+        start = time.perf_counter()
+        data = await self._capture_cdp(page, config, region)
+        encode_ms = (time.perf_counter() - start) * 1000
+        frame = self._frame(data, MIME_TYPES[config.format], region[2], region[3], 1.0, encode_ms)
+        self.frames += 1
+        self.total_bytes += frame.byte_size
+        self.total_encode_ms += encode_ms
+        return frame
+
+    async def thumbnail(self, page, width=32):
+        """Capture a tiny PNG of the viewport for change detection. Not counted in the frame stats."""
+        config = FrameEncoderConfig(format="png", scale=width / self.display_width)
+        return base64.b64decode(await self._capture_cdp(page, config))
+
+    def to_viewport(self, x, y, scale=None):
+        """Map model-space coordinates back to viewport coordinates."""
+        scale = self.coordinate_scale if scale is None else scale
+        return round(x / scale), round(y / scale)
+
+    def get_summary(self):
+        return {
+            "format": self.config.format,
+            "quality": self.config.quality,
+            "scale": self.scale,
+            "frames": self.frames,
+            "total_bytes": self.total_bytes,
+            "avg_bytes": self.total_bytes // self.frames if self.frames else 0,
+            "avg_encode_ms": self.total_encode_ms / self.frames if self.frames else 0.0,
+            "source": self.source,
+            "sources": {
+                source: {"frames": count, "avg_capture_ms": total_ms / count}
+                for source, (count, total_ms) in self.source_stats.items()
+            },
+        }
+
+
+def thumbnail_signature(png_bytes):
+    """Luminance bytes of a thumbnail, or the raw PNG when Pillow is unavailable."""
+    if Image is None:
+        return png_bytes
+    with Image.open(io.BytesIO(png_bytes)) as image:
+        return bytes(image.convert("L").tobytes())
+
+
+def changed_cells(previous, current, width, threshold=0.1):
+    """Bounding box (x0, y0, x1, y1) of thumbnail pixels that differ by more than ``threshold``.
+
+    Returns None when nothing changed or the signatures are not comparable.
+    """
+    if Image is None or len(previous) != len(current) or not width:
+        return None
+    limit = threshold * 255
+    columns, rows = [], []
+    for index, (a, b) in enumerate(zip(previous, current)):
+        if abs(a - b) > limit:
+            rows.append(index // width)
+            columns.append(index % width)
+    if not columns:
+        return None
+    return min(columns), min(rows), max(columns) + 1, max(rows) + 1
+
+
+def signature_difference(previous, current):
+    """Mean absolute luminance difference between two signatures, in [0, 1]."""
+    if Image is None or len(previous) != len(current):
+        return 0.0 if previous == current else 1.0
+    return sum(abs(a - b) for a, b in zip(previous, current)) / (255 * len(current))
+
+
+class FrameChangeDetector:
+    """Flag frames with no visible change using a downsampled luminance diff.
+
+    Before each capture a thumbnail is compared with the previous one. When the
+    mean absolute difference is below ``threshold`` (0-1) the frame is captured
+    with ``unchanged_config`` instead, which is much cheaper to upload. It
+    keeps the encoder's scale, so the image still matches the display size
+    declared to the model, and saves bytes through quality only: image tokens
+    depend on the dimensions, so an unchanged frame costs as many tokens as
+    any other.
+    """
+
+    def __init__(self, frame_encoder, threshold=0.01, thumbnail_width=32, unchanged_config=None):
+        self.frame_encoder = frame_encoder
+        self.threshold = threshold
+        self.thumbnail_width = thumbnail_width
+        self.unchanged_config = unchanged_config or FrameEncoderConfig(
+            format="jpeg", quality=30, scale=frame_encoder.scale
+        )
+        if self.unchanged_config.scale != frame_encoder.scale:
+            raise ValueError("unchanged_config must keep the encoder's scale (the model's coordinate space)")
+        self._previous = None
+        self.changed_region = None
+        self.checks = 0
+        self.unchanged_frames = 0
+        self.unchanged_bytes = 0
+        self.total_detect_ms = 0.0
+
+    async def has_changed(self, page):
+        """Return whether the viewport visibly changed since the last call."""
+        start = time.perf_counter()
+        try:
+            with span("change_detect"):
+                signature = thumbnail_signature(await self.frame_encoder.thumbnail(page, self.thumbnail_width))
+        except Exception as e:
+            print(f"Change detection failed: {e}")
+            self._previous = None
+            self.changed_region = None
+            return True
+        finally:
+            self.total_detect_ms += (time.perf_counter() - start) * 1000
+
+        previous, self._previous = self._previous, signature
+        self.checks += 1
+        self.changed_region = None
+        if previous is None:
+            return True
+        cells = changed_cells(previous, signature, self.thumbnail_width)
+        if cells:
+            # サムネイルのピクセル座標をビューポート座標に戻す
+            cell = self.frame_encoder.display_width / self.thumbnail_width
+            self.changed_region = tuple(round(value * cell) for value in cells)
+        changed = signature_difference(previous, signature) >= self.threshold
+        if not changed:
+            self.unchanged_frames += 1
+        return changed
+
+    async def capture(self, page):
+        """Capture a Frame, using the cheap encoding when nothing visibly changed."""
+        if await self.has_changed(page):
+            return await self.frame_encoder.capture(page)
+        frame = await self.frame_encoder.capture(page, self.unchanged_config)
+        frame.changed = False
+        self.unchanged_bytes += frame.byte_size
+        return frame
+
+    @property
+    def last_signature(self):
+        """Signature of the most recently checked frame."""
+        return self._previous
+
+    def reset(self):
+        """Forget the previous frame, e.g. after switching tabs."""
+        self._previous = None
+        self.changed_region = None
+
+    def get_summary(self):
+        return {
+            "threshold": self.threshold,
+            "checks": self.checks,
+            "unchanged_frames": self.unchanged_frames,
+            "unchanged_bytes": self.unchanged_bytes,
+            "image_tokens_saved": 0,  # 同じサイズで送るので画像トークンは減らない (減るのは送信量だけ)
+            "avg_detect_ms": self.total_detect_ms / self.checks if self.checks else 0.0,
+        }
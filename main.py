@@ -1,6 +1,121 @@
-def main():
-    print("Hello from browsing-agents!")
+import argparse
+import importlib
+import json
+import sys
+import time
+
+_STARTED = time.perf_counter()
+
+# サブコマンドが使うモジュール。重い依存 (autogen, browser_use, openai, playwright) はサブコマンドの実行時まで読み込まない
+COMMAND_MODULES = {
+    "computer-use": "exe_computer_use",
+    "browser-use": "exe_browser_use",
+    "mcp": "exe_playwright_mcp",
+    "route": "router",
+    "batch": "batch_runner",
+    "bench": "bench.run",
+}
+DELEGATED_COMMANDS = ("batch", "bench")  # 残りの引数はそれぞれのスクリプトの CLI がそのまま解釈する
+
+
+def load_command(command):
+    """Import the module behind a subcommand; returns (module, import time in ms)."""
+    start = time.perf_counter()
+    module = importlib.import_module(COMMAND_MODULES[command])
+    return module, (time.perf_counter() - start) * 1000
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="browsing-agents", description="Run browsing agents from the command line.")
+    parser.add_argument("--timings", action="store_true", help="Print how long startup and engine imports took")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    engines = {
+        "computer-use": "Run a task with the Azure OpenAI computer-use model on Playwright",
+        "browser-use": "Run a task with browser-use",
+        "mcp": "Run a task with an autogen agent on the Playwright MCP server",
+    }
+    for name, help_text in engines.items():
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("task", help="Task description")
+        command.add_argument("--task-id", default="task")
+        command.add_argument("--fast-model", default=None, help="Deployment for routine steps (model tiering)")
+        command.add_argument("--cassette", default=None, help="JSONL file to record model responses to or replay them from")
+        command.add_argument("--cassette-mode", choices=("auto", "record", "replay"), default="auto")
+        command.add_argument("--trace-file", default=None, help="File to write per-step timing spans to")
+        command.add_argument("-o", "--output", default=None, help="Write the result as JSON")
+        if name == "computer-use":
+            command.add_argument("--url", default=None, help="Initial URL (default: Bing)")
+        if name == "browser-use":
+            command.add_argument("--model", default="gpt-4.1")
+            command.add_argument("--network", action="store_true",
+                                 help="Block ads/analytics and cache static assets on disk")
+        if name == "mcp":
+            command.add_argument("--snapshot-budget", type=int, default=None,
+                                 help="Trim page snapshots above this many tokens (0: send snapshots unchanged; "
+                                      "default: the engine's SNAPSHOT_TOKEN_BUDGET)")
+
+    route = commands.add_parser("route", help="Run a task on the cheapest engine likely to succeed, escalating on failure")
+    route.add_argument("task", help="Task description")
+    route.add_argument("--task-id", default="task")
+    route.add_argument("--url", default=None, help="Initial URL")
+    route.add_argument("--directory", default=".router", help="Directory of routing statistics")
+    route.add_argument("-o", "--output", default=None, help="Write the result as JSON")
+
+    # --help も含めて残りの引数はそれぞれの CLI に渡す
+    commands.add_parser("batch", help="Run computer-use tasks from a JSONL file (see batch --help)", add_help=False)
+    commands.add_parser("bench", help="Offline benchmark of the three engines (see bench --help)", add_help=False)
+    return parser
+
+
+def engine_kwargs(args):
+    """Keyword arguments for an engine's execute_browser_task from the parsed options."""
+    kwargs = {"task_id": args.task_id}
+    if args.cassette:
+        from cassette import Cassette
+        kwargs["cassette"] = Cassette(args.cassette, args.cassette_mode)
+    if args.fast_model:
+        kwargs["fast_model"] = args.fast_model
+    if args.trace_file:
+        kwargs["trace_file"] = args.trace_file
+    if args.command == "computer-use" and args.url:
+        kwargs["initial_url"] = args.url
+    if args.command == "browser-use":
+        kwargs["model"] = args.model
+        kwargs["network"] = args.network
+    if args.command == "mcp" and args.snapshot_budget is not None:
+        # 0 はスナップショットの縮小をしない (execute_browser_task の snapshot_budget=None)
+        kwargs["snapshot_budget"] = args.snapshot_budget or None
+    return kwargs
+
+
+async def run_command(module, args, extra):
+    if args.command in DELEGATED_COMMANDS:
+        return await module.main(extra)
+    if args.command == "route":
+        router = module.EngineRouter(args.directory)
+        return await router.route(args.task, args.url, args.task_id)
+    return await module.execute_browser_task(args.task, **engine_kwargs(args))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in DELEGATED_COMMANDS:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    cli_ms = (time.perf_counter() - _STARTED) * 1000
+    module, import_ms = load_command(args.command)
+    if args.timings:
+        print(f"起動時間: CLI {cli_ms:.0f}ms, {COMMAND_MODULES[args.command]} の読み込み {import_ms:.0f}ms", file=sys.stderr)
+
+    import asyncio  # asyncio だけで 40ms ほどかかるので、--help やエラー時には読み込まない
+    result = asyncio.run(run_command(module, args, extra))
+    if getattr(args, "output", None) and result is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
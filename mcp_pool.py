@@ -0,0 +1,201 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from autogen_ext.tools.mcp import StdioMcpToolAdapter, StdioServerParams, create_mcp_server_session
+
+# npx に毎回 @latest を解決させないよう、バージョンを固定する
+PLAYWRIGHT_MCP_VERSION = "0.0.29"
+# `npm install` (package.json) で入るローカルの実行ファイル。あれば npx を経由しない
+LOCAL_MCP_BIN = Path(__file__).parent / "node_modules" / ".bin" / "mcp-server-playwright"
+
+
+def playwright_server_params(version=PLAYWRIGHT_MCP_VERSION, browser="chromium", headless=False, isolated=True):
+    """Server parameters for Playwright MCP, preferring the locally installed, pinned package.
+
+    ``isolated`` keeps the browser profile in memory, so closing the browser
+    between tasks discards cookies and storage.
+    """
+    if LOCAL_MCP_BIN.exists():
+        command, args = str(LOCAL_MCP_BIN), []
+    else:
+        command, args = "npx", ["-y", f"@playwright/mcp@{version}"]
+    args += ["--browser", browser]
+    if headless:
+        args.append("--headless")
+    if isolated:
+        args.append("--isolated")
+    return StdioServerParams(command=command, args=args, read_timeout_seconds=60)
+
+
+@dataclass
+class PooledSession:
+    """An initialized MCP server session and the tool adapters bound to it."""
+    session: object
+    tools: list
+    startup_ms: float
+    created_at: float = field(default_factory=time.time)
+    uses: int = 0
+    closed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    task: asyncio.Task = field(default=None, repr=False)
+
+
+class McpSessionPool:
+    """Keep Playwright MCP server sessions initialized between tasks.
+
+    Each session is opened and closed by its own background task, since the
+    MCP stdio client must be exited in the task that entered it. Tool schemas
+    are listed once and reused for every later session. After a lease the
+    browser is closed (clearing tabs and, in isolated mode, all state) and
+    the session goes back to the pool; sessions are replaced after
+    ``max_uses`` leases or ``max_age`` seconds.
+    """
+
+    def __init__(self, server_params=None, size=1, max_uses=50, max_age=1800):
+        self.server_params = server_params or playwright_server_params()
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self._idle = []
+        self._tool_schemas = None
+        self._background = set()
+        self.sessions_started = 0
+        self.total_startup_ms = 0.0
+        self.schema_cache_hits = 0
+        self.leases = 0
+        self.hits = 0
+        self.total_wait_ms = 0.0
+        self.resets = 0
+        self.total_reset_ms = 0.0
+        self.evictions = 0
+
+    async def _create(self):
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._run_session(ready))
+        entry = await ready
+        entry.task = task
+        return entry
+
+    async def _run_session(self, ready):
+        start = time.perf_counter()
+        try:
+            async with create_mcp_server_session(self.server_params) as session:
+                await session.initialize()
+                if self._tool_schemas is None:
+                    self._tool_schemas = (await session.list_tools()).tools
+                else:
+                    self.schema_cache_hits += 1
+                tools = [
+                    StdioMcpToolAdapter(server_params=self.server_params, tool=tool, session=session)
+                    for tool in self._tool_schemas
+                ]
+                entry = PooledSession(session=session, tools=tools, startup_ms=(time.perf_counter() - start) * 1000)
+                self.sessions_started += 1
+                self.total_startup_ms += entry.startup_ms
+                ready.set_result(entry)
+                await entry.closed.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"MCP session ended with an error: {e}")
+
+    async def start(self):
+        """Start and initialize ``size`` server sessions."""
+        entries = await asyncio.gather(*(self._create() for _ in range(self.size)))
+        self._idle.extend(entries)
+
+    @asynccontextmanager
+    async def lease(self):
+        """Lease an initialized session; yields the PooledSession with its ``tools``."""
+        start = time.perf_counter()
+        entry = self._idle.pop() if self._idle else None
+        if entry is None:
+            entry = await self._create()
+        else:
+            self.hits += 1
+        self.leases += 1
+        self.total_wait_ms += (time.perf_counter() - start) * 1000
+        try:
+            yield entry
+        finally:
+            entry.uses += 1
+            await self._recycle(entry)
+
+    def _expired(self, entry):
+        return entry.uses >= self.max_uses or time.time() - entry.created_at >= self.max_age
+
+    async def _recycle(self, entry):
+        start = time.perf_counter()
+        if self._expired(entry) or len(self._idle) >= self.size:
+            if self._expired(entry):
+                self.evictions += 1
+            await self._discard(entry)
+            if len(self._idle) < self.size:
+                self._spawn_replacement()
+            return
+        try:
+            await self._reset(entry)
+        except Exception as e:
+            print(f"MCP session reset failed, discarding: {e}")
+            await self._discard(entry)
+            self._spawn_replacement()
+            return
+        self._idle.append(entry)
+        self.resets += 1
+        self.total_reset_ms += (time.perf_counter() - start) * 1000
+
+    async def _reset(self, entry):
+        # ブラウザを閉じるとタブも状態も破棄され、次のツール呼び出しで新しいブラウザが起動する
+        result = await entry.session.call_tool("browser_close", {})
+        if result.isError:
+            raise RuntimeError(f"browser_close failed: {result.content}")
+
+    async def _discard(self, entry):
+        entry.closed.set()
+        if entry.task:
+            try:
+                await entry.task
+            except Exception:
+                pass
+
+    def _spawn_replacement(self):
+        async def replenish():
+            try:
+                entry = await self._create()
+                if len(self._idle) < self.size:
+                    self._idle.append(entry)
+                else:
+                    await self._discard(entry)
+            except Exception as e:
+                print(f"Failed to start a replacement MCP session: {e}")
+
+        task = asyncio.create_task(replenish())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        for task in list(self._background):
+            task.cancel()
+        for entry in self._idle:
+            await self._discard(entry)
+        self._idle.clear()
+
+    def get_summary(self):
+        avg_startup_ms = self.total_startup_ms / self.sessions_started if self.sessions_started else 0.0
+        return {
+            "leases": self.leases,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.leases if self.leases else 0.0,
+            "avg_lease_wait_ms": self.total_wait_ms / self.leases if self.leases else 0.0,
+            "sessions_started": self.sessions_started,
+            "avg_startup_ms": avg_startup_ms,
+            # プールから払い出した分だけサーバー起動 (npm 解決・Node 起動・initialize) を省けた
+            "startup_saved_ms": self.hits * avg_startup_ms,
+            "schema_cache_hits": self.schema_cache_hits,
+            "resets": self.resets,
+            "avg_reset_ms": self.total_reset_ms / self.resets if self.resets else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+# 広告・解析系のドメイン (サブドメインも含めてブロックする)
+DEFAULT_BLOCKED_DOMAINS = (
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "adservice.google.com",
+    "amazon-adsystem.com",
+    "criteo.com",
+    "criteo.net",
+    "scorecardresearch.com",
+    "facebook.net",
+    "hotjar.com",
+    "clarity.ms",
+    "bat.bing.com",
+)
+# 操作にもスクリーンショットにも不要なリソース
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("media",)
+CACHEABLE_RESOURCE_TYPES = ("stylesheet", "script", "image", "font")
+HAR_MODES = (None, "record", "replay")
+# ディスクから返すときは本文が展開済みなので付け直させる
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+@dataclass
+class NetworkConfig:
+    """Routing rules for a browser context: blocklists, a static asset cache and HAR record/replay."""
+    cache_dir: str = ".cache/http"  # None でディスクキャッシュを使わない
+    cache_ttl: int = 24 * 3600  # キャッシュした静的リソースの有効期間 (秒)
+    blocked_domains: tuple = DEFAULT_BLOCKED_DOMAINS
+    blocked_resource_types: tuple = DEFAULT_BLOCKED_RESOURCE_TYPES
+    har_path: str = None
+    har_mode: str = None  # "record" で har_path に記録、"replay" で記録済みの応答を返す
+    har_url: str = None  # HAR の対象にする URL パターン (None ですべて)
+
+    def __post_init__(self):
+        if self.har_mode not in HAR_MODES:
+            raise ValueError(f"Unsupported HAR mode: {self.har_mode}")
+        if self.har_mode and not self.har_path:
+            raise ValueError("HAR mode needs har_path")
+
+
+def is_blocked_host(host, domains):
+    """True if ``host`` is one of ``domains`` or a subdomain of one."""
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def load_har_index(path):
+    """Map (method, url) of each HAR entry to its response size in bytes and load time in ms."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["log"]["entries"]
+    index = {}
+    for entry in entries:
+        content = entry["response"].get("content", {})
+        size = max(content.get("size", 0), entry["response"].get("bodySize", 0), 0)
+        index[(entry["request"]["method"], entry["request"]["url"])] = (size, entry.get("time", 0.0))
+    return index
+
+
+class NetworkRouter:
+    """Route every request of a browser context through blocklists, a disk cache and HAR replay.
+
+    Blocked domains and resource types are aborted. In ``replay`` mode
+    requests recorded in the HAR are served by Playwright's
+    ``route_from_har``; in ``record`` mode everything that is not blocked
+    goes to the network so the HAR (written when the context closes) is
+    complete. Otherwise static assets are served from ``cache_dir`` when
+    fresh and stored there after a successful fetch. Savings are counted
+    per main-frame page load.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or NetworkConfig()
+        self._har_index = {}
+        self._har_replay = False
+        self._loads = {}
+        self.page_loads = []
+        self.stats = {"requests": 0, "blocked": 0, "cache_hits": 0, "cache_stores": 0, "har_hits": 0,
+                      "bytes_saved": 0, "ms_saved": 0.0}
+        if self.config.cache_dir:
+            os.makedirs(self.config.cache_dir, exist_ok=True)
+
+    async def attach(self, context):
+        """Install the routes on a browser context."""
+        if self.config.har_mode == "record":
+            await context.route_from_har(self.config.har_path, url=self.config.har_url, update=True,
+                                         update_content="embed")
+        elif self.config.har_mode == "replay":
+            self._har_index = load_har_index(self.config.har_path)
+            # 記録にないリクエストは後から登録した自前のハンドラー (キャッシュ・ネットワーク) に回す
+            await context.route_from_har(self.config.har_path, url=self.config.har_url, not_found="fallback")
+            self._har_replay = True
+        # 後から登録したルートが先に呼ばれるので、ブロックは HAR より前に判定される
+        await context.route("**/*", self._handle)
+
+    async def detach(self, context):
+        """Remove the routes, e.g. before the context is returned to a pool."""
+        try:
+            await context.unroute("**/*", self._handle)
+            if self._har_replay:
+                await context.unroute(self.config.har_url or "**/*")
+        except Exception as e:
+            # ブラウザが落ちた後はルートも残っていない
+            print(f"Failed to remove network routes: {e}")
+        self._har_replay = False
+
+    def _page_load(self, request):
+        try:
+            frame = request.frame
+        except Exception:
+            return None  # Service Worker からのリクエスト
+        if request.is_navigation_request() and frame.parent_frame is None:
+            load = {"url": request.url, "requests": 0, "blocked": 0, "cache_hits": 0, "har_hits": 0,
+                    "bytes_saved": 0, "ms_saved": 0.0}
+            self._loads[frame] = load
+            self.page_loads.append(load)
+            return load
+        return self._loads.get(frame.page.main_frame)
+
+    def _count(self, load, key, size=0, elapsed_ms=0.0):
+        for stats in (self.stats, load):
+            if stats is None:
+                continue
+            stats[key] += 1
+            stats["bytes_saved"] += size
+            stats["ms_saved"] += elapsed_ms
+
+    async def _handle(self, route, request):
+        load = self._page_load(request)
+        self.stats["requests"] += 1
+        if load is not None:
+            load["requests"] += 1
+
+        host = urlsplit(request.url).hostname or ""
+        if request.resource_type in self.config.blocked_resource_types or is_blocked_host(host, self.config.blocked_domains):
+            self._count(load, "blocked")
+            await route.abort("blockedbyclient")
+            return
+
+        if self._har_replay:
+            har_entry = self._har_index.get((request.method, request.url))
+            if har_entry:
+                self._count(load, "har_hits", *har_entry)
+                await route.fallback()
+                return
+        if self.config.har_mode == "record" or not self._cacheable(request):
+            await route.fallback()
+            return
+
+        cached = self._cache_read(request)
+        if cached:
+            meta, body = cached
+            self._count(load, "cache_hits", len(body), meta["fetch_ms"])
+            await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+            return
+
+        start = time.perf_counter()
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            await route.fallback()
+            return
+        fetch_ms = (time.perf_counter() - start) * 1000
+        if self._storable(response):
+            self._cache_write(request, response, body, fetch_ms)
+        await route.fulfill(response=response, body=body)
+
+    def _cacheable(self, request):
+        return bool(self.config.cache_dir) and request.method == "GET" and request.resource_type in CACHEABLE_RESOURCE_TYPES
+
+    def _storable(self, response):
+        cache_control = response.headers.get("cache-control", "")
+        return (response.status == 200 and "set-cookie" not in response.headers
+                and "no-store" not in cache_control and "private" not in cache_control)
+
+    def _cache_path(self, request):
+        key = hashlib.sha256(f"{request.method} {request.url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.config.cache_dir, key)
+
+    def _cache_read(self, request):
+        path = self._cache_path(request)
+        try:
+            if time.time() - os.path.getmtime(path + ".json") > self.config.cache_ttl:
+                return None
+            with open(path + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(path + ".body", "rb") as f:
+                return meta, f.read()
+        except OSError:
+            return None
+
+    def _cache_write(self, request, response, body, fetch_ms):
+        path = self._cache_path(request)
+        headers = {name: value for name, value in response.headers.items() if name not in DROPPED_HEADERS}
+        meta = {"url": request.url, "status": response.status, "headers": headers, "fetch_ms": fetch_ms}
+        # 本文を先に書き、メタデータの置き換えを完了の印にする
+        with open(path + ".body.tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".body.tmp", path + ".body")
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + ".json.tmp", path + ".json")
+        self.stats["cache_stores"] += 1
+
+    def get_summary(self):
+        return {**self.stats, "har_mode": self.config.har_mode, "page_loads": self.page_loads}
+
+
+def print_network_summary(summary):
+    print(f"ネットワーク: リクエスト {summary['requests']}件, ブロック {summary['blocked']}件, "
+          f"キャッシュヒット {summary['cache_hits']}件, HAR ヒット {summary['har_hits']}件, "
+          f"削減 {summary['bytes_saved'] / 1024:.1f}KB / {summary['ms_saved'] / 1000:.1f}秒")
+    for load in summary["page_loads"]:
+        print(f"  - {load['url'][:80]}: {load['requests']}件中 ブロック {load['blocked']}, "
+              f"キャッシュ {load['cache_hits']}, HAR {load['har_hits']}, "
+              f"削減 {load['bytes_saved'] / 1024:.1f}KB / {load['ms_saved']:.0f}ms")
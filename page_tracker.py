@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+from tracing import span
+
+BLANK_URLS = ("", "about:blank")
+
+
+class PageTracker:
+    """Follow the tabs of a browser context from its events.
+
+    Pages are pushed onto an active-page stack as soon as their first real
+    navigation commits, and popped when they close, so the agent switches to
+    a new tab without sleeping or guessing that ``context.pages[-1]`` is it.
+    """
+
+    def __init__(self, commit_timeout_ms=3000):
+        self.commit_timeout_ms = commit_timeout_ms
+        self.stack = []
+        self._opened_at = {}
+        self._pending = set()
+        self._changed = asyncio.Event()
+        self._visited = set()
+        self._listeners = []  # (emitter, event, handler): detach で外す
+        self.pages_opened = 0
+        self.switches = 0
+        self.switch_latencies = []
+
+    @property
+    def active(self):
+        """The most recently committed page that is still open."""
+        return self.stack[-1] if self.stack else None
+
+    def attach(self, context):
+        """Start tracking a context; pages that already exist are treated as committed."""
+        self._listen(context, "page", self._on_page)
+        for page in context.pages:
+            self._watch(page)
+            self._visited.add(page)
+            self.stack.append(page)
+
+    def detach(self, context):
+        """Stop tracking a context and its pages, e.g. before it is returned to a pool."""
+        listeners, self._listeners = self._listeners, []
+        for emitter, event, handler in listeners:
+            try:
+                emitter.remove_listener(event, handler)
+            except Exception:
+                pass  # 既に外れている (framenavigated) か、ページが閉じている
+
+    def _listen(self, emitter, event, handler):
+        emitter.on(event, handler)
+        self._listeners.append((emitter, event, handler))
+
+    def _watch(self, page):
+        self._opened_at[page] = time.perf_counter()
+        self._listen(page, "close", lambda: self._on_close(page))
+        self._listen(page, "popup", self._on_page)
+
+    def _on_page(self, page):
+        # ポップアップは context の "page" と opener の "popup" の両方で通知される
+        if page in self._opened_at:
+            return
+        self._watch(page)
+        self.pages_opened += 1
+        if page.url not in BLANK_URLS:
+            self._commit(page)
+            return
+        self._pending.add(page)
+
+        def on_navigated(frame):
+            if frame == page.main_frame and frame.url not in BLANK_URLS:
+                page.remove_listener("framenavigated", on_navigated)
+                self._commit(page)
+
+        self._listen(page, "framenavigated", on_navigated)
+
+    def _commit(self, page):
+        self._pending.discard(page)
+        if page in self.stack:
+            self.stack.remove(page)
+        self.stack.append(page)
+        self._changed.set()
+
+    def _on_close(self, page):
+        self._pending.discard(page)
+        if page in self.stack:
+            self.stack.remove(page)
+        self._changed.set()
+
+    async def _wait_pending(self):
+        """Wait for recently opened tabs to commit their first navigation."""
+        while self._pending:
+            now = time.perf_counter()
+            deadline = max(self._opened_at[page] for page in self._pending) + self.commit_timeout_ms / 1000
+            if now >= deadline:
+                # about:blank のまま残るタブは切り替え対象にしない
+                self._pending.clear()
+                return
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), deadline - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def switch(self, page):
+        """Return the page the agent should act on next, recording the switch latency."""
+        self._visited.add(page)
+        if self._pending:
+            with span("tab_wait_commit"):
+                await self._wait_pending()
+        active = self.active
+        if active is None or active is page:
+            return page
+        self.switches += 1
+        attributes = {}
+        if active not in self._visited:
+            # 新しいタブ: 開かれてからエージェントが切り替えるまでの時間
+            self._visited.add(active)
+            attributes["latency_ms"] = (time.perf_counter() - self._opened_at[active]) * 1000
+            self.switch_latencies.append(attributes["latency_ms"])
+        with span("tab_switch", **attributes):
+            await active.bring_to_front()
+        return active
+
+    def get_summary(self):
+        new_tabs = len(self.switch_latencies)
+        return {
+            "pages_opened": self.pages_opened,
+            "switches": self.switches,
+            "avg_switch_ms": sum(self.switch_latencies) / new_tabs if new_tabs else 0.0,
+            "max_switch_ms": max(self.switch_latencies, default=0.0),
+        }
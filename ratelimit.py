@@ -0,0 +1,312 @@
+import asyncio
+import base64
+import binascii
+import json
+import random
+import re
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+
+import httpx
+
+from usage import estimate_image_tokens, estimate_text_tokens, image_size
+
+IMAGE_DATA_URL = re.compile(r"data:image/[\w.+-]+;base64,([A-Za-z0-9+/=]+)")
+IMAGE_HEADER_CHARS = 64 * 1024  # 画像サイズを読むためにデコードする base64 の先頭部分 (4 の倍数)
+FALLBACK_IMAGE_SIZE = (1440, 1080)  # ヘッダーを読めない画像は原寸のスクリーンショットとみなす
+DEFAULT_MAX_OUTPUT_TOKENS = 1000  # Azure は max_tokens 分も TPM に数えるので、その見込み
+RETRY_STATUSES = (429, 503)
+WINDOW_S = 60.0
+
+
+@dataclass
+class Quota:
+    """Azure quota of one deployment. Azure grants 6 RPM per 1000 TPM."""
+    tpm: int = 150_000
+    rpm: int = 900
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 6
+    base_delay_s: float = 1.0
+    max_delay_s: float = 60.0
+    jitter: float = 0.25  # 待ち時間に最大この割合のランダムな上乗せをして、再試行が揃わないようにする
+
+
+def deployment_of(request, body):
+    """Deployment name from an Azure deployment URL, or the ``model`` of a v1 request body."""
+    parts = request.url.path.split("/")
+    if "deployments" in parts and parts.index("deployments") + 1 < len(parts):
+        return parts[parts.index("deployments") + 1]
+    return body.get("model", "default") if isinstance(body, dict) else "default"
+
+
+def data_url_image_tokens(data):
+    """Tile estimate for one base64 image, from the dimensions in its header."""
+    try:
+        size = image_size(base64.b64decode(data[:IMAGE_HEADER_CHARS]))
+    except (binascii.Error, ValueError):
+        size = None
+    return estimate_image_tokens(*(size or FALLBACK_IMAGE_SIZE))
+
+
+def estimate_request_tokens(raw, body):
+    """Tokens a request will count against TPM: prompt text, images and the expected output."""
+    text = raw.decode("utf-8", "replace")
+    images = sum(data_url_image_tokens(data) for data in IMAGE_DATA_URL.findall(text))
+    prompt = estimate_text_tokens(IMAGE_DATA_URL.sub("", text)) + images
+    output = DEFAULT_MAX_OUTPUT_TOKENS
+    if isinstance(body, dict):
+        output = body.get("max_output_tokens") or body.get("max_completion_tokens") or body.get("max_tokens") or output
+    return prompt + output
+
+
+def retry_after_s(response):
+    """Server-requested wait from ``retry-after-ms`` or ``retry-after`` (seconds), or None."""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+def response_tokens(content):
+    """Total tokens from the ``usage`` of a chat or Responses API body, or None."""
+    try:
+        usage = json.loads(content).get("usage") or {}
+    except (ValueError, AttributeError):
+        return None
+    if "total_tokens" in usage:
+        return usage["total_tokens"]
+    if "input_tokens" in usage:
+        return usage["input_tokens"] + usage.get("output_tokens", 0)
+    return None
+
+
+class DeploymentLimiter:
+    """Sliding-window TPM/RPM accounting and AIMD concurrency for one deployment.
+
+    The in-flight limit grows by about one per window of successful calls
+    and halves on every throttled response, while a Retry-After pauses all
+    requests to the deployment.
+    """
+
+    def __init__(self, name, quota, initial_concurrency=4, max_concurrency=32):
+        self.name = name
+        self.quota = quota
+        self.max_concurrency = max_concurrency
+        self.limit = float(initial_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._window = deque()  # (送信時刻, トークン数)
+        self._conditions = weakref.WeakKeyDictionary()  # イベントループ -> Condition
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.backoff_ms = 0.0  # 429/503 の後に再試行まで待った時間 (queue_waits とは別)
+        self.tokens = 0
+        self.queue_waits = []
+        self.min_limit = self.limit
+        self.max_limit = self.limit
+
+    @property
+    def condition(self):
+        """Condition of the running event loop; asyncio.Condition is bound to the loop it first waits on."""
+        loop = asyncio.get_running_loop()
+        condition = self._conditions.get(loop)
+        if condition is None:
+            condition = self._conditions[loop] = asyncio.Condition()
+        return condition
+
+    def _prune(self, now):
+        while self._window and now - self._window[0][0] >= WINDOW_S:
+            self._window.popleft()
+
+    def _wait_s(self, tokens, now):
+        """Seconds until a request of ``tokens`` fits the quota and the concurrency limit (0: now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._prune(now)
+        used = sum(entry[1] for entry in self._window)
+        if self._window and (len(self._window) >= self.quota.rpm or used + tokens > self.quota.tpm):
+            return self._window[0][0] + WINDOW_S - now
+        if self.in_flight >= max(1, int(self.limit)):
+            return None  # 完了通知を待つ
+        return 0.0
+
+    async def acquire(self, tokens):
+        """Wait for a slot; returns the window entry to pass to ``release``."""
+        start = time.perf_counter()
+        async with self.condition:
+            while True:
+                now = time.monotonic()
+                wait_s = self._wait_s(tokens, now)
+                if wait_s == 0.0:
+                    break
+                try:
+                    await asyncio.wait_for(self.condition.wait(), wait_s)
+                except asyncio.TimeoutError:
+                    pass
+            entry = [now, tokens]
+            self._window.append(entry)
+            self.in_flight += 1
+            self.requests += 1
+        self.queue_waits.append((time.perf_counter() - start) * 1000)
+        return entry
+
+    async def release(self, entry, status, actual_tokens=None, retry_after=None):
+        async with self.condition:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                # 見込みを実際の消費量に置き換える
+                entry[1] = actual_tokens
+                self.tokens += actual_tokens
+            if status in RETRY_STATUSES:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif status < 400:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.min_limit = min(self.min_limit, self.limit)
+            self.max_limit = max(self.max_limit, self.limit)
+            self.condition.notify_all()
+
+    def get_summary(self):
+        waits = self.queue_waits
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "backoff_ms": self.backoff_ms,
+            "tokens": self.tokens,
+            "avg_queue_wait_ms": sum(waits) / len(waits) if waits else 0.0,
+            "max_queue_wait_ms": max(waits, default=0.0),
+            "concurrency": self.limit,
+            "min_concurrency": self.min_limit,
+            "max_concurrency": self.max_limit,
+        }
+
+
+class RateLimiter:
+    """Process-wide limiter for model requests, shared by the runners' HTTP clients.
+
+    Requests are queued per deployment until they fit its TPM/RPM quota and
+    adaptive in-flight limit. Throttled responses (429/503) are retried
+    after Retry-After, or an exponential backoff, plus jitter; the response
+    is passed on to the SDK only once the retries are used up, so clients
+    using ``http_client()`` should be created with ``max_retries=0``.
+    """
+
+    def __init__(self, quotas=None, default_quota=None, retry=None, initial_concurrency=4, max_concurrency=32):
+        self.quotas = quotas or {}
+        self.default_quota = default_quota or Quota()
+        self.retry = retry or RetryPolicy()
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.deployments = {}
+
+    def deployment(self, name):
+        if name not in self.deployments:
+            self.deployments[name] = DeploymentLimiter(
+                name, self.quotas.get(name, self.default_quota), self.initial_concurrency, self.max_concurrency
+            )
+        return self.deployments[name]
+
+    def backoff_s(self, attempt, retry_after=None):
+        delay = retry_after if retry_after is not None else min(
+            self.retry.max_delay_s, self.retry.base_delay_s * 2 ** attempt
+        )
+        return delay + random.uniform(0, delay * self.retry.jitter)
+
+    async def send(self, request, transport):
+        raw = await request.aread()
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        limiter = self.deployment(deployment_of(request, body))
+        tokens = estimate_request_tokens(raw, body)
+
+        for attempt in range(self.retry.max_retries + 1):
+            entry = await limiter.acquire(tokens)
+            try:
+                response = await transport.handle_async_request(request)
+            except BaseException:
+                await limiter.release(entry, 599)
+                raise
+            if response.status_code not in RETRY_STATUSES:
+                content = await response.aread()
+                await limiter.release(entry, response.status_code, response_tokens(content))
+                return response
+            wait_s = retry_after_s(response)
+            await response.aread()
+            await response.aclose()
+            await limiter.release(entry, response.status_code, 0, wait_s)
+            if attempt == self.retry.max_retries:
+                return response
+            limiter.retries += 1
+            delay = self.backoff_s(attempt, wait_s)
+            limiter.backoff_ms += delay * 1000
+            print(f"\t{limiter.name}: {response.status_code} を受けたため {delay:.1f}秒後に再試行します "
+                  f"(同時実行上限 {limiter.limit:.1f})")
+            await asyncio.sleep(delay)
+
+    def http_client(self, cassette=None, **kwargs):
+        """An httpx.AsyncClient whose requests go through this limiter (behind ``cassette`` if given)."""
+        transport = RateLimitedTransport(self)
+        if cassette:
+            return cassette.http_client(transport=transport, **kwargs)
+        return httpx.AsyncClient(transport=transport, **kwargs)
+
+    def get_summary(self):
+        return {name: limiter.get_summary() for name, limiter in self.deployments.items()}
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that sends requests through a RateLimiter."""
+
+    def __init__(self, limiter, transport=None):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        return await self.limiter.send(request, self.transport)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """The limiter shared by every model client in this process."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def set_rate_limiter(limiter):
+    """Replace the shared limiter, e.g. to configure per-deployment quotas before any task starts."""
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+def print_rate_limit_summary(summary):
+    for name, stats in summary.items():
+        print(f"レート制限 ({name}): {stats['requests']}件, 429/503 {stats['throttled']}回 (再試行 {stats['retries']}回, "
+              f"待機 {stats['backoff_ms'] / 1000:.1f}秒), 平均待ち {stats['avg_queue_wait_ms']:.0f}ms (最大 {stats['max_queue_wait_ms']:.0f}ms), "
+              f"同時実行 {stats['concurrency']:.1f} (範囲 {stats['min_concurrency']:.1f}-{stats['max_concurrency']:.1f})")
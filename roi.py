@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+
+from usage import estimate_image_tokens
+
+
+@dataclass
+class RoiConfig:
+    """Sizes for region-of-interest mode: a downscaled overview plus a full-resolution crop."""
+    overview_scale: float = 0.35  # 操作座標の基準になる全体画像の縮小率 (1440x1080 なら 504x378 で 512px のタイル 1 枚に収まる)
+    crop_width: int = 640
+    crop_height: int = 400
+    max_changed_fraction: float = 0.5  # これより広い変化領域は ROI にしない (ページ遷移など)
+
+    def __post_init__(self):
+        if not 0 < self.overview_scale <= 1.0:
+            raise ValueError(f"Overview scale must be in (0, 1]: {self.overview_scale}")
+
+
+class RoiCropper:
+    """Choose and capture the full-resolution crop sent next to the overview frame.
+
+    The crop covers the region that changed since the previous frame when it
+    is small enough, otherwise the area around the last action's
+    coordinates. The model keeps acting in overview coordinates, so actions
+    are mapped back to the viewport by the frame encoder's scale as usual.
+    The summary compares the estimated image tokens of overview plus crops
+    with sending every overview frame at full resolution instead.
+    """
+
+    def __init__(self, frame_encoder, change_detector=None, config=None):
+        self.frame_encoder = frame_encoder
+        self.change_detector = change_detector
+        self.config = config or RoiConfig()
+        self.last_point = None
+        self.crops = 0
+        self.total_bytes = 0
+        self.steps = 0
+        self.overview_tokens = 0
+        self.crop_tokens = 0
+
+    def note_action(self, action):
+        """Remember where the model last acted, in viewport coordinates."""
+        if hasattr(action, "x") and hasattr(action, "y"):
+            self.last_point = self.frame_encoder.to_viewport(action.x, action.y)
+
+    def note_frame(self, frame):
+        """Count an overview frame sent to the model."""
+        self.steps += 1
+        self.overview_tokens += estimate_image_tokens(frame.width, frame.height)
+
+    def reset(self):
+        self.last_point = None
+
+    def _clamp(self, center_x, center_y, width, height):
+        width = min(width, self.frame_encoder.display_width)
+        height = min(height, self.frame_encoder.display_height)
+        x = min(max(0, round(center_x - width / 2)), self.frame_encoder.display_width - width)
+        y = min(max(0, round(center_y - height / 2)), self.frame_encoder.display_height - height)
+        return x, y, width, height
+
+    def region(self):
+        """The crop rectangle (x, y, width, height) in viewport pixels, or None."""
+        changed = self.change_detector.changed_region if self.change_detector else None
+        if changed:
+            x0, y0, x1, y1 = changed
+            area = (x1 - x0) * (y1 - y0)
+            if area <= self.config.max_changed_fraction * self.frame_encoder.display_width * self.frame_encoder.display_height:
+                return self._clamp((x0 + x1) / 2, (y0 + y1) / 2,
+                                   max(self.config.crop_width, x1 - x0), max(self.config.crop_height, y1 - y0))
+        if self.last_point:
+            return self._clamp(*self.last_point, self.config.crop_width, self.config.crop_height)
+        return None
+
+    async def capture(self, page):
+        """Capture the crop, returning ``(frame, region)`` or None when there is no region of interest."""
+        region = self.region()
+        if region is None:
+            return None
+        try:
+            frame = await self.frame_encoder.capture_region(page, region)
+        except Exception as e:
+            print(f"ROI crop failed: {e}")
+            return None
+        self.crops += 1
+        self.total_bytes += frame.byte_size
+        self.crop_tokens += estimate_image_tokens(frame.width, frame.height)
+        return frame, region
+
+    def describe(self, region):
+        """Text telling the model where the crop sits, in overview coordinates."""
+        x, y, width, height = region
+        scale = self.frame_encoder.coordinate_scale
+        x0, y0 = round(x * scale), round(y * scale)
+        x1, y1 = round((x + width) * scale), round((y + height) * scale)
+        return (f"次の画像はスクリーンショットの ({x0}, {y0})-({x1}, {y1}) の範囲を原寸で切り出したものです。"
+                "細部の確認に使い、操作の座標は必ずスクリーンショット全体の座標で指定してください。")
+
+    def get_summary(self):
+        full_frame_tokens = self.steps * estimate_image_tokens(self.frame_encoder.display_width,
+                                                               self.frame_encoder.display_height)
+        return {
+            "overview_scale": self.frame_encoder.scale,
+            "crops": self.crops,
+            "total_crop_bytes": self.total_bytes,
+            "overview_tokens": self.overview_tokens,
+            "crop_tokens": self.crop_tokens,
+            "full_frame_tokens": full_frame_tokens,
+            # 1 を超えたら、原寸の全体画像を送るより高くついている
+            "token_ratio": (self.overview_tokens + self.crop_tokens) / full_frame_tokens if full_frame_tokens else 0.0,
+        }
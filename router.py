@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from urllib.parse import urlsplit
+
+from confirmation import is_final_answer
+from events import ActionExecuted, ModelMessage, ScreenshotCaptured, StepStarted, TaskFinished
+
+# 安い順 (DOM / アクセシビリティベース → スクリーンショットベース)
+ENGINE_LADDER = ("playwright_mcp", "browser_use", "computer_use")
+# 履歴がないときの 1 タスクあたりの消費トークンの目安
+ENGINE_TOKEN_PRIORS = {"playwright_mcp": 40_000, "browser_use": 60_000, "computer_use": 200_000}
+URL_IN_TEXT = re.compile(r"https?://[^\s)」]+")
+MAX_HANDOFF_STEPS = 20
+
+
+@dataclass
+class RouteBudget:
+    """Limits for one engine attempt; an attempt that exceeds them is stopped and escalated."""
+    max_steps: int = 30
+    timeout_s: float = 300
+    stall_s: float = 120  # この時間イベントが来なければ止まっているとみなす
+
+
+def task_site(task_description, initial_url=None):
+    """Host used to group routing statistics: the initial URL's, else the first URL in the task."""
+    url = initial_url
+    if not url:
+        match = URL_IN_TEXT.search(task_description)
+        url = match.group(0) if match else None
+    return (urlsplit(url).hostname or "unknown") if url else "unknown"
+
+
+def stream_engine(engine, task_description, initial_url=None, **kwargs):
+    """Start ``stream_browser_task`` of an engine; engines are imported on first use."""
+    if engine == "computer_use":
+        from exe_computer_use import stream_browser_task
+        if initial_url:
+            kwargs["initial_url"] = initial_url
+    elif engine == "browser_use":
+        from exe_browser_use import stream_browser_task
+    elif engine == "playwright_mcp":
+        from exe_playwright_mcp import stream_browser_task
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    if initial_url and engine != "computer_use":
+        task_description = f"最初に {initial_url} を開いてください。\n{task_description}"
+    return stream_browser_task(task_description, **kwargs)
+
+
+def task_answer(result):
+    """The answer in an engine's result dict, or None unless the engine finished the task.
+
+    computer-use returns a list of messages and says whether it completed;
+    for the other engines the answer must read as final (no question or
+    failure report, see ``is_final_answer``).
+    """
+    if not result or result.get("error") or result.get("completed") is False:
+        return None
+    answer = result.get("result")
+    if answer is None and result.get("results"):
+        answer = "\n".join(result["results"])
+    if not answer or ("completed" not in result and not is_final_answer(str(answer))):
+        return None
+    return answer
+
+
+def handoff_task(task_description, engine, url, progress):
+    """Task text for the next engine, carrying the URL reached and the steps already done."""
+    lines = [task_description, "", f"(前のエージェント {engine} はこのタスクを完了できませんでした。"]
+    if url:
+        lines.append(f"最後に開いていたページ: {url}")
+    if progress:
+        lines.append("前のエージェントが実行済みの操作と得られた情報:")
+        lines += [f"- {item}" for item in progress[-MAX_HANDOFF_STEPS:]]
+    lines.append("得られた情報は再利用し、必要な操作だけをやり直して最後まで完了してください。)")
+    return "\n".join(lines)
+
+
+class EngineRouter:
+    """Run a task on the cheapest engine likely to succeed and escalate on failure.
+
+    Engines are ordered by expected tokens per success for the task's site:
+    the average tokens of past attempts (or ENGINE_TOKEN_PRIORS) divided by
+    a smoothed success rate. Each attempt is streamed under a RouteBudget;
+    when it fails, stalls or runs out of budget the next engine gets the
+    task with the URL and progress so far. Per-site, per-engine statistics
+    are kept in ``directory``/stats.json and every decision is appended to
+    ``directory``/decisions.jsonl.
+    """
+
+    def __init__(self, directory=".router", engines=ENGINE_LADDER, budget=None, engine_kwargs=None):
+        self.directory = directory
+        self.engines = tuple(engines)
+        self.budget = budget or RouteBudget()
+        self.engine_kwargs = engine_kwargs or {}
+        self.stats_path = os.path.join(directory, "stats.json")
+        self.decisions_path = os.path.join(directory, "decisions.jsonl")
+        os.makedirs(directory, exist_ok=True)
+        self.stats = {}
+        if os.path.exists(self.stats_path):
+            with open(self.stats_path, encoding="utf-8") as f:
+                self.stats = json.load(f)
+        self.routed = 0
+        self.escalations = 0
+        self.tokens_spent = 0
+
+    def _engine_stats(self, site, engine):
+        return self.stats.setdefault(site, {}).setdefault(engine, {
+            "attempts": 0, "successes": 0, "total_tokens": 0, "token_samples": 0, "total_time_s": 0.0,
+        })
+
+    def success_rate(self, site, engine):
+        stats = self.stats.get(site, {}).get(engine)
+        if not stats:
+            return 0.5
+        # 試行が少ないうちに 0% / 100% と決めつけないよう、1 勝 1 敗を足して平滑化する
+        return (stats["successes"] + 1) / (stats["attempts"] + 2)
+
+    def expected_cost(self, site, engine):
+        """Expected tokens to get one success from ``engine`` on ``site``."""
+        stats = self.stats.get(site, {}).get(engine)
+        if stats and stats["token_samples"]:
+            tokens = stats["total_tokens"] / stats["token_samples"]
+        else:
+            tokens = ENGINE_TOKEN_PRIORS.get(engine, max(ENGINE_TOKEN_PRIORS.values()))
+        return tokens / self.success_rate(site, engine)
+
+    def plan(self, site):
+        """Engines to try for ``site``, cheapest expected cost first."""
+        return sorted(self.engines, key=lambda engine: self.expected_cost(site, engine))
+
+    async def _attempt(self, engine, task_description, initial_url, task_id):
+        """Stream one engine under the budget; returns (outcome, result, url, progress, steps, elapsed_s)."""
+        start = time.perf_counter()
+        deadline = start + self.budget.timeout_s
+        url, progress, steps = initial_url, [], 0
+        outcome, result, events = "failed", None, None
+        try:
+            events = stream_engine(engine, task_description, initial_url, task_id=task_id,
+                                   **self.engine_kwargs.get(engine, {}))
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    outcome = "timeout"
+                    break
+                try:
+                    event = await asyncio.wait_for(anext(events), min(self.budget.stall_s, remaining))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    outcome = "timeout" if time.perf_counter() >= deadline else "stalled"
+                    break
+                if isinstance(event, StepStarted):
+                    steps = event.step or steps + 1
+                    if steps > self.budget.max_steps:
+                        outcome = "step_budget"
+                        break
+                elif isinstance(event, ActionExecuted):
+                    if event.url:
+                        url = event.url
+                    if not event.error:
+                        progress.append(event.description or event.action_type)
+                elif isinstance(event, ScreenshotCaptured) and event.url:
+                    url = event.url
+                elif isinstance(event, ModelMessage) and not event.reasoning:
+                    progress.append(f"回答: {event.text}")
+                elif isinstance(event, TaskFinished):
+                    result = event.result
+                    outcome = "success" if task_answer(result) else "failed"
+        except Exception as e:
+            # エンジンが使えない (依存関係がない等) 場合も次のエンジンに回す
+            print(f"{engine} でエラーが発生しました: {e}")
+            outcome = "error"
+        finally:
+            # 予算切れで抜けた場合はここでタスクがキャンセルされ、ブラウザも閉じられる
+            if events is not None:
+                await events.aclose()
+        return outcome, result, url, progress, steps, time.perf_counter() - start
+
+    def _record(self, site, engine, outcome, result, elapsed_s):
+        stats = self._engine_stats(site, engine)
+        stats["attempts"] += 1
+        stats["successes"] += outcome == "success"
+        stats["total_time_s"] += elapsed_s
+        tokens = result.get("token_usage", {}).get("total_tokens") if result else None
+        if tokens is not None:
+            stats["total_tokens"] += tokens
+            stats["token_samples"] += 1
+            self.tokens_spent += tokens
+        tmp_path = self.stats_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stats, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.stats_path)
+        return tokens
+
+    def _log_decision(self, decision):
+        with open(self.decisions_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+    async def route(self, task_description, initial_url=None, task_id="task"):
+        """Run a task with escalation; returns the winning result and every attempt made."""
+        start_time = time.time()
+        site = task_site(task_description, initial_url)
+        plan = self.plan(site)
+        self.routed += 1
+        print(f"エンジン選択 ({site}): " + " → ".join(
+            f"{engine} (期待コスト {self.expected_cost(site, engine):,.0f})" for engine in plan))
+
+        attempts, result, description, url, progress_so_far = [], None, task_description, initial_url, []
+        for index, engine in enumerate(plan):
+            if index:
+                self.escalations += 1
+                print(f"{plan[index - 1]} から {engine} にエスカレーションします")
+            outcome, engine_result, url, progress, steps, elapsed_s = await self._attempt(engine, description, url, task_id)
+            tokens = self._record(site, engine, outcome, engine_result, elapsed_s)
+            attempt = {"engine": engine, "outcome": outcome, "steps": steps, "elapsed_s": elapsed_s,
+                       "tokens": tokens, "url": url}
+            attempts.append(attempt)
+            self._log_decision({"task_id": task_id, "site": site, "plan": plan, "attempt": index + 1,
+                                "timestamp": time.time(), "budget": asdict(self.budget), **attempt})
+            print(f"  - {engine}: {outcome} ({steps}ステップ, {elapsed_s:.1f}秒)")
+            if outcome == "success":
+                result = engine_result
+                break
+            progress_so_far += progress
+            description = handoff_task(task_description, engine, url, progress_so_far)
+
+        return {
+            "site": site,
+            "engine": attempts[-1]["engine"] if result else None,
+            "answer": task_answer(result),
+            "result": result,
+            "attempts": attempts,
+            "execution_time": time.time() - start_time,
+        }
+
+    def get_summary(self):
+        return {
+            "routed": self.routed,
+            "escalations": self.escalations,
+            "tokens_spent": self.tokens_spent,
+            "sites": {
+                site: {
+                    engine: {**stats, "success_rate": stats["successes"] / stats["attempts"] if stats["attempts"] else 0.0}
+                    for engine, stats in engines.items()
+                }
+                for site, engines in self.stats.items()
+            },
+        }
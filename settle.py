@@ -0,0 +1,171 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+from tracing import span
+
+# 各ドキュメントに注入し、最後の DOM 変更時刻を記録する
+SETTLE_SCRIPT = """
+(() => {
+  if (window.__browsingAgentsSettle) return;
+  const state = { lastMutation: performance.now() };
+  window.__browsingAgentsSettle = state;
+  const observe = () => new MutationObserver(() => { state.lastMutation = performance.now(); })
+    .observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+  if (document.documentElement) observe();
+  else document.addEventListener("DOMContentLoaded", observe, { once: true });
+})();
+"""
+
+DOM_QUIET_EXPRESSION = """
+() => window.__browsingAgentsSettle
+  ? performance.now() - window.__browsingAgentsSettle.lastMutation
+  : null
+"""
+
+
+async def install_settle_script(context):
+    """Install the DOM mutation observer on a new browser context and the pages it already has.
+
+    Init scripts cannot be removed, so this runs once when the context is
+    created, not on every lease of a pooled context.
+    """
+    await context.add_init_script(SETTLE_SCRIPT)
+    for page in context.pages:
+        try:
+            await page.evaluate(SETTLE_SCRIPT)
+        except Exception:
+            pass
+
+
+@dataclass
+class SettleConfig:
+    """Thresholds for deciding that a page has settled after an action."""
+    quiet_ms: int = 300  # DOM とネットワークの両方がこの時間静かなら完了
+    min_ms: int = 50  # ナビゲーション開始前に完了と判定しないための最小待ち時間
+    timeout_ms: int = 5000  # 上限
+    poll_ms: int = 50
+    compare_frames: bool = False  # 連続する2フレームが一致するまで待つ
+    max_inflight: int = 0  # 許容する未完了リクエスト数
+    stale_ms: int = 10000  # これより長く続いているリクエストは数えない (ロングポーリング対策)
+    ignored_resource_types: tuple = ("websocket", "eventsource", "ping")  # 終わらない接続と beacon (ping) は数えない
+
+
+class PageSettler:
+    """Wait until a page is quiet instead of sleeping for a fixed time.
+
+    A page is considered settled when no requests are in flight in its
+    context, no DOM mutation happened for ``quiet_ms`` and, optionally, two
+    consecutive thumbnails are identical. The wait is capped at ``timeout_ms``.
+    Connections that never finish (websockets, event streams, beacons) and
+    requests open for longer than ``stale_ms`` do not count as in flight.
+    """
+
+    def __init__(self, config=None, frame_encoder=None):
+        self.config = config or SettleConfig()
+        self.frame_encoder = frame_encoder
+        self._inflight = {}  # request -> 開始時刻
+        self._last_network_activity = time.perf_counter()
+        self.stats = {}
+
+    def attach(self, context):
+        """Track the network activity of a context set up with ``install_settle_script``."""
+        context.on("request", self._on_request)
+        context.on("requestfinished", self._on_request_done)
+        context.on("requestfailed", self._on_request_done)
+
+    def detach(self, context):
+        """Stop tracking a context, e.g. before it is returned to a pool."""
+        context.remove_listener("request", self._on_request)
+        context.remove_listener("requestfinished", self._on_request_done)
+        context.remove_listener("requestfailed", self._on_request_done)
+
+    def _on_request(self, request):
+        if request.resource_type in self.config.ignored_resource_types:
+            return
+        self._last_network_activity = self._inflight[request] = time.perf_counter()
+
+    def _on_request_done(self, request):
+        if self._inflight.pop(request, None) is not None:
+            self._last_network_activity = time.perf_counter()
+
+    def _inflight_count(self, now):
+        # 完了通知が来ないまま stale_ms を過ぎたリクエストは忘れる (再利用されるコンテキストで溜まらないように)
+        oldest = now - self.config.stale_ms / 1000
+        for request in [request for request, started in self._inflight.items() if started <= oldest]:
+            del self._inflight[request]
+        return len(self._inflight)
+
+    async def _dom_quiet_ms(self, page):
+        try:
+            quiet_ms = await page.evaluate(DOM_QUIET_EXPRESSION)
+            if quiet_ms is None:
+                # 注入前から存在したドキュメント
+                await page.evaluate(SETTLE_SCRIPT)
+                return 0.0
+            return quiet_ms
+        except Exception:
+            # ナビゲーション中は実行コンテキストが破棄される
+            return 0.0
+
+    async def wait(self, page, action_type="action", timeout_ms=None, min_ms=None):
+        """Wait for the page to settle and return the elapsed time in milliseconds.
+
+        ``min_ms`` overrides the configured minimum, e.g. for an explicit wait.
+        """
+        timeout_ms = self.config.timeout_ms if timeout_ms is None else timeout_ms
+        min_ms = self.config.min_ms if min_ms is None else min_ms
+        start = time.perf_counter()
+        with span("settle", action=action_type) as attributes:
+            timed_out = await self._wait_until_quiet(page, start, timeout_ms, min_ms)
+            attributes["timed_out"] = timed_out
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record(action_type, elapsed_ms, timed_out)
+        return elapsed_ms
+
+    async def _wait_until_quiet(self, page, start, timeout_ms, min_ms):
+        """Poll until the page is quiet; returns True if the timeout was hit."""
+        config = self.config
+        deadline = start + timeout_ms / 1000
+        previous_thumbnail = None
+
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(config.poll_ms / 1000)
+            now = time.perf_counter()
+            if (now - start) * 1000 < min_ms:
+                continue
+            if self._inflight_count(now) > config.max_inflight:
+                continue
+            if (now - self._last_network_activity) * 1000 < config.quiet_ms:
+                continue
+            if await self._dom_quiet_ms(page) < config.quiet_ms:
+                continue
+            if config.compare_frames and self.frame_encoder:
+                try:
+                    thumbnail = await self.frame_encoder.thumbnail(page)
+                except Exception:
+                    thumbnail = None
+                if thumbnail is None or thumbnail != previous_thumbnail:
+                    previous_thumbnail = thumbnail
+                    continue
+            return False
+        return True
+
+    def _record(self, action_type, elapsed_ms, timed_out):
+        stats = self.stats.setdefault(action_type, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if timed_out:
+            stats["timeouts"] += 1
+
+    def get_summary(self):
+        return {
+            action_type: {
+                "count": stats["count"],
+                "avg_ms": stats["total_ms"] / stats["count"],
+                "max_ms": stats["max_ms"],
+                "timeouts": stats["timeouts"],
+            }
+            for action_type, stats in self.stats.items()
+        }
@@ -0,0 +1,230 @@
+import copy
+import difflib
+import json
+import re
+
+from autogen_core.model_context import UnboundedChatCompletionContext
+from autogen_core.models import FunctionExecutionResultMessage
+
+from usage import estimate_text_tokens
+
+# Playwright MCP のツール結果に含まれるページ情報とスナップショット
+SNAPSHOT_PATTERN = re.compile(r"- Page Snapshot:?\n```yaml\n(.*?)\n```", re.DOTALL)
+DIFF_PATTERN = re.compile(r"- Page Snapshot \(diff\):?\n```diff\n(.*?)\n```", re.DOTALL)
+URL_PATTERN = re.compile(r"- Page URL: (\S+)")
+TITLE_PATTERN = re.compile(r"- Page Title: (.*)")
+UNCHANGED_DIFF = "(変更なし)"
+PRUNED_SNAPSHOT = "- Page Snapshot: (古いスナップショットは省略されました。最新のスナップショットを参照してください)"
+# 予算超過時に最初に落とすランドマーク (フッター・補足情報)
+LOW_PRIORITY_ROLES = ("contentinfo", "complementary")
+MAX_LINE_CHARS = 200
+
+
+def trim_snapshot(snapshot, token_budget):
+    """Shrink a YAML accessibility snapshot to roughly ``token_budget`` tokens.
+
+    Footer and sidebar landmarks are dropped first, then long text lines are
+    shortened, and finally the tail is cut with a note.
+    """
+    if estimate_text_tokens(snapshot) <= token_budget:
+        return snapshot
+    lines = snapshot.split("\n")
+    kept, skip_indent = [], None
+    for line in lines:
+        indent = len(line) - len(line.lstrip())
+        if skip_indent is not None and indent > skip_indent:
+            continue
+        skip_indent = None
+        if line.lstrip().startswith(tuple(f"- {role}" for role in LOW_PRIORITY_ROLES)):
+            skip_indent = indent
+            continue
+        kept.append(line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "…")
+
+    result, used = [], 0
+    for index, line in enumerate(kept):
+        used += estimate_text_tokens(line) + 1
+        if used > token_budget:
+            result.append(f"# ... {len(kept) - index} 行省略 (全体は browser_snapshot で取得できます)")
+            break
+        result.append(line)
+    return "\n".join(result)
+
+
+def snapshot_diff(previous, current):
+    """Changed lines of ``current`` against ``previous`` in unified diff form, with one line of context."""
+    return "\n".join(
+        line for line in difflib.unified_diff(previous.split("\n"), current.split("\n"), lineterm="", n=1)
+        if not line.startswith(("---", "+++"))
+    )
+
+
+class SnapshotMiddleware:
+    """Shrink the page snapshots Playwright MCP tools return before the agent sees them.
+
+    A snapshot of the same URL is sent as a diff against the last full one
+    (the base) while the diff stays below ``diff_ratio`` of the full size.
+    Full snapshots above ``token_budget`` are trimmed, except for explicit
+    ``browser_snapshot`` calls. Use ``model_context()`` so older snapshots are
+    dropped from the history replayed on each turn.
+    """
+
+    def __init__(self, token_budget=6000, diff_ratio=0.5):
+        self.token_budget = token_budget
+        self.diff_ratio = diff_ratio
+        self._base = None
+        self._base_url = None
+        self.diffs = 0
+        self.trims = 0
+        self.turns = []
+
+    def wrap(self, tools):
+        """Return copies of the MCP tool adapters whose results pass through this middleware."""
+        wrapped = []
+        for tool in tools:
+            # プールのアダプターを書き換えないよう、セッションを共有したコピーに差し込む
+            tool = copy.copy(tool)
+            tool.return_value_as_string = self._wrap_result(tool.name, tool.return_value_as_string)
+            wrapped.append(tool)
+        return wrapped
+
+    def _wrap_result(self, tool_name, to_string):
+        def return_value_as_string(value):
+            if isinstance(value, list):
+                value = [self._process_item(tool_name, item) for item in value]
+            return to_string(value)
+        return return_value_as_string
+
+    def _process_item(self, tool_name, item):
+        text = getattr(item, "text", None)
+        if not text:
+            return item
+        processed = self.process_text(tool_name, text)
+        return item if processed is text else item.model_copy(update={"text": processed})
+
+    def process_text(self, tool_name, text):
+        """Replace the snapshot in one tool result with a diff or a trimmed version."""
+        match = SNAPSHOT_PATTERN.search(text)
+        if not match:
+            return text
+        snapshot = match.group(1)
+        url_match = URL_PATTERN.search(text)
+        url = url_match.group(1) if url_match else None
+        original_tokens = estimate_text_tokens(text)
+
+        explicit = tool_name == "browser_snapshot"
+        trimmed = snapshot if explicit else trim_snapshot(snapshot, self.token_budget)
+        if not explicit and self._base is not None and url == self._base_url:
+            # 差分はモデルが実際に見たもの (縮小後) 同士で取る
+            diff = snapshot_diff(self._base, trimmed)
+            if estimate_text_tokens(diff) <= self.diff_ratio * estimate_text_tokens(trimmed):
+                self.diffs += 1
+                replacement = f"- Page Snapshot (diff):\n```diff\n{diff or UNCHANGED_DIFF}\n```"
+                return self._record(tool_name, text, text[:match.start()] + replacement + text[match.end():], original_tokens)
+
+        self._base, self._base_url = trimmed, url
+        if trimmed != snapshot:
+            self.trims += 1
+            replacement = f"- Page Snapshot:\n```yaml\n{trimmed}\n```"
+            return self._record(tool_name, text, text[:match.start()] + replacement + text[match.end():], original_tokens)
+        return self._record(tool_name, text, text, original_tokens)
+
+    def _record(self, tool_name, original, processed, original_tokens):
+        self.turns.append({
+            "tool": tool_name,
+            "original_tokens": original_tokens,
+            "sent_tokens": estimate_text_tokens(processed) if processed is not original else original_tokens,
+            "history_tokens_saved": 0,
+        })
+        return processed
+
+    def record_history_savings(self, tokens):
+        """Attribute tokens dropped from the replayed history to the latest tool turn."""
+        if self.turns:
+            self.turns[-1]["history_tokens_saved"] += tokens
+
+    def model_context(self):
+        return SnapshotPruningContext(self)
+
+    def get_summary(self):
+        result_saved = sum(turn["original_tokens"] - turn["sent_tokens"] for turn in self.turns)
+        history_saved = sum(turn["history_tokens_saved"] for turn in self.turns)
+        return {
+            "snapshots": len(self.turns),
+            "diffs": self.diffs,
+            "trims": self.trims,
+            "result_tokens_saved": result_saved,
+            "history_tokens_saved": history_saved,
+            "tokens_saved": result_saved + history_saved,
+            "turns": self.turns,
+        }
+
+
+def _prune_result(content, keep):
+    """Strip snapshot blocks from a serialized tool result unless ``keep`` is true."""
+    if keep:
+        return content
+    pruned = SNAPSHOT_PATTERN.sub(PRUNED_SNAPSHOT, content)
+    pruned = DIFF_PATTERN.sub(PRUNED_SNAPSHOT, pruned)
+    if pruned != content:
+        return pruned
+    # MCP アダプターは結果を JSON 配列として文字列化するので、その中のテキストも見る
+    try:
+        items = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(items, list):
+        return content
+    changed = False
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("text"), str):
+            text = DIFF_PATTERN.sub(PRUNED_SNAPSHOT, SNAPSHOT_PATTERN.sub(PRUNED_SNAPSHOT, item["text"]))
+            changed = changed or text != item["text"]
+            item["text"] = text
+    return json.dumps(items, ensure_ascii=False) if changed else content
+
+
+def _snapshot_kind(content):
+    """'full', 'diff' or None for a serialized tool result."""
+    if "Page Snapshot (diff)" in content:
+        return "diff"
+    if "Page Snapshot" in content and "```yaml" in content:
+        return "full"
+    return None
+
+
+class SnapshotPruningContext(UnboundedChatCompletionContext):
+    """Model context that keeps only the latest full snapshot and the latest diff on top of it."""
+
+    def __init__(self, middleware, initial_messages=None):
+        super().__init__(initial_messages)
+        self.middleware = middleware
+
+    async def get_messages(self):
+        messages = await super().get_messages()
+        results = [
+            (message_index, result_index, _snapshot_kind(result.content))
+            for message_index, message in enumerate(messages)
+            if isinstance(message, FunctionExecutionResultMessage)
+            for result_index, result in enumerate(message.content)
+        ]
+        full = [position[:2] for position in results if position[2] == "full"]
+        base = full[-1] if full else None
+        diffs = [position[:2] for position in results if position[2] == "diff" and (base is None or position[:2] > base)]
+        keep = {base, diffs[-1] if diffs else None}
+
+        pruned_messages, saved = [], 0
+        for message_index, message in enumerate(messages):
+            if not isinstance(message, FunctionExecutionResultMessage):
+                pruned_messages.append(message)
+                continue
+            new_results = []
+            for result_index, result in enumerate(message.content):
+                content = _prune_result(result.content, (message_index, result_index) in keep)
+                if content is not result.content:
+                    saved += estimate_text_tokens(result.content) - estimate_text_tokens(content)
+                    result = result.model_copy(update={"content": content})
+                new_results.append(result)
+            pruned_messages.append(message.model_copy(update={"content": new_results}))
+        if saved:
+            self.middleware.record_history_savings(saved)
+        return pruned_messages
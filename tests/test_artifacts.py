@@ -0,0 +1,88 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from artifacts import ArtifactEvictedError, ArtifactStore
+
+KB = 1024
+
+
+def frame(n, size=KB):
+    """Distinct stand-in screenshot bytes."""
+    return n.to_bytes(4, "big") * (size // 4)
+
+
+class ArtifactStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def store(self, memory_cap=3 * KB, ring_size=4):
+        return ArtifactStore("task/1", self.directory.name, memory_cap=memory_cap, ring_size=ring_size)
+
+    def test_identical_content_is_stored_once(self):
+        store = self.store()
+        key = store.put(frame(1), "image/png")
+        self.assertEqual(store.put(frame(1), "image/png"), key)
+        self.assertEqual(store.memory_bytes, KB)
+        self.assertEqual(store.stats["dedup_hits"], 1)
+
+    def test_least_recently_used_entries_spill_to_disk(self):
+        store = self.store()
+        keys = [store.put(frame(n), "image/png") for n in range(5)]
+        summary = store.get_summary()
+        self.assertEqual((summary["in_memory"], summary["on_disk"], summary["spills"]), (3, 2, 2))
+        self.assertEqual(store.get(keys[0]), frame(0))
+        self.assertEqual(store.stats["disk_reads"], 1)
+        self.assertEqual(sorted(os.listdir(store.path)), ["0000.png", "0001.png"])
+
+    def test_ring_buffer_overwrites_the_oldest_spilled_entry(self):
+        store = self.store(memory_cap=KB, ring_size=2)
+        keys = [store.put(frame(n), "image/jpeg") for n in range(4)]
+        self.assertNotIn(keys[0], store)
+        with self.assertRaises(ArtifactEvictedError):
+            store.get(keys[0])
+        self.assertEqual(store.get(keys[1]), frame(1))
+        self.assertEqual(store.stats["evictions"], 1)
+        self.assertEqual(len(os.listdir(store.path)), 2)
+        # 破棄された内容をもう一度保存すると、新しいキーで保存し直す
+        self.assertNotEqual(store.put(frame(0), "image/jpeg"), keys[0])
+
+    def test_close_removes_the_ring_buffer_directory(self):
+        store = self.store(memory_cap=KB)
+        for n in range(3):
+            store.put(frame(n))
+        self.assertTrue(os.path.isdir(store.path))
+        store.close()
+        self.assertFalse(os.path.exists(store.path))
+        self.assertEqual(store.get_summary()["memory_bytes"], 0)
+
+    def test_memory_stays_within_the_cap(self):
+        memory_cap = 256 * KB
+        store = self.store(memory_cap=memory_cap, ring_size=16)
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            for n in range(100):
+                store.put(frame(n, 16 * KB + n * 64))
+            held, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(store.peak_memory_bytes, memory_cap)
+        # 退避したフレームの参照がどこにも残っていないこと (索引などの分として 64KB まで許容する)
+        self.assertLess(held - baseline, memory_cap + 64 * KB)
+        self.assertEqual(store.get_summary()["on_disk"], 16)
+
+    def test_an_entry_larger_than_the_cap_stays_in_memory(self):
+        store = self.store(memory_cap=KB)
+        store.put(frame(1))
+        key = store.put(frame(2, 4 * KB))
+        self.assertEqual(store.get(key), frame(2, 4 * KB))
+        self.assertEqual(store.memory_bytes, 4 * KB)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from cassette import Cassette, CassetteMissError
+
+
+def model_network(calls):
+    """Stand-in for the model endpoint that answers with the request's task text."""
+    def handler(request):
+        calls.append(request)
+        task = json.loads(request.content)["input"]
+        return httpx.Response(200, json={"answer": f"answer for {task}"})
+    return httpx.MockTransport(handler)
+
+
+class CassetteTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cassette.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def ask(self, cassette, calls, task):
+        async with cassette.http_client(model_network(calls)) as client:
+            response = await client.post("https://example.invalid/openai/v1/responses", json={"input": task})
+        return response.json()["answer"]
+
+    async def test_auto_records_a_request_that_does_not_match(self):
+        calls = []
+        await self.ask(Cassette(self.path, "record"), calls, "task A")
+
+        cassette = Cassette(self.path, "auto")
+        self.assertEqual(await self.ask(cassette, calls, "task A"), "answer for task A")
+        self.assertEqual(await self.ask(cassette, calls, "task B"), "answer for task B")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cassette.stats["strict"], 1)
+        self.assertEqual(cassette.stats["recorded"], 1)
+        self.assertEqual(cassette.stats["sequential"], 0)
+
+    async def test_replay_raises_on_a_miss(self):
+        await self.ask(Cassette(self.path, "record"), [], "task A")
+        with self.assertRaises(CassetteMissError):
+            await self.ask(Cassette(self.path, "replay"), [], "task B")
+
+    async def test_sequential_matching_is_opt_in_for_replay(self):
+        await self.ask(Cassette(self.path, "record"), [], "task A")
+        cassette = Cassette(self.path, "replay", sequential=True)
+        self.assertEqual(await self.ask(cassette, [], "task A, reworded"), "answer for task A")
+        self.assertEqual(cassette.stats["sequential"], 1)
+        with self.assertRaises(ValueError):
+            Cassette(self.path, "auto", sequential=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
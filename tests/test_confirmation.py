@@ -0,0 +1,96 @@
+import unittest
+
+from confirmation import ConfirmationClassifier, is_confirmation_request, is_final_answer
+
+CONFIRMATION_REQUESTS = [
+    "I have filled in the form. Should I continue and submit it?",
+    "The cart is ready. Do you want me to place the order?",
+    "Would you like me to proceed with the login?",
+    "May I sign in with the provided credentials?",
+    "Is it okay to submit the form now?",
+    "Please confirm whether I should delete the draft.",
+    "Let me know if you want me to send the message.",
+    "Everything is filled in. Ready to submit?",
+    "The next step will log in. Proceed?",
+    "Would you like to continue?",
+    "ログイン情報を入力しました。続行してもよろしいですか？",
+    "フォームを送信しますか？",
+    "この内容で購入してよいですか？",
+    "次のページに進めますか？",
+]
+
+NOT_CONFIRMATION_REQUESTS = [
+    "Let me know if you need anything else.",
+    "Would you like me to search for anything else?",
+    "The forecast is sunny with a high of 24°C. Let me know if you need anything else!",
+    "Is there anything else I can help you with?",
+    "I have submitted the form. Do you need anything else?",
+    "Let me know if you have any other questions.",
+    "Feel free to ask if you need further assistance.",
+    "明日の新宿区は晴れ、最高気温 24℃、最低気温 15℃ です。",
+    "他に何かお手伝いできることはありますか？",
+    "結果は以上です。他にご質問があればどうぞ。",
+    "I searched https://www.bing.com/search?q=weather and found the forecast.",
+    "The page asks 'What is your name?' and I entered the name.",
+    "I couldn't find the requested item on the page.",
+    "The draft was saved and the top trending article was liked.",
+]
+
+
+class IsConfirmationRequestTest(unittest.TestCase):
+    def test_permission_requests_for_a_pending_action(self):
+        for text in CONFIRMATION_REQUESTS:
+            with self.subTest(text=text):
+                self.assertTrue(is_confirmation_request(text))
+
+    def test_answers_and_sign_offs(self):
+        for text in NOT_CONFIRMATION_REQUESTS:
+            with self.subTest(text=text):
+                self.assertFalse(is_confirmation_request(text))
+
+    def test_sign_off_after_a_real_request_still_fires(self):
+        self.assertTrue(is_confirmation_request(
+            "The form is filled in. Should I submit it? Let me know if you need anything else."))
+
+
+class IsFinalAnswerTest(unittest.TestCase):
+    def test_answers_with_or_without_a_sign_off(self):
+        for text in (
+            "The forecast is sunny with a high of 24°C.",
+            "The forecast is sunny with a high of 24°C. Let me know if you need anything else!",
+            "明日の新宿区は晴れ、最高気温 24℃、最低気温 15℃ です。",
+            "I have submitted the form. Do you need anything else?",
+        ):
+            with self.subTest(text=text):
+                self.assertTrue(is_final_answer(text))
+
+    def test_questions_and_failure_reports(self):
+        for text in (
+            "Which Shinjuku do you mean, the ward or the station?",
+            "The form is filled in. Should I submit it?",
+            "I couldn't complete the booking because the site was down.",
+            "I was unable to find the product on this site.",
+            "ページが見つかりませんでした。",
+            "",
+        ):
+            with self.subTest(text=text):
+                self.assertFalse(is_final_answer(text))
+
+
+class ConfirmationClassifierTest(unittest.TestCase):
+    def test_counts_checks_and_continuations(self):
+        classifier = ConfirmationClassifier()
+        self.assertTrue(classifier.check(["Done.", "Should I submit the form?"]))
+        self.assertFalse(classifier.check(["Let me know if you need anything else."]))
+        classifier.record_continuation(3, chained=True)
+        classifier.record_continuation(1, chained=False)
+
+        summary = classifier.get_summary()
+        self.assertEqual((summary["checks"], summary["fired"]), (2, 1))
+        self.assertEqual((summary["chained"], summary["summary_restarts"]), (1, 1))
+        self.assertEqual(summary["steps_preserved"], 4)
+        self.assertEqual(summary["avg_steps_preserved"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import contextlib
+import io
+import unittest
+
+from frames import Frame, FrameChangeDetector, FrameEncoderConfig, changed_cells, signature_difference, thumbnail_signature
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+WIDTH, HEIGHT = 32, 20
+
+
+def thumbnail(box=None, fill=255):
+    """A black thumbnail PNG, with ``box`` (x0, y0, x1, y1) painted in ``fill``."""
+    image = Image.new("L", (WIDTH, HEIGHT), 0)
+    if box:
+        image.paste(fill, box)
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+class FakeEncoder:
+    """Returns the queued thumbnails and records which config each capture used."""
+
+    def __init__(self, thumbnails, display_width=1280):
+        self.thumbnails = list(thumbnails)
+        self.display_width = display_width
+        self.scale = 1.0
+        self.configs = []
+
+    async def thumbnail(self, page, width=None):
+        thumbnail = self.thumbnails.pop(0)
+        if isinstance(thumbnail, Exception):
+            raise thumbnail
+        return thumbnail
+
+    async def capture(self, page, config=None):
+        self.configs.append(config)
+        byte_size = 1000 if config is None else 100
+        return Frame("image/jpeg", 1280, 800, 1.0, 1.0, byte_size, content=b"\0" * byte_size)
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class ChangedCellsTest(unittest.TestCase):
+    def test_signature_is_one_luminance_byte_per_pixel(self):
+        self.assertEqual(len(thumbnail_signature(thumbnail())), WIDTH * HEIGHT)
+
+    def test_bounding_box_of_the_changed_pixels(self):
+        previous = thumbnail_signature(thumbnail())
+        current = thumbnail_signature(thumbnail((4, 2, 10, 6)))
+        self.assertEqual(changed_cells(previous, current, WIDTH), (4, 2, 10, 6))
+
+    def test_differences_below_the_threshold_are_ignored(self):
+        previous = thumbnail_signature(thumbnail())
+        self.assertIsNone(changed_cells(previous, thumbnail_signature(thumbnail((0, 0, 8, 8), fill=20)), WIDTH))
+        self.assertIsNone(changed_cells(previous, previous, WIDTH))
+
+    def test_signatures_of_different_sizes_are_not_compared(self):
+        self.assertIsNone(changed_cells(b"\0" * 4, b"\0" * 8, 2))
+        self.assertEqual(signature_difference(b"\0" * 4, b"\0" * 8), 1.0)
+
+    def test_difference_is_the_mean_over_all_pixels(self):
+        previous = thumbnail_signature(thumbnail())
+        current = thumbnail_signature(thumbnail((0, 0, WIDTH // 2, HEIGHT)))
+        self.assertEqual(signature_difference(previous, current), 0.5)
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class FrameChangeDetectorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_unchanged_frames_are_captured_cheaply_at_the_same_scale(self):
+        encoder = FakeEncoder([thumbnail(), thumbnail(), thumbnail((4, 2, 10, 6))])
+        detector = FrameChangeDetector(encoder)
+        frames = [await detector.capture(None) for _ in range(3)]
+        self.assertEqual([frame.changed for frame in frames], [True, False, True])
+        self.assertEqual(encoder.configs, [None, detector.unchanged_config, None])
+        self.assertEqual(detector.unchanged_config.scale, encoder.scale)
+        summary = detector.get_summary()
+        self.assertEqual((summary["unchanged_frames"], summary["unchanged_bytes"]), (1, 100))
+        self.assertEqual(summary["image_tokens_saved"], 0)
+
+    async def test_the_changed_region_is_in_viewport_coordinates(self):
+        detector = FrameChangeDetector(FakeEncoder([thumbnail(), thumbnail((4, 2, 10, 6))]))
+        await detector.has_changed(None)
+        self.assertTrue(await detector.has_changed(None))
+        # 1 ピクセル = 1280 / 32 = 40 ビューポートピクセル
+        self.assertEqual(detector.changed_region, (160, 80, 400, 240))
+
+    async def test_a_failed_thumbnail_counts_as_a_change(self):
+        detector = FrameChangeDetector(FakeEncoder([thumbnail(), RuntimeError("closed"), thumbnail()]))
+        await detector.has_changed(None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(await detector.has_changed(None))
+        # 失敗後は比較対象がないので変化ありとする
+        self.assertTrue(await detector.has_changed(None))
+
+    async def test_reset_forgets_the_previous_frame(self):
+        detector = FrameChangeDetector(FakeEncoder([thumbnail(), thumbnail()]))
+        await detector.has_changed(None)
+        detector.reset()
+        self.assertTrue(await detector.has_changed(None))
+
+    def test_unchanged_config_must_keep_the_scale(self):
+        with self.assertRaises(ValueError):
+            FrameChangeDetector(FakeEncoder([]), unchanged_config=FrameEncoderConfig(scale=0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+import unittest
+
+from main import build_parser, engine_kwargs
+
+
+def kwargs_for(*argv):
+    return engine_kwargs(build_parser().parse_args(list(argv)))
+
+
+class EngineKwargsTest(unittest.TestCase):
+    def test_snapshot_budget(self):
+        self.assertEqual(kwargs_for("mcp", "task", "--snapshot-budget", "3000")["snapshot_budget"], 3000)
+        # 0 は縮小しない指定として、engine の既定値ではなく None を明示的に渡す
+        self.assertIsNone(kwargs_for("mcp", "task", "--snapshot-budget", "0")["snapshot_budget"])
+        self.assertNotIn("snapshot_budget", kwargs_for("mcp", "task"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+
+from page_tracker import PageTracker
+
+
+class FakeEmitter:
+    def __init__(self):
+        self.listeners = {}
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        self.listeners[event].remove(handler)
+
+    def emit(self, event, *args):
+        for handler in list(self.listeners.get(event, [])):
+            handler(*args)
+
+    def listener_count(self):
+        return sum(len(handlers) for handlers in self.listeners.values())
+
+
+class FakeFrame:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakePage(FakeEmitter):
+    def __init__(self, url="about:blank"):
+        super().__init__()
+        self.main_frame = FakeFrame(url)
+        self.fronted = 0
+
+    @property
+    def url(self):
+        return self.main_frame.url
+
+    def navigate(self, url):
+        self.main_frame.url = url
+        self.emit("framenavigated", self.main_frame)
+
+    def close(self):
+        self.emit("close")
+
+    async def bring_to_front(self):
+        self.fronted += 1
+
+
+class FakeContext(FakeEmitter):
+    def __init__(self, pages=()):
+        super().__init__()
+        self.pages = list(pages)
+
+    def open(self, page, opener=None):
+        self.pages.append(page)
+        self.emit("page", page)
+        if opener:
+            opener.emit("popup", page)
+        return page
+
+
+class PageTrackerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.first = FakePage("https://example.com/")
+        self.context = FakeContext([self.first])
+        self.tracker = PageTracker(commit_timeout_ms=100)
+        self.tracker.attach(self.context)
+
+    def test_existing_pages_start_on_the_stack(self):
+        self.assertEqual(self.tracker.stack, [self.first])
+        self.assertIs(self.tracker.active, self.first)
+
+    def test_a_tab_becomes_active_when_its_first_navigation_commits(self):
+        popup = self.context.open(FakePage(), opener=self.first)
+        self.assertIs(self.tracker.active, self.first)
+        popup.navigate("https://example.com/next")
+        self.assertEqual(self.tracker.stack, [self.first, popup])
+        self.assertEqual(self.tracker.pages_opened, 1)
+
+    def test_a_tab_opened_with_a_url_is_active_at_once(self):
+        page = self.context.open(FakePage("https://example.com/next"))
+        self.assertIs(self.tracker.active, page)
+
+    def test_closing_the_active_tab_returns_to_the_previous_one(self):
+        second = self.context.open(FakePage("https://example.com/2"))
+        third = self.context.open(FakePage("https://example.com/3"))
+        third.close()
+        self.assertIs(self.tracker.active, second)
+        second.close()
+        self.assertIs(self.tracker.active, self.first)
+        self.first.close()
+        self.assertIsNone(self.tracker.active)
+
+    async def test_switch_waits_for_a_pending_tab_to_commit(self):
+        popup = self.context.open(FakePage(), opener=self.first)
+        asyncio.get_running_loop().call_later(0.02, popup.navigate, "https://example.com/next")
+        self.assertIs(await self.tracker.switch(self.first), popup)
+        self.assertEqual(popup.fronted, 1)
+        summary = self.tracker.get_summary()
+        self.assertEqual(summary["switches"], 1)
+        self.assertGreater(summary["max_switch_ms"], 0.0)
+
+    async def test_a_tab_that_stays_blank_is_not_switched_to(self):
+        self.context.open(FakePage(), opener=self.first)
+        self.assertIs(await self.tracker.switch(self.first), self.first)
+        self.assertEqual(self.tracker.get_summary()["switches"], 0)
+
+    async def test_switching_back_to_a_visited_tab_records_no_latency(self):
+        second = self.context.open(FakePage("https://example.com/2"))
+        await self.tracker.switch(self.first)
+        second.close()
+        third = self.context.open(FakePage("https://example.com/3"))
+        await self.tracker.switch(self.first)
+        third.close()
+        self.assertIs(await self.tracker.switch(third), self.first)
+        self.assertEqual(self.tracker.switches, 3)
+        self.assertEqual(len(self.tracker.switch_latencies), 2)
+
+    def test_detach_removes_every_listener(self):
+        popup = self.context.open(FakePage(), opener=self.first)
+        self.tracker.detach(self.context)
+        for emitter in (self.context, self.first, popup):
+            self.assertEqual(emitter.listener_count(), 0)
+        popup.navigate("https://example.com/next")
+        self.assertIs(self.tracker.active, self.first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import io
+import json
+import unittest
+
+import httpx
+from openai import AsyncOpenAI
+
+from ratelimit import DEFAULT_MAX_OUTPUT_TOKENS, RateLimitedTransport, RateLimiter, RetryPolicy, estimate_request_tokens
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FAST_RETRY = RetryPolicy(max_retries=2, base_delay_s=0.01, max_delay_s=0.05, jitter=0.0)
+
+
+def throttled_deployment(calls, throttled_calls):
+    """Stand-in for an Azure deployment over its quota for the first ``throttled_calls`` requests."""
+    def handler(request):
+        calls.append(request)
+        if len(calls) <= throttled_calls:
+            return httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": {"code": "429"}})
+        return httpx.Response(200, json={"id": "resp_1", "object": "response", "model": "gpt-4.1", "output": [],
+                                         "usage": {"input_tokens": 10, "output_tokens": 5}})
+    return httpx.MockTransport(handler)
+
+
+def limited_client(limiter, network):
+    return httpx.AsyncClient(transport=RateLimitedTransport(limiter, network))
+
+
+async def post(client, model="gpt-4.1"):
+    return await client.post("https://example.invalid/openai/v1/responses", json={"model": model, "input": "task"})
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_throttled_requests_after_retry_after(self):
+        calls = []
+        limiter = RateLimiter(retry=FAST_RETRY, initial_concurrency=4)
+        async with limited_client(limiter, throttled_deployment(calls, 2)) as client:
+            response = await post(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 3)
+        stats = limiter.get_summary()["gpt-4.1"]
+        self.assertEqual(stats["throttled"], 2)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["tokens"], 15)
+        self.assertEqual(stats["min_concurrency"], 1.0)
+
+    async def test_returns_the_throttled_response_once_retries_are_used_up(self):
+        calls = []
+        limiter = RateLimiter(retry=FAST_RETRY)
+        async with limited_client(limiter, throttled_deployment(calls, 10)) as client:
+            response = await post(client)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(calls), FAST_RETRY.max_retries + 1)
+
+    async def test_sdk_client_without_its_own_retries(self):
+        calls = []
+        limiter = RateLimiter(retry=FAST_RETRY)
+        client = AsyncOpenAI(base_url="https://example.invalid/openai/v1/", api_key="test", max_retries=0,
+                             http_client=limited_client(limiter, throttled_deployment(calls, 1)))
+        async with client:
+            response = await client.responses.create(model="gpt-4.1", input="task")
+        self.assertEqual(response.id, "resp_1")
+        self.assertEqual(len(calls), 2)
+
+    async def test_in_flight_requests_stay_within_the_concurrency_limit(self):
+        in_flight = []
+        peak = []
+
+        async def handler(request):
+            in_flight.append(request)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(request)
+            return httpx.Response(200, json={"usage": {"total_tokens": 1}})
+
+        limiter = RateLimiter(initial_concurrency=2, max_concurrency=2)
+        async with limited_client(limiter, httpx.MockTransport(handler)) as client:
+            responses = await asyncio.gather(*(post(client) for _ in range(6)))
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(max(peak), 2)
+
+    async def test_deployments_are_limited_separately(self):
+        limiter = RateLimiter(retry=FAST_RETRY)
+        async with limited_client(limiter, throttled_deployment([], 0)) as client:
+            await post(client, "gpt-4.1")
+            await post(client, "gpt-4.1-mini")
+        self.assertEqual(sorted(limiter.get_summary()), ["gpt-4.1", "gpt-4.1-mini"])
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class RequestTokenEstimateTest(unittest.TestCase):
+    def image_tokens(self, width, height, image_format):
+        output = io.BytesIO()
+        Image.new("RGB", (width, height), "white").save(output, image_format)
+        data_url = f"data:image/{image_format.lower()};base64,{base64.b64encode(output.getvalue()).decode('ascii')}"
+        raw = json.dumps({"input": [{"type": "input_image", "image_url": data_url}]}).encode("utf-8")
+        empty = json.dumps({"input": [{"type": "input_image", "image_url": ""}]}).encode("utf-8")
+        return estimate_request_tokens(raw, {}) - estimate_request_tokens(empty, {})
+
+    def test_images_are_reserved_by_their_tile_count(self):
+        self.assertEqual(self.image_tokens(1440, 1080, "JPEG"), 765)
+        self.assertEqual(self.image_tokens(504, 378, "PNG"), 255)
+        self.assertEqual(self.image_tokens(640, 400, "WEBP"), 425)
+
+    def test_expected_output_is_reserved(self):
+        self.assertGreaterEqual(estimate_request_tokens(b"{}", {}), DEFAULT_MAX_OUTPUT_TOKENS)
+
+
+class EventLoopTest(unittest.TestCase):
+    def test_one_limiter_serves_successive_event_loops(self):
+        # asyncio.run() をタスクごとに呼ぶ CLI のように、共有の limiter を別々のループから使う
+        limiter = RateLimiter(retry=FAST_RETRY, initial_concurrency=1, max_concurrency=1)
+
+        async def handler(request):
+            await asyncio.sleep(0.01)  # 2 つ目のリクエストが空きを待つようにする
+            return httpx.Response(200, json={"id": "resp_1", "usage": {"total_tokens": 1}})
+
+        async def run():
+            async with limited_client(limiter, httpx.MockTransport(handler)) as client:
+                responses = await asyncio.gather(post(client), post(client))
+            return [json.loads(response.content)["id"] for response in responses]
+
+        self.assertEqual(asyncio.run(run()), ["resp_1", "resp_1"])
+        self.assertEqual(asyncio.run(run()), ["resp_1", "resp_1"])
+        self.assertEqual(limiter.get_summary()["gpt-4.1"]["requests"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from events import ActionExecuted, StepStarted, TaskFinished
+from router import ENGINE_LADDER, EngineRouter, RouteBudget, task_answer, task_site
+
+
+class TaskAnswerTest(unittest.TestCase):
+    def test_computer_use_needs_the_completion_flag(self):
+        messages = ["Searching for the forecast.", "It will be sunny tomorrow."]
+        self.assertEqual(task_answer({"results": messages, "completed": True, "error": None}), "\n".join(messages))
+        self.assertIsNone(task_answer({"results": ["Which city do you mean?"], "completed": False, "error": None}))
+
+    def test_other_engines_need_a_final_answer(self):
+        self.assertEqual(task_answer({"result": "It will be sunny tomorrow."}), "It will be sunny tomorrow.")
+        self.assertIsNone(task_answer({"result": "I couldn't complete this task."}))
+        self.assertIsNone(task_answer({"result": "Which city do you mean?"}))
+
+    def test_errors_and_empty_results(self):
+        self.assertIsNone(task_answer(None))
+        self.assertIsNone(task_answer({"result": "Sunny.", "error": "TimeoutError: "}))
+        self.assertIsNone(task_answer({"results": [], "completed": True}))
+
+
+def fake_engine(outcomes, calls):
+    """Stand-in for ``stream_engine`` that finishes each engine's task with ``outcomes[engine]``."""
+    async def stream(engine, task_description, initial_url=None, **kwargs):
+        calls.append((engine, task_description))
+        yield StepStarted(step=1)
+        yield ActionExecuted("goto", description=f"{engine} opened the page", url="https://example.com/list")
+        yield TaskFinished({"result": outcomes[engine], "error": None, "token_usage": {"total_tokens": 1000}})
+    return stream
+
+
+class EngineRouterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def router(self, **kwargs):
+        return EngineRouter(self.directory.name, budget=RouteBudget(max_steps=5, timeout_s=5, stall_s=5), **kwargs)
+
+    def test_without_history_the_ladder_order_is_used(self):
+        router = self.router()
+        self.assertEqual(router.plan("example.com"), list(ENGINE_LADDER))
+        self.assertEqual(router.success_rate("example.com", "browser_use"), 0.5)
+
+    def test_success_rates_are_smoothed(self):
+        router = self.router()
+        for outcome in ("success", "success", "failed"):
+            router._record("example.com", "browser_use", outcome, None, 1.0)
+        self.assertEqual(router.success_rate("example.com", "browser_use"), 3 / 5)
+
+    def test_engines_are_ranked_by_tokens_per_success(self):
+        router = self.router()
+        for _ in range(4):
+            router._record("example.com", "playwright_mcp", "failed", {"token_usage": {"total_tokens": 30_000}}, 1.0)
+            router._record("example.com", "browser_use", "success", {"token_usage": {"total_tokens": 60_000}}, 1.0)
+        # 30,000 / (1/6) = 180,000 と 60,000 / (5/6) = 72,000
+        self.assertEqual(router.expected_cost("example.com", "playwright_mcp"), 180_000)
+        self.assertEqual(router.expected_cost("example.com", "browser_use"), 72_000)
+        self.assertEqual(router.plan("example.com"), ["browser_use", "playwright_mcp", "computer_use"])
+        # 他のサイトの統計は使わない
+        self.assertEqual(router.plan("other.example"), list(ENGINE_LADDER))
+
+    def test_statistics_persist_across_routers(self):
+        self.router()._record("example.com", "computer_use", "success", {"token_usage": {"total_tokens": 5}}, 2.0)
+        stats = self.router().stats["example.com"]["computer_use"]
+        self.assertEqual((stats["attempts"], stats["successes"], stats["total_tokens"]), (1, 1, 5))
+
+    async def test_a_failed_attempt_escalates_with_a_handoff(self):
+        calls = []
+        outcomes = {"playwright_mcp": "I couldn't find the price.", "browser_use": "The price is 1,200 yen."}
+        router = self.router(engines=("playwright_mcp", "browser_use"))
+        with mock.patch("router.stream_engine", fake_engine(outcomes, calls)), contextlib.redirect_stdout(io.StringIO()):
+            routed = await router.route("Find the price on https://example.com/", task_id="t1")
+        self.assertEqual(routed["engine"], "browser_use")
+        self.assertEqual(routed["answer"], "The price is 1,200 yen.")
+        self.assertEqual([attempt["outcome"] for attempt in routed["attempts"]], ["failed", "success"])
+        self.assertIn("playwright_mcp opened the page", calls[1][1])
+        self.assertIn("https://example.com/list", calls[1][1])
+        self.assertEqual(router.get_summary()["escalations"], 1)
+        with open(os.path.join(self.directory.name, "decisions.jsonl"), encoding="utf-8") as f:
+            decisions = [json.loads(line) for line in f]
+        self.assertEqual([decision["engine"] for decision in decisions], ["playwright_mcp", "browser_use"])
+
+
+class TaskSiteTest(unittest.TestCase):
+    def test_the_initial_url_wins_over_the_task_text(self):
+        self.assertEqual(task_site("Open https://a.example/x", "https://b.example/"), "b.example")
+        self.assertEqual(task_site("Open https://a.example/x"), "a.example")
+        self.assertEqual(task_site("Find the weather"), "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
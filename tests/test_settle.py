@@ -0,0 +1,133 @@
+import asyncio
+import time
+import unittest
+
+from settle import SETTLE_SCRIPT, PageSettler, SettleConfig
+
+
+class FakeRequest:
+    def __init__(self, resource_type="document"):
+        self.resource_type = resource_type
+
+
+class FakeContext:
+    """Records the listeners a settler adds, like a Playwright BrowserContext."""
+
+    def __init__(self):
+        self.listeners = {}
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        self.listeners[event].remove(handler)
+
+    def emit(self, event, request):
+        for handler in list(self.listeners.get(event, [])):
+            handler(request)
+
+
+class FakePage:
+    """Answers the settle script's query with a fixed DOM quiet time."""
+
+    def __init__(self, quiet_ms=1000):
+        self.quiet_ms = quiet_ms
+        self.scripts = []
+
+    async def evaluate(self, expression):
+        if expression == SETTLE_SCRIPT:
+            self.scripts.append(expression)
+            return None
+        return self.quiet_ms
+
+
+def fast_config(**overrides):
+    values = dict(quiet_ms=20, min_ms=0, timeout_ms=300, poll_ms=5)
+    values.update(overrides)
+    return SettleConfig(**values)
+
+
+class PageSettlerTest(unittest.IsolatedAsyncioTestCase):
+    def settler(self, **overrides):
+        settler = PageSettler(fast_config(**overrides))
+        self.context = FakeContext()
+        settler.attach(self.context)
+        return settler
+
+    async def test_a_quiet_page_settles_after_the_minimum_wait(self):
+        settler = self.settler(min_ms=60)
+        elapsed_ms = await settler.wait(FakePage(), "click")
+        self.assertGreaterEqual(elapsed_ms, 60)
+        self.assertEqual(settler.get_summary()["click"]["timeouts"], 0)
+
+    async def test_a_pending_request_holds_the_page_until_the_timeout(self):
+        settler = self.settler(timeout_ms=100)
+        self.context.emit("request", FakeRequest())
+        await settler.wait(FakePage(), "click")
+        self.assertEqual(settler.get_summary()["click"]["timeouts"], 1)
+
+    async def test_the_page_settles_once_the_request_finishes(self):
+        settler = self.settler(timeout_ms=2000)
+        request = FakeRequest()
+        self.context.emit("request", request)
+        asyncio.get_running_loop().call_later(0.05, self.context.emit, "requestfinished", request)
+        elapsed_ms = await settler.wait(FakePage(), "click")
+        # 完了後も quiet_ms だけネットワークが静かになるのを待つ
+        self.assertGreaterEqual(elapsed_ms, 50 + 20)
+        self.assertEqual(settler.get_summary()["click"]["timeouts"], 0)
+
+    async def test_never_ending_connections_are_not_counted(self):
+        settler = self.settler()
+        for resource_type in ("websocket", "eventsource", "ping"):
+            self.context.emit("request", FakeRequest(resource_type))
+        await asyncio.sleep(0.03)
+        await settler.wait(FakePage(), "click")
+        self.assertEqual(settler.get_summary()["click"]["timeouts"], 0)
+
+    async def test_stale_requests_are_forgotten(self):
+        settler = self.settler(stale_ms=50, timeout_ms=2000)
+        self.context.emit("request", FakeRequest("xhr"))
+        await settler.wait(FakePage(), "click")
+        self.assertEqual(settler.get_summary()["click"]["timeouts"], 0)
+        self.assertEqual(settler._inflight, {})
+
+    async def test_max_inflight_tolerates_that_many_pending_requests(self):
+        settler = self.settler(max_inflight=1)
+        self.context.emit("request", FakeRequest())
+        await asyncio.sleep(0.03)
+        await settler.wait(FakePage(), "one")
+        self.context.emit("request", FakeRequest())
+        await asyncio.sleep(0.03)
+        await settler.wait(FakePage(), "two")
+        summary = settler.get_summary()
+        self.assertEqual((summary["one"]["timeouts"], summary["two"]["timeouts"]), (0, 1))
+
+    async def test_dom_mutations_hold_the_page(self):
+        settler = self.settler(timeout_ms=100)
+        await asyncio.sleep(0.03)
+        await settler.wait(FakePage(quiet_ms=5), "type")
+        self.assertEqual(settler.get_summary()["type"]["timeouts"], 1)
+
+    async def test_the_script_is_injected_into_documents_that_predate_it(self):
+        settler = self.settler(timeout_ms=50)
+        page = FakePage(quiet_ms=None)
+        await settler.wait(page, "goto")
+        self.assertTrue(page.scripts)
+
+    async def test_timeout_override(self):
+        settler = self.settler()
+        self.context.emit("request", FakeRequest())
+        start = time.perf_counter()
+        await settler.wait(FakePage(), "wait", timeout_ms=30)
+        self.assertLess(time.perf_counter() - start, 0.25)
+
+    def test_detach_removes_the_listeners(self):
+        settler = self.settler()
+        settler.detach(self.context)
+        self.assertEqual(self.context.listeners, {"request": [], "requestfinished": [], "requestfailed": []})
+        self.context.emit("request", FakeRequest())
+        self.assertEqual(settler._inflight, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
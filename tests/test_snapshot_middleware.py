@@ -0,0 +1,125 @@
+import json
+import unittest
+
+try:
+    from snapshot_middleware import PRUNED_SNAPSHOT, SnapshotMiddleware, _prune_result, snapshot_diff, trim_snapshot
+except ImportError:
+    SnapshotMiddleware = None
+
+from usage import estimate_text_tokens
+
+
+def page_snapshot(items, footer=()):
+    lines = ["- banner:", "  - heading \"Shop\" [ref=e1]", "- main:"]
+    lines += [f"  - link \"{item}\" [ref=e{n + 2}]" for n, item in enumerate(items)]
+    if footer:
+        lines.append("- contentinfo:")
+        lines += [f"  - text: {text}" for text in footer]
+    return "\n".join(lines)
+
+
+def tool_result(snapshot, url="https://example.com/"):
+    return f"### Page state\n- Page URL: {url}\n- Page Title: Shop\n- Page Snapshot:\n```yaml\n{snapshot}\n```"
+
+
+@unittest.skipIf(SnapshotMiddleware is None, "autogen is not installed")
+class TrimSnapshotTest(unittest.TestCase):
+    def test_a_snapshot_within_the_budget_is_kept(self):
+        snapshot = page_snapshot(["a", "b"], footer=["Copyright"])
+        self.assertIs(trim_snapshot(snapshot, 1000), snapshot)
+
+    def test_footer_landmarks_are_dropped_first(self):
+        snapshot = page_snapshot(["a", "b"], footer=["Copyright " * 40, "Terms"])
+        trimmed = trim_snapshot(snapshot, estimate_text_tokens(page_snapshot(["a", "b"])) + 10)
+        self.assertEqual(trimmed, page_snapshot(["a", "b"]))
+
+    def test_long_lines_are_shortened(self):
+        trimmed = trim_snapshot(page_snapshot(["x" * 1000]), 100)
+        self.assertTrue(all(len(line) <= 201 for line in trimmed.split("\n")))
+        self.assertTrue(trimmed.endswith("…"))
+
+    def test_the_tail_is_cut_with_a_note(self):
+        trimmed = trim_snapshot(page_snapshot([f"item {n}" for n in range(200)]), 100)
+        self.assertLessEqual(estimate_text_tokens(trimmed), 120)
+        self.assertIn("行省略", trimmed.split("\n")[-1])
+        self.assertTrue(trimmed.startswith("- banner:"))
+
+
+@unittest.skipIf(SnapshotMiddleware is None, "autogen is not installed")
+class SnapshotDiffTest(unittest.TestCase):
+    def test_only_changed_lines_and_one_line_of_context_are_kept(self):
+        items = [f"item {n}" for n in range(20)]
+        changed = list(items)
+        changed[10] = "item ten"
+        diff = snapshot_diff(page_snapshot(items), page_snapshot(changed)).split("\n")
+        self.assertEqual([line[0] for line in diff[1:]], [" ", "-", "+", " "])
+        self.assertTrue(diff[0].startswith("@@"))
+
+    def test_identical_snapshots_have_an_empty_diff(self):
+        self.assertEqual(snapshot_diff(page_snapshot(["a"]), page_snapshot(["a"])), "")
+
+
+@unittest.skipIf(SnapshotMiddleware is None, "autogen is not installed")
+class SnapshotMiddlewareTest(unittest.TestCase):
+    def setUp(self):
+        self.items = [f"item {n}" for n in range(50)]
+
+    def test_a_small_change_on_the_same_page_is_sent_as_a_diff(self):
+        middleware = SnapshotMiddleware()
+        middleware.process_text("browser_click", tool_result(page_snapshot(self.items)))
+        changed = list(self.items)
+        changed[3] = "item three"
+        text = middleware.process_text("browser_click", tool_result(page_snapshot(changed)))
+        self.assertIn("- Page Snapshot (diff):", text)
+        self.assertIn("+  - link \"item three\"", text)
+        self.assertEqual(middleware.diffs, 1)
+        summary = middleware.get_summary()
+        self.assertGreater(summary["result_tokens_saved"], 0)
+
+    def test_an_unchanged_page_is_reported_as_such(self):
+        middleware = SnapshotMiddleware()
+        middleware.process_text("browser_click", tool_result(page_snapshot(self.items)))
+        text = middleware.process_text("browser_click", tool_result(page_snapshot(self.items)))
+        self.assertIn("(変更なし)", text)
+
+    def test_a_new_url_gets_a_full_snapshot(self):
+        middleware = SnapshotMiddleware()
+        middleware.process_text("browser_click", tool_result(page_snapshot(self.items)))
+        text = middleware.process_text("browser_click", tool_result(page_snapshot(self.items), "https://example.com/2"))
+        self.assertIn("```yaml", text)
+        self.assertEqual(middleware.diffs, 0)
+
+    def test_a_large_change_gets_a_full_snapshot(self):
+        middleware = SnapshotMiddleware()
+        middleware.process_text("browser_click", tool_result(page_snapshot(self.items)))
+        text = middleware.process_text("browser_click", tool_result(page_snapshot([f"other {n}" for n in range(50)])))
+        self.assertNotIn("(diff)", text)
+
+    def test_explicit_snapshots_are_neither_trimmed_nor_diffed(self):
+        middleware = SnapshotMiddleware(token_budget=50)
+        result = tool_result(page_snapshot(self.items))
+        middleware.process_text("browser_click", result)
+        self.assertEqual(middleware.trims, 1)
+        self.assertEqual(middleware.process_text("browser_snapshot", result), result)
+        self.assertEqual((middleware.trims, middleware.diffs), (1, 0))
+
+
+@unittest.skipIf(SnapshotMiddleware is None, "autogen is not installed")
+class PruneResultTest(unittest.TestCase):
+    def test_old_snapshots_are_replaced_with_a_note(self):
+        pruned = _prune_result(tool_result(page_snapshot(["a"])), keep=False)
+        self.assertIn(PRUNED_SNAPSHOT, pruned)
+        self.assertIn("- Page URL: https://example.com/", pruned)
+        self.assertNotIn("```yaml", pruned)
+
+    def test_snapshots_inside_serialized_adapter_results_are_pruned(self):
+        content = json.dumps([{"type": "text", "text": tool_result(page_snapshot(["a"]))}])
+        self.assertIn(PRUNED_SNAPSHOT, json.loads(_prune_result(content, keep=False))[0]["text"])
+
+    def test_kept_results_are_unchanged(self):
+        content = tool_result(page_snapshot(["a"]))
+        self.assertIs(_prune_result(content, keep=True), content)
+
+
+if __name__ == "__main__":
+    unittest.main()
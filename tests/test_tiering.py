@@ -0,0 +1,91 @@
+import contextlib
+import io
+import unittest
+
+from tiering import ModelTiering, is_error_page
+
+
+def tiering(**kwargs):
+    return ModelTiering("gpt-4.1-mini", "gpt-4.1", **kwargs)
+
+
+def observe(model_tiering, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return model_tiering.observe(**kwargs)
+
+
+class ModelTieringTest(unittest.TestCase):
+    def test_clean_steps_stay_on_the_fast_model(self):
+        model_tiering = tiering()
+        for n in range(5):
+            self.assertEqual(model_tiering.select(), "gpt-4.1-mini")
+            self.assertEqual(observe(model_tiering, action=f"click {n}"), [])
+        self.assertEqual(model_tiering.escalations, 0)
+
+    def test_a_failure_holds_the_strong_model_for_hold_steps(self):
+        model_tiering = tiering(hold_steps=2)
+        self.assertEqual(observe(model_tiering, changed=False), ["no_change"])
+        self.assertEqual(model_tiering.select(), "gpt-4.1")
+        observe(model_tiering)
+        self.assertEqual(model_tiering.select(), "gpt-4.1")
+        observe(model_tiering)
+        self.assertEqual(model_tiering.select(), "gpt-4.1-mini")
+
+    def test_a_failure_during_the_hold_restarts_it_without_a_new_escalation(self):
+        model_tiering = tiering(hold_steps=2)
+        observe(model_tiering, error_page=True)
+        observe(model_tiering)
+        observe(model_tiering, action_error=True)
+        self.assertEqual(model_tiering.hold, 2)
+        self.assertEqual(model_tiering.escalations, 1)
+        self.assertEqual((model_tiering.signals["error_page"], model_tiering.signals["action_error"]), (1, 1))
+
+    def test_repeating_an_action_up_to_repeat_limit_escalates(self):
+        model_tiering = tiering(repeat_limit=3)
+        self.assertEqual(observe(model_tiering, action="scroll"), [])
+        self.assertEqual(observe(model_tiering, action="scroll"), [])
+        self.assertEqual(observe(model_tiering, action="scroll"), ["repeated_action"])
+        # 別のアクションで回数は数え直す
+        self.assertEqual(observe(model_tiering, action="click"), [])
+        self.assertEqual(observe(model_tiering, action="scroll"), [])
+
+    def test_steps_without_an_action_keep_the_repeat_count(self):
+        model_tiering = tiering(repeat_limit=2)
+        observe(model_tiering, action="scroll")
+        observe(model_tiering)
+        self.assertEqual(observe(model_tiering, action="scroll"), ["repeated_action"])
+
+    def test_several_signals_in_one_step_are_all_counted(self):
+        model_tiering = tiering()
+        found = observe(model_tiering, changed=False, confirmation=True)
+        self.assertEqual(found, ["no_change", "confirmation"])
+        self.assertEqual(model_tiering.escalations, 1)
+
+    def test_calls_are_summarized_per_tier(self):
+        model_tiering = tiering()
+        model_tiering.record("gpt-4.1-mini", 100, 1000, 50)
+        model_tiering.record("gpt-4.1-mini", 300, 1000, 50)
+        model_tiering.record("gpt-4.1", 900, 2000, None)
+        summary = model_tiering.get_summary()
+        self.assertEqual(summary["tiers"]["fast"]["calls"], 2)
+        self.assertEqual(summary["tiers"]["fast"]["input_tokens"], 2000)
+        self.assertEqual(summary["tiers"]["strong"]["output_tokens"], 0)
+        self.assertEqual(summary["tiers"]["strong"]["total_ms"], 900)
+
+    def test_one_deployment_for_both_tiers_counts_as_strong(self):
+        self.assertEqual(ModelTiering("gpt-4.1", "gpt-4.1").tier_of("gpt-4.1"), "strong")
+
+
+class ErrorPageTest(unittest.TestCase):
+    def test_browser_error_urls(self):
+        self.assertTrue(is_error_page("chrome-error://chromewebdata/", ""))
+
+    def test_titles(self):
+        self.assertTrue(is_error_page("https://example.com/x", "404 Not Found"))
+        self.assertTrue(is_error_page("https://example.com/x", "ページが見つかりません"))
+        self.assertFalse(is_error_page("https://example.com/", "東京の天気"))
+        self.assertFalse(is_error_page("https://example.com/", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tracing import SpanRecorder
+
+
+def recorded(task_id):
+    recorder = SpanRecorder(task_id, "computer_use")
+    with recorder.span("screenshot", bytes=100):
+        pass
+    return recorder
+
+
+class SpanRecorderExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_chrome_trace_keeps_the_spans_of_earlier_tasks(self):
+        path = os.path.join(self.directory.name, "trace.json")
+        for task_id in ("a", "b", "c"):
+            recorded(task_id).export(path)
+        with open(path, encoding="utf-8") as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual([event["tid"] for event in events], ["a", "b", "c"])
+        self.assertEqual(events[0]["args"], {"bytes": 100})
+
+    def test_jsonl_appends_one_span_per_line(self):
+        path = os.path.join(self.directory.name, "spans.jsonl")
+        recorded("a").export(path)
+        recorded("b").export(path)
+        with open(path, encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([span["task"] for span in spans], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
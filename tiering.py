@@ -0,0 +1,117 @@
+import re
+
+from tracing import percentile
+
+TIERS = ("fast", "strong")
+SIGNALS = ("no_change", "repeated_action", "error_page", "confirmation", "action_error")
+# タイトルが明らかにエラーページのもの (本文の数字に反応しないよう、タイトルと URL だけを見る)
+ERROR_TITLE_PATTERN = re.compile(
+    r"\b(?:403|404|500|502|503|504)\b|not found|forbidden|internal server error|bad gateway|"
+    r"service unavailable|access denied|見つかりません|エラーが発生",
+    re.IGNORECASE,
+)
+ERROR_URL_PREFIXES = ("chrome-error://", "about:neterror")
+
+
+def is_error_page(url=None, title=None):
+    """True if the URL or title looks like a browser or HTTP error page.
+
+    >>> is_error_page("https://example.com/x", "404 Not Found")
+    True
+    >>> is_error_page("https://example.com/", "東京の天気")
+    False
+    """
+    if url and url.startswith(ERROR_URL_PREFIXES):
+        return True
+    return bool(title and ERROR_TITLE_PATTERN.search(title))
+
+
+class ModelTiering:
+    """Send routine steps to a fast deployment and hard ones to the strong one.
+
+    Call ``select()`` before each model call and ``observe()`` with what the
+    previous step did. Any failure signal (no visible change, the same
+    action repeated, an error page, a confirmation request, a failed action)
+    moves the next ``hold_steps`` calls to the strong model; clean steps
+    count the hold down and return to the fast model.
+    """
+
+    def __init__(self, fast_model, strong_model, hold_steps=2, repeat_limit=2):
+        self.models = {"fast": fast_model, "strong": strong_model}
+        self.hold_steps = hold_steps
+        self.repeat_limit = repeat_limit
+        self.hold = 0
+        self._last_action = None
+        self._repeats = 0
+        self.signals = {signal: 0 for signal in SIGNALS}
+        self.escalations = 0
+        self.calls = {tier: [] for tier in TIERS}  # (latency_ms, input_tokens, output_tokens)
+
+    @property
+    def tier(self):
+        return "strong" if self.hold > 0 else "fast"
+
+    def select(self):
+        """Deployment for the next model call."""
+        return self.models[self.tier]
+
+    def tier_of(self, model):
+        return "fast" if model == self.models["fast"] and model != self.models["strong"] else "strong"
+
+    def observe(self, changed=True, action=None, error_page=False, confirmation=False, action_error=False):
+        """Feed the outcome of the last step; returns the failure signals found."""
+        if action is not None:
+            self._repeats = self._repeats + 1 if action == self._last_action else 1
+            self._last_action = action
+        found = [signal for signal, fired in (
+            ("no_change", not changed),
+            ("repeated_action", action is not None and self._repeats >= self.repeat_limit),
+            ("error_page", error_page),
+            ("confirmation", confirmation),
+            ("action_error", action_error),
+        ) if fired]
+        for signal in found:
+            self.signals[signal] += 1
+        if found:
+            if self.hold == 0:
+                self.escalations += 1
+                print(f"\t大きいモデルに切り替えます ({', '.join(found)})")
+            self.hold = self.hold_steps
+        elif self.hold > 0:
+            self.hold -= 1
+        return found
+
+    def record(self, model, latency_ms, input_tokens=0, output_tokens=0):
+        self.calls[self.tier_of(model)].append((latency_ms, input_tokens or 0, output_tokens or 0))
+
+    def get_summary(self):
+        tiers = {}
+        for tier, calls in self.calls.items():
+            latencies = [latency for latency, _, _ in calls]
+            tiers[tier] = {
+                "model": self.models[tier],
+                "calls": len(calls),
+                "input_tokens": sum(entry[1] for entry in calls),
+                "output_tokens": sum(entry[2] for entry in calls),
+                "total_ms": sum(latencies),
+                "p50_ms": percentile(latencies, 0.5) if latencies else 0.0,
+                "p95_ms": percentile(latencies, 0.95) if latencies else 0.0,
+            }
+        latencies = [latency for calls in self.calls.values() for latency, _, _ in calls]
+        return {
+            "tiers": tiers,
+            "escalations": self.escalations,
+            "signals": self.signals,
+            "p50_ms": percentile(latencies, 0.5) if latencies else 0.0,
+        }
+
+
+def print_tiering_summary(summary):
+    print(f"モデル階層: 大きいモデルへの切り替え {summary['escalations']}回, 全体の中央値 {summary['p50_ms']:.0f}ms")
+    for tier, stats in summary["tiers"].items():
+        if stats["calls"]:
+            print(f"  - {tier} ({stats['model']}): {stats['calls']}回, 中央値 {stats['p50_ms']:.0f}ms, "
+                  f"p95 {stats['p95_ms']:.0f}ms, トークン 入力 {stats['input_tokens']} / 出力 {stats['output_tokens']}")
+    fired = {signal: count for signal, count in summary["signals"].items() if count}
+    if fired:
+        print("  - シグナル: " + ", ".join(f"{signal} {count}回" for signal, count in fired.items()))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+
+REDACTED_KEYS = {"type": "text"}  # アクションの種類 -> トレースに残さない引数 (入力した文字列はパスワードのことがある)
+
+
+@dataclass
+class TraceStep:
+    """One executed action with the page state it was executed on."""
+    action: dict
+    url: str
+    fingerprint: str  # hex エンコードしたサムネイルのシグネチャ
+    scale: float = 1.0
+
+
+@dataclass
+class ActionTrace:
+    """Action sequence recorded from a run of a task.
+
+    ``completed`` is set only when the run finished cleanly; TraceCache keeps
+    nothing else. The text of ``type`` actions is not recorded and has to be
+    supplied again when the trace is replayed.
+    """
+    task: str
+    initial_url: str
+    steps: list = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    completed: bool = False
+
+    def add_step(self, action, url, fingerprint, scale=1.0):
+        self.steps.append(TraceStep(action=redact_action(action_to_dict(action)), url=url,
+                                    fingerprint=fingerprint.hex(), scale=scale))
+
+
+def action_to_dict(action):
+    """Convert a computer_call action (pydantic model or namespace) to a plain dict."""
+    if isinstance(action, dict):
+        return dict(action)
+    if hasattr(action, "model_dump"):
+        return action.model_dump(exclude_none=True)
+    return dict(vars(action))
+
+
+def redact_action(action):
+    """Drop the arguments listed in REDACTED_KEYS (e.g. typed text) from an action dict."""
+    key = REDACTED_KEYS.get(action.get("type"))
+    if key in action:
+        action = {**action, key: None}
+    return action
+
+
+def is_redacted(action):
+    key = REDACTED_KEYS.get(action.get("type"))
+    return key is not None and action.get(key) is None
+
+
+def normalize_task(task):
+    return " ".join(task.split())
+
+
+def trace_key(task, initial_url):
+    return hashlib.sha256(f"{normalize_task(task)}\n{initial_url}".encode("utf-8")).hexdigest()
+
+
+class TraceCache:
+    """On-disk store of action traces keyed by task and initial URL, with LRU eviction.
+
+    Each trace is one JSON file; file modification time is the recency used
+    for eviction and is refreshed on every hit. Only completed traces are
+    stored.
+    """
+
+    def __init__(self, directory=".trace_cache", max_entries=200):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.replayed_steps = 0
+        self.divergences = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, task, initial_url):
+        return os.path.join(self.directory, f"{trace_key(task, initial_url)}.json")
+
+    def get(self, task, initial_url):
+        path = self._path(task, initial_url)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if not data.get("completed"):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        data["steps"] = [TraceStep(**step) for step in data["steps"]]
+        return ActionTrace(**data)
+
+    def put(self, trace):
+        if not trace.completed or not trace.steps:
+            return
+        path = self._path(trace.task, trace.initial_url)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(trace), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".json")
+        ]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            os.remove(path)
+
+    def record_replay(self, replayed_steps, diverged):
+        self.replayed_steps += replayed_steps
+        if diverged:
+            self.divergences += 1
+
+    def get_summary(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "replayed_steps": self.replayed_steps,
+            "divergences": self.divergences,
+        }
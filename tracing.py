@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 実行中タスクのレコーダー。asyncio タスクごとにコンテキストがコピーされるので並列実行でも混ざらない
+_current_recorder = ContextVar("span_recorder", default=None)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class SpanRecorder:
+    """Collect timing spans for one task and export them as Chrome trace or JSONL.
+
+    Spans are kept as tuples in memory and written once at the end, so
+    recording costs two ``perf_counter`` calls and a list append.
+    """
+
+    def __init__(self, task_id="task", engine=None):
+        self.task_id = task_id
+        self.engine = engine
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._epoch_us = time.time() * 1_000_000
+
+    def add(self, kind, start, end, **attributes):
+        """Record a span from two ``time.perf_counter()`` readings."""
+        self.spans.append((kind, start, end, attributes))
+
+    @contextmanager
+    def span(self, kind, **attributes):
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.spans.append((kind, start, time.perf_counter(), attributes))
+
+    def _ts_us(self, value):
+        return self._epoch_us + (value - self._origin) * 1_000_000
+
+    def export(self, path):
+        """Add spans to ``path``: Chrome trace format for .json, one span per line otherwise.
+
+        Both formats keep what is already in the file, so every task of a
+        batch or benchmark can export to the same path.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".json"):
+            events = [{
+                "name": kind,
+                "cat": self.engine or "task",
+                "ph": "X",
+                "ts": self._ts_us(start),
+                "dur": (end - start) * 1_000_000,
+                "pid": os.getpid(),
+                "tid": self.task_id,
+                "args": attributes,
+            } for kind, start, end, attributes in self.spans]
+            try:
+                with open(path, encoding="utf-8") as f:
+                    events = json.load(f)["traceEvents"] + events
+            except (OSError, ValueError, KeyError, TypeError):
+                pass  # 新しいファイル (または読めないファイル) は上書きする
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events}, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            for kind, start, end, attributes in self.spans:
+                f.write(json.dumps({
+                    "task": self.task_id,
+                    "engine": self.engine,
+                    "kind": kind,
+                    "start_us": self._ts_us(start),
+                    "duration_ms": (end - start) * 1000,
+                    **attributes,
+                }, ensure_ascii=False, default=str) + "\n")
+
+    def get_summary(self):
+        """Count, total, p50 and p95 (ms) per span kind."""
+        durations = {}
+        for kind, start, end, _ in self.spans:
+            durations.setdefault(kind, []).append((end - start) * 1000)
+        return {
+            kind: {
+                "count": len(values),
+                "total_ms": sum(values),
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+            }
+            for kind, values in sorted(durations.items())
+        }
+
+
+def set_recorder(recorder):
+    """Make ``recorder`` the target of ``span()`` in the current task; returns a reset token."""
+    return _current_recorder.set(recorder)
+
+
+def reset_recorder(token):
+    _current_recorder.reset(token)
+
+
+@contextmanager
+def span(kind, **attributes):
+    """Record a span on the current task's recorder, or do nothing when tracing is off."""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield attributes
+        return
+    with recorder.span(kind, **attributes) as span_attributes:
+        yield span_attributes
+
+
+def print_span_summary(summary):
+    """Print a span summary in the runners' log format."""
+    if not summary:
+        return
+    print("処理時間の内訳 (スパン別):")
+    for kind, stats in summary.items():
+        print(f"  - {kind}: {stats['count']}回, 合計 {stats['total_ms']:.0f}ms, "
+              f"p50 {stats['p50_ms']:.0f}ms, p95 {stats['p95_ms']:.0f}ms")
@@ -0,0 +1,180 @@
+import math
+import struct
+from dataclasses import asdict, dataclass
+
+# JPEG のフレームヘッダー (SOF) マーカー。C4 (DHT), C8 (予約), CC (DAC) は除く
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """Estimate the input tokens of one image with OpenAI's tile formula (85 + 170 per 512px tile)."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def image_size(content):
+    """(width, height) from the header of PNG, JPEG or WebP bytes, or None if it cannot be read."""
+    if content[:8] == b"\x89PNG\r\n\x1a\n" and len(content) >= 24:
+        return struct.unpack(">II", content[16:24])
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP" and len(content) >= 30:
+        chunk = content[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", content[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(content[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(content[24:27], "little") + 1, int.from_bytes(content[27:30], "little") + 1
+        return None
+    if content[:2] == b"\xff\xd8":
+        index = 2
+        while index + 9 <= len(content):
+            if content[index] != 0xFF:
+                index += 1
+                continue
+            marker = content[index + 1]
+            if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                index += 1 if marker == 0xFF else 2  # 埋め草・長さを持たないマーカー
+                continue
+            if marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack(">HH", content[index + 5:index + 9])
+                return width, height
+            index += 2 + struct.unpack(">H", content[index + 2:index + 4])[0]
+    return None
+
+
+def estimate_text_tokens(text):
+    """Rough token count of a text (about 4 UTF-8 bytes per token), for comparing sizes without a tokenizer."""
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+@dataclass
+class IterationUsage:
+    """Token usage of a single model call.
+
+    ``image_input_tokens`` is estimated for the images attached to this call;
+    ``text_input_tokens`` is the rest of the reported input, which also
+    covers conversation history carried over by the server.
+    """
+    iteration: int
+    model: str
+    input_tokens: int
+    cached_input_tokens: int
+    output_tokens: int
+    reasoning_tokens: int
+    images: int
+    image_input_tokens: int
+    text_input_tokens: int
+
+
+class UsageTracker:
+    """Token accounting from the usage objects returned by each API call.
+
+    All runners report the same schema through ``get_summary`` so engines can
+    be compared directly.
+    """
+
+    def __init__(self, engine, model=None):
+        self.engine = engine
+        self.model = model
+        self.iterations = []
+
+    def add(self, input_tokens, output_tokens, cached_input_tokens=0, reasoning_tokens=0, images=(), model=None,
+            image_input_tokens=None):
+        """Record one call. ``images`` is a sequence of (width, height) attached to the request.
+
+        ``image_input_tokens`` is the image share reported by the API; without
+        it the share is estimated from ``images``.
+        """
+        input_tokens = input_tokens or 0
+        if image_input_tokens is None:
+            image_input_tokens = sum(estimate_image_tokens(w, h) for w, h in images)
+        image_input_tokens = min(input_tokens, image_input_tokens)
+        entry = IterationUsage(
+            iteration=len(self.iterations) + 1,
+            model=model or self.model,
+            input_tokens=input_tokens,
+            cached_input_tokens=cached_input_tokens or 0,
+            output_tokens=output_tokens or 0,
+            reasoning_tokens=reasoning_tokens or 0,
+            images=len(images),
+            image_input_tokens=image_input_tokens,
+            text_input_tokens=input_tokens - image_input_tokens,
+        )
+        self.iterations.append(entry)
+        return entry
+
+    def add_response_usage(self, usage, images=(), model=None):
+        """Record the ``usage`` of a Responses API response."""
+        if usage is None:
+            return self.add(0, 0, images=images, model=model)
+        input_details = getattr(usage, "input_tokens_details", None)
+        output_details = getattr(usage, "output_tokens_details", None)
+        return self.add(
+            usage.input_tokens,
+            usage.output_tokens,
+            cached_input_tokens=getattr(input_details, "cached_tokens", 0),
+            reasoning_tokens=getattr(output_details, "reasoning_tokens", 0),
+            images=images,
+            model=model,
+        )
+
+    def add_chat_usage(self, usage, model=None, images=()):
+        """Record a chat-completions style usage (prompt/completion tokens).
+
+        browser-use reports ``prompt_image_tokens`` for providers that count
+        them; otherwise the image share is estimated from ``images``.
+        """
+        return self.add(
+            getattr(usage, "prompt_tokens", 0),
+            getattr(usage, "completion_tokens", 0),
+            cached_input_tokens=getattr(usage, "prompt_cached_tokens", 0),
+            images=images,
+            model=model,
+            image_input_tokens=getattr(usage, "prompt_image_tokens", None),
+        )
+
+    def get_summary(self):
+        totals = {
+            key: sum(getattr(entry, key) for entry in self.iterations)
+            for key in (
+                "input_tokens", "cached_input_tokens", "output_tokens", "reasoning_tokens",
+                "images", "image_input_tokens", "text_input_tokens",
+            )
+        }
+        models = {}
+        for entry in self.iterations:
+            stats = models.setdefault(entry.model, {"api_calls": 0, "input_tokens": 0, "output_tokens": 0})
+            stats["api_calls"] += 1
+            stats["input_tokens"] += entry.input_tokens
+            stats["output_tokens"] += entry.output_tokens
+        return {
+            "engine": self.engine,
+            "model": self.model,
+            "models": models,  # モデル (デプロイ) ごとの内訳。モデルの使い分けをしたときのコスト比較用
+            "api_calls": len(self.iterations),
+            "total_tokens": totals["input_tokens"] + totals["output_tokens"],
+            **totals,
+            "iterations": [asdict(entry) for entry in self.iterations],
+        }
+
+
+def print_usage_summary(summary):
+    """Print a usage summary in the runners' log format."""
+    print(f"合計消費トークン数: {summary['total_tokens']}")
+    print(f"  - 入力トークン: {summary['input_tokens']} (キャッシュ {summary['cached_input_tokens']})")
+    if summary["images"] or summary["image_input_tokens"]:
+        images = f" ({summary['images']}枚)" if summary["images"] else ""
+        print(f"    - 画像 (推定): {summary['image_input_tokens']}{images}")
+        print(f"    - テキスト・履歴: {summary['text_input_tokens']}")
+    print(f"  - 出力トークン: {summary['output_tokens']} (推論 {summary['reasoning_tokens']})")
+    print(f"API呼び出し回数: {summary['api_calls']}")
+    if len(summary.get("models") or {}) > 1:
+        for model, stats in summary["models"].items():
+            print(f"  - {model}: {stats['api_calls']}回, 入力 {stats['input_tokens']}, 出力 {stats['output_tokens']}")